@@ -1,22 +1,33 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-import uvicorn
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import os
+import re
 from datetime import datetime, timedelta
-from typing import Optional, List
+from typing import Optional
+from uuid import UUID
 import jwt
-from passlib.context import CryptContext
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from .database import get_db, engine
+from .database import get_async_db, async_engine, AsyncSessionLocal
+from .metrics import MetricsMiddleware, QueueCollector, instrument_engine, metrics_response_body, REGISTRY
 from . import models, schemas
 from .services.auth import AuthService
 from .services.prompt import PromptService
-from .workers.celery_app import celery_app
+from .services.dataset import DatasetService
+from .services.artifact import ArtifactService
+from .services.principal_cache import principal_cache
+from .services.job_events import job_event_hub, format_sse, TERMINAL_EVENTS
+from .services.prediction import prediction_service
+from .services.cluster_status import cluster_status
+from .ml_service.intent import intent_router
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+# The schema is managed by Alembic (migrations/); run `alembic upgrade head`
+# before starting the API, so importing this module never touches the database
 
 app = FastAPI(
     title="AutoML Pro API",
@@ -33,18 +44,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics: per-route latency and DB usage, queue depths read at scrape time
+app.add_middleware(MetricsMiddleware)
+instrument_engine(async_engine.sync_engine)
+REGISTRY.register(QueueCollector())
+
 # Security
 security = HTTPBearer()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # Services
 auth_service = AuthService()
 prompt_service = PromptService()
+dataset_service = DatasetService()
+artifact_service = ArtifactService()
 
 # Auth dependency
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         payload = jwt.decode(
@@ -52,25 +69,49 @@ async def get_current_user(
             os.getenv("SECRET_KEY", "your-secret-key"),
             algorithms=["HS256"]
         )
-        user_id: str = payload.get("sub")
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Could not validate credentials"
-            )
-    except jwt.PyJWTError:
+        user_id = UUID(payload.get("sub"))
+    except (jwt.PyJWTError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
     
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if user is None:
+    # Common case: principal already cached, no database round trip
+    principal = principal_cache.get(str(user_id))
+    if principal is None:
+        user = await db.get(models.User, user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        principal = schemas.User.model_validate(user)
+        if principal.is_active:
+            principal_cache.put(str(user_id), principal)
+    
+    if not principal.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
+            detail="Inactive user"
         )
-    return user
+    return principal
+
+@app.on_event("startup")
+async def start_background_listeners():
+    app.state.listeners = [
+        asyncio.create_task(principal_cache.listen()),
+        asyncio.create_task(job_event_hub.run()),
+        asyncio.create_task(warm_up_models()),
+    ]
+
+async def warm_up_models():
+    async with AsyncSessionLocal() as db:
+        await prediction_service.warm_up(db)
+
+@app.on_event("shutdown")
+async def stop_background_listeners():
+    for task in app.state.listeners:
+        task.cancel()
 
 @app.get("/")
 async def root():
@@ -82,70 +123,185 @@ async def health_check():
 
 # Auth routes
 @app.post("/api/auth/signup", response_model=schemas.AuthResponse)
-async def signup(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(user_data: schemas.UserCreate, db: AsyncSession = Depends(get_async_db)):
     return await auth_service.create_user(db, user_data)
 
 @app.post("/api/auth/login", response_model=schemas.AuthResponse)
-async def login(credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: schemas.UserLogin, db: AsyncSession = Depends(get_async_db)):
     return await auth_service.authenticate_user(db, credentials)
 
 @app.get("/api/auth/profile", response_model=schemas.User)
-async def get_profile(current_user: models.User = Depends(get_current_user)):
+async def get_profile(current_user: schemas.User = Depends(get_current_user)):
     return current_user
 
+@app.post("/api/auth/deactivate", response_model=schemas.User)
+async def deactivate_account(
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await auth_service.deactivate_user(db, current_user.id)
+
 @app.get("/auth/google")
 async def google_auth():
     # Redirect to Google OAuth
     # Implementation depends on your OAuth setup
     pass
 
+# Dataset routes
+@app.post("/api/datasets", response_model=schemas.Dataset, status_code=status.HTTP_201_CREATED)
+async def upload_dataset(
+    request: Request,
+    filename: Optional[str] = None,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Raw CSV/Parquet body (optionally chunked); streamed to disk, never buffered whole
+    return await dataset_service.upload(db, request, filename, current_user.id)
+
+@app.get("/api/datasets/{dataset_id}", response_model=schemas.Dataset)
+async def get_dataset(
+    dataset_id: UUID,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await dataset_service.get_dataset(db, dataset_id, current_user.id)
+
 # Prompt and job routes
 @app.post("/api/prompt", response_model=schemas.JobResponse)
 async def submit_prompt(
     prompt_data: schemas.PromptSubmission,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     return await prompt_service.submit_prompt(db, prompt_data, current_user.id)
 
-@app.get("/api/jobs", response_model=List[schemas.Job])
+@app.post("/api/prompts:batch", response_model=schemas.JobBatchResponse)
+async def submit_prompts(
+    batch: schemas.PromptBatchSubmission,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await prompt_service.submit_batch(db, batch, current_user.id)
+
+@app.post("/api/prompts/plan", response_model=schemas.PromptPlanResponse)
+async def plan_prompts(
+    request: schemas.PromptPlanRequest,
+    current_user: schemas.User = Depends(get_current_user)
+):
+    # Training plans without submitting anything; identical prompts are planned once
+    plans = await run_in_threadpool(intent_router.route_many, request.prompts)
+    return {"plans": [plan.to_dict() for plan in plans]}
+
+@app.get("/api/jobs", response_model=schemas.JobPage)
 async def get_user_jobs(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db),
-    skip: int = 0,
-    limit: int = 100
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await prompt_service.list_jobs(db, current_user.id, cursor, limit)
+
+@app.post("/api/jobs/{job_id}/cancel", response_model=schemas.Job)
+async def cancel_job(
+    job_id: UUID,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await prompt_service.cancel_job(db, job_id, current_user.id)
+
+@app.post("/api/jobs/{job_id}/retrain", response_model=schemas.JobResponse)
+async def retrain_job(
+    job_id: UUID,
+    request: schemas.RetrainRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    jobs = db.query(models.PromptJob).filter(
-        models.PromptJob.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return jobs
+    return await prompt_service.retrain_job(db, job_id, request, current_user.id)
 
 @app.get("/api/status/{job_id}", response_model=schemas.JobStatus)
 async def get_job_status(
-    job_id: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    job = db.query(models.PromptJob).filter(
-        models.PromptJob.id == job_id,
-        models.PromptJob.user_id == current_user.id
-    ).first()
+    job_id: UUID,
+    after_seq: Optional[int] = Query(None, ge=0),
+    limit: int = Query(200, ge=1, le=1000),
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    job = await prompt_service.get_job_status(db, job_id, current_user.id)
+    
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
     
+    # Without after_seq, only the tail of the log is returned
+    log_events = await prompt_service.get_job_logs(db, job_id, after_seq, limit)
+    return schemas.JobStatus.from_job(job, log_events)
+
+@app.post("/api/status:batch", response_model=schemas.JobStatusBatchResponse)
+async def get_job_statuses(
+    request: schemas.JobStatusBatchRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Status fields only; logs stay on the per-job endpoint
+    return await prompt_service.get_job_states(db, request.job_ids, current_user.id)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(
+    job_id: UUID,
+    request: Request,
+    last_event_id: Optional[str] = None,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Server-sent events for one job's stages and progress, pushed from the
+    worker through Redis. A new stream starts with a snapshot of the job
+    followed by events newer than it; reconnecting clients resume after
+    Last-Event-ID. Streams of finished jobs end once caught up.
+    """
+    last_event_id = request.headers.get("last-event-id") or last_event_id
+    if last_event_id and not re.fullmatch(r"\d+-\d+", last_event_id):
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+    # Read before the job row, so events the snapshot may have missed are still sent
+    resume_from = last_event_id or await job_event_hub.last_event_id(str(job_id))
+
+    job = await prompt_service.get_job_status(db, job_id, current_user.id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
+    snapshot = {"type": "snapshot", "job_id": str(job.id), "status": job.status, "progress": job.progress}
+    if resume_from:
+        snapshot["id"] = resume_from
+    finished = job.status in TERMINAL_EVENTS
+    # Don't hold a pooled connection for the lifetime of the stream
+    await db.close()
+
+    async def events():
+        if not last_event_id:
+            yield format_sse(snapshot)
+            if finished:
+                return
+        ended = False
+        async for event in job_event_hub.subscribe(str(job_id), resume_from, live=not finished):
+            if await request.is_disconnected():
+                return
+            ended = event["type"] in TERMINAL_EVENTS
+            yield format_sse(event)
+        if finished and not ended:
+            # The stored events expired before the client came back
+            yield format_sse(snapshot)
     
-    return job
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @app.get("/api/result/{job_id}", response_model=schemas.JobResult)
 async def get_job_result(
-    job_id: str,
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    job = db.query(models.PromptJob).filter(
-        models.PromptJob.id == job_id,
-        models.PromptJob.user_id == current_user.id
-    ).first()
+    job_id: UUID,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    job, result = await prompt_service.get_job_result(db, job_id, current_user.id)
     
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
@@ -153,23 +309,77 @@ async def get_job_result(
     if job.status != "completed":
         raise HTTPException(status_code=400, detail="Job not completed yet")
     
-    result = db.query(models.JobResult).filter(
-        models.JobResult.job_id == job_id
-    ).first()
-    
     if not result:
         raise HTTPException(status_code=404, detail="Result not found")
     
-    return result
+    return schemas.JobResult.from_job(job, result)
+
+# Prediction serving routes
+@app.post("/api/models/{job_id}/predict", response_model=schemas.PredictionResponse)
+async def predict(
+    job_id: UUID,
+    request: schemas.PredictionRequest,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    model_key = await prediction_service.resolve(db, job_id, current_user.id)
+    # Release the connection before queueing for a batch
+    await db.close()
+    if model_key is None:
+        raise HTTPException(status_code=404, detail="No servable model for this job")
+    try:
+        predictions = await prediction_service.predict(model_key, request.instances)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"predictions": predictions}
+
+@app.get("/api/models/{job_id}/download")
+async def download_model(
+    job_id: UUID,
+    request: Request,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    job, result = await prompt_service.get_job_result(db, job_id, current_user.id)
+    # Release the connection before a potentially long transfer
+    await db.close()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not result or not result.model_key:
+        raise HTTPException(status_code=404, detail="No model artifact for this job")
+    # Compiled models are served from model_key; downloads get the estimator
+    key = result.estimator_key or result.model_key
+    return await artifact_service.download(request, key, f"model-{job_id}.joblib")
+
+@app.get("/api/models/{job_id}/stats")
+async def model_stats(
+    job_id: UUID,
+    current_user: schemas.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    model_key = await prediction_service.resolve(db, job_id, current_user.id)
+    if model_key is None:
+        raise HTTPException(status_code=404, detail="No servable model for this job")
+    return prediction_service.stats(model_key)
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # The queue collector makes blocking Redis calls
+    body = await run_in_threadpool(metrics_response_body)
+    return Response(body, media_type=CONTENT_TYPE_LATEST)
 
 # Celery monitoring routes
 @app.get("/api/celery/status")
 async def celery_status():
-    i = celery_app.inspect()
-    stats = i.stats()
-    return {"celery_status": "active" if stats else "inactive", "workers": stats}
+    # Snapshot refreshed by a beat task (ml_tasks.refresh_cluster_status), not a broadcast per request
+    snapshot = await run_in_threadpool(cluster_status.snapshot)
+    if snapshot is None:
+        return {"celery_status": "unknown", "workers": None}
+    return snapshot
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
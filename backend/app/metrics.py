@@ -0,0 +1,158 @@
+"""
+Prometheus metrics for the API and the Celery workers.
+
+The API serves its registry on /metrics. Workers observe training metrics in
+their task threads or prefork children and serve them on WORKER_METRICS_PORT
+(see workers/celery_app.py); prefork children need PROMETHEUS_MULTIPROC_DIR,
+where they write shared files the worker's main process aggregates.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+REQUEST_LATENCY = Histogram(
+    "automl_http_request_duration_seconds",
+    "Time from request to response start, by route template",
+    ["method", "route", "status"],
+)
+REQUEST_DB_QUERIES = Histogram(
+    "automl_http_request_db_queries",
+    "Database statements executed per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+REQUEST_DB_SECONDS = Histogram(
+    "automl_http_request_db_seconds",
+    "Time spent in database statements per request",
+    ["route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+QUEUE_WAIT = Histogram(
+    "automl_job_queue_wait_seconds",
+    "Time from queueing a job to a worker starting it",
+    ["lane"],
+    buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600),
+)
+STAGE_DURATION = Histogram(
+    "automl_training_stage_duration_seconds",
+    "Duration of each training pipeline stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+ADMISSION_REJECTED = Counter(
+    "automl_admission_rejected_total",
+    "Submissions turned away with 429, by reason (user: rate limit, queue: queue full)",
+    ["reason"],
+)
+JOBS_FINISHED = Counter(
+    "automl_jobs_finished_total",
+    "Jobs that left the worker, by outcome",
+    ["status"],
+)
+
+# (statement count, seconds) for the request being handled
+_request_db: ContextVar[Optional[list]] = ContextVar("request_db", default=None)
+
+
+def instrument_engine(engine):
+    """Attribute every statement run on `engine` to the current request, if any."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counters = _request_db.get()
+        if counters is not None:
+            counters[0] += 1
+            counters[1] += time.perf_counter() - context._metrics_start
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing per-route latency and DB usage. Latency stops
+    at response start so long-lived streams (SSE, downloads) don't skew it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        counters = [0, 0.0]
+        token = _request_db.set(counters)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                REQUEST_LATENCY.labels(scope["method"], route_of(scope), status_code).observe(time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_db.reset(token)
+            route = route_of(scope)
+            REQUEST_DB_QUERIES.labels(route).observe(counters[0])
+            REQUEST_DB_SECONDS.labels(route).observe(counters[1])
+
+
+def route_of(scope) -> str:
+    """Route template (/api/status/{job_id}) rather than the raw path, to bound label values."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class QueueCollector:
+    """Queue depths read from Redis at scrape time."""
+
+    def collect(self):
+        from .services.fair_queue import fair_queue, LANES, lane_queue
+
+        waiting = GaugeMetricFamily("automl_queue_jobs_waiting", "Jobs waiting in the fair queue", labels=["lane"])
+        tokens = GaugeMetricFamily("automl_celery_queue_length", "Messages waiting in the Celery broker queue", labels=["queue"])
+        try:
+            for lane in LANES:
+                waiting.add_metric([lane], fair_queue.depth(lane))
+                tokens.add_metric([lane_queue(lane)], fair_queue.client.llen(lane_queue(lane)))
+        except Exception:
+            # Scrapes must not fail because Redis is down
+            return []
+        return [waiting, tokens]
+
+
+def metrics_response_body(registry: CollectorRegistry = REGISTRY) -> bytes:
+    return generate_latest(registry)
+
+
+def worker_registry() -> CollectorRegistry:
+    """
+    What a worker serves: its own metrics with --pool=threads, or in
+    multiprocess mode the aggregate of every prefork child's.
+    """
+    from prometheus_client import multiprocess
+
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
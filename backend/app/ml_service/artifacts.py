@@ -0,0 +1,130 @@
+import hashlib
+import os
+import uuid
+from typing import BinaryIO, Dict, Optional, Type
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.getcwd(), "data", "artifacts"))
+ARTIFACT_BACKEND = os.getenv("ARTIFACT_BACKEND", "local")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+class ArtifactNotFound(FileNotFoundError):
+    pass
+
+
+class LocalArtifactBackend:
+    """
+    Artifacts as files under `root`, fanned out by the first two hex digits
+    of their key. Other backends (object storage, ...) implement the same
+    methods; `local_path` is where they would download to a local cache.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def staging_path(self) -> str:
+        staging = os.path.join(self.root, "staging")
+        os.makedirs(staging, exist_ok=True)
+        return os.path.join(staging, uuid.uuid4().hex)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def put(self, staging_path: str, key: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(staging_path, path)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def size(self, key: str) -> int:
+        try:
+            return os.path.getsize(self._path(key))
+        except FileNotFoundError:
+            raise ArtifactNotFound(key)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise ArtifactNotFound(key)
+
+    def local_path(self, key: str) -> str:
+        path = self._path(key)
+        if not os.path.exists(path):
+            raise ArtifactNotFound(key)
+        return path
+
+
+BACKENDS: Dict[str, Type] = {"local": LocalArtifactBackend}
+
+
+class ArtifactStore:
+    """
+    Content-addressed store of trained model artifacts.
+
+    Objects are written with joblib, uncompressed, so their numpy arrays can
+    be memory-mapped on load instead of read into every serving process.
+    The key is the sha256 of the file; saving an identical artifact twice
+    keeps one copy. A caller that can name the content without writing it
+    out (a fan-out's feature matrix, by dataset and transform) passes its
+    own key instead.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or BACKENDS[ARTIFACT_BACKEND]()
+
+    def save(self, obj, key: Optional[str] = None) -> tuple:
+        """
+        Persist `obj`; returns (key, size in bytes). With `key`, which must
+        identify the content, nothing is written if that key is stored.
+        """
+        import joblib
+
+        if key is not None and self.backend.exists(key):
+            return key, self.backend.size(key)
+        staging = self.backend.staging_path()
+        try:
+            joblib.dump(obj, staging)
+            if key is None:
+                digest = hashlib.sha256()
+                with open(staging, "rb") as f:
+                    for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                        digest.update(chunk)
+                key = digest.hexdigest()
+            size = os.path.getsize(staging)
+            if not self.backend.exists(key):
+                self.backend.put(staging, key)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+        return key, size
+
+    def load(self, key: str, mmap: bool = True):
+        import joblib
+
+        return joblib.load(self.backend.local_path(key), mmap_mode="r" if mmap else None)
+
+    def exists(self, key: str) -> bool:
+        return self.backend.exists(key)
+
+    def delete(self, key: str):
+        """Remove an artifact; only for ones no job result refers to (keys are shared by content)."""
+        self.backend.delete(key)
+
+    def size(self, key: str) -> int:
+        return self.backend.size(key)
+
+    def open(self, key: str) -> BinaryIO:
+        return self.backend.open(key)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,234 @@
+"""
+Tree ensembles compiled to flat arrays for serving.
+
+A fitted Random Forest or HistGradientBoosting model is an object graph of
+one estimator per tree, each predicted in turn. Compiled, every node of
+every tree sits in a handful of contiguous arrays (feature, threshold,
+children, missing-value direction, leaf values). A batch is then evaluated
+for all trees at once: each row's position in each tree advances one level
+per step, and leaves the batch once it reaches a leaf.
+
+The arrays are plain numpy, so the artifact store memory-maps them and a
+compiled model loads in the time it takes to unpickle a few arrays.
+Predictions match the estimator's; the estimator itself is kept elsewhere
+for retraining (see JobResult.estimator_key).
+"""
+import os
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+# Rows evaluated per step; bounds the (rows x trees) position matrix
+COMPILED_BATCH_ROWS = int(os.getenv("ML_COMPILED_BATCH_ROWS", "4096"))
+# Levels between checks for (row, tree) pairs that reached a leaf
+COMPACT_EVERY = 3
+
+
+class CompiledEnsemble:
+    """
+    Regression ensemble over flat node arrays. Tree t's root is node
+    roots[t]; node i's children are children[i] (left, right), and a leaf's
+    both point back to it.
+
+    kind is "forest" (prediction is the mean of leaf values) or "boosting"
+    (the sum of leaf values plus a baseline, through `link`).
+    """
+
+    def __init__(self, kind: str, feature, threshold, children, missing_left, is_leaf, value,
+                 roots, depth: int, n_features: int, input_dtype, baseline=None, n_outputs: int = 1,
+                 link: str = "identity"):
+        self.kind = kind
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_left = missing_left
+        self.is_leaf = is_leaf
+        self.value = value
+        self.roots = roots
+        self.depth = depth
+        self.n_features_in_ = n_features
+        self.input_dtype = np.dtype(input_dtype)
+        self.baseline = baseline
+        self.n_outputs = n_outputs
+        self.link = link
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.children,
+                                      self.missing_left, self.is_leaf, self.value, self.roots))
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        """Leaf index of every row in every tree, shape (rows, trees)."""
+        # The estimators compare in these dtypes (float32 for forests), so splits land the same way
+        X = np.ascontiguousarray(X, dtype=self.input_dtype)
+        n_rows, n_trees = len(X), self.n_trees
+        leaves = np.tile(self.roots, n_rows)
+        # The (row, tree) pairs still descending: where each is, and its row's offset into X
+        position = np.arange(n_rows * n_trees)
+        nodes = leaves.copy()
+        offsets = np.repeat(np.arange(n_rows, dtype=np.intp) * X.shape[1], n_trees)
+        values_flat, children = X.ravel(), self.children.reshape(-1)
+        check_missing = np.isnan(values_flat).any()
+        for step in range(self.depth):
+            # Leaves loop to themselves, so finished pairs are only dropped once enough have piled up
+            if step % COMPACT_EVERY == COMPACT_EVERY - 1:
+                done = self.is_leaf[nodes]
+                if np.count_nonzero(done) > len(nodes) // 4:
+                    leaves[position[done]] = nodes[done]
+                    descending = ~done
+                    nodes, offsets, position = nodes[descending], offsets[descending], position[descending]
+                    if not len(nodes):
+                        break
+            values = values_flat[offsets + self.feature[nodes]]
+            go_right = values > self.threshold[nodes]
+            if check_missing:
+                missing = np.isnan(values)
+                go_right[missing] = ~self.missing_left[nodes[missing]]
+            nodes = children[2 * nodes + go_right]
+        leaves[position] = nodes
+        return leaves.reshape(n_rows, n_trees)
+
+    def raw_predict(self, X: np.ndarray) -> np.ndarray:
+        """Ensemble output before any link, shape (rows, n_outputs)."""
+        out = np.empty((len(X), self.n_outputs))
+        for start in range(0, len(X), COMPILED_BATCH_ROWS):
+            leaves = self.apply(X[start:start + COMPILED_BATCH_ROWS])
+            if self.kind == "forest":
+                out[start:start + len(leaves)] = self.value[leaves].mean(axis=1)
+            else:
+                # Trees are stored iteration by iteration, n_outputs per iteration
+                per_output = self.value[leaves].reshape(len(leaves), -1, self.n_outputs).sum(axis=1)
+                out[start:start + len(leaves)] = per_output + self.baseline
+        return out
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        raw = self.raw_predict(X)[:, 0]
+        return np.exp(raw) if self.link == "log" else raw
+
+
+class CompiledEnsembleClassifier(CompiledEnsemble):
+    """Classification ensemble: forests average class fractions, boosting maps raw scores through the link."""
+
+    def __init__(self, *args, classes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.classes_ = classes
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        raw = self.raw_predict(X)
+        if self.kind == "forest":
+            return raw
+        if self.link == "logistic":
+            positive = 1 / (1 + np.exp(-raw[:, 0]))
+            return np.column_stack([1 - positive, positive])
+        raw = np.exp(raw - raw.max(axis=1, keepdims=True))
+        return raw / raw.sum(axis=1, keepdims=True)
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
+
+
+def _flatten(trees: List[Tuple[np.ndarray, ...]]):
+    """
+    Concatenate per-tree (feature, threshold, left, right, missing_left,
+    is_leaf, value) arrays, offsetting child indices; leaves loop to themselves.
+    """
+    roots, offset = [], 0
+    parts = [[] for _ in range(7)]
+    for tree in trees:
+        feature, threshold, left, right, missing_left, is_leaf, value = tree
+        n = len(feature)
+        own = np.arange(offset, offset + n)
+        parts[0].append(np.where(is_leaf, 0, feature))
+        parts[1].append(threshold)
+        parts[2].append(np.where(is_leaf, own, left + offset))
+        parts[3].append(np.where(is_leaf, own, right + offset))
+        parts[4].append(missing_left)
+        parts[5].append(is_leaf)
+        parts[6].append(value)
+        roots.append(offset)
+        offset += n
+    feature, threshold, left, right, missing_left, is_leaf, value = (np.concatenate(p) for p in parts)
+    # Native-width indices: numpy would convert narrower ones on every gather
+    index = np.intp
+    return {
+        "feature": feature.astype(index),
+        "threshold": threshold.astype(np.float64),
+        "children": np.column_stack([left, right]).astype(index),
+        "missing_left": missing_left.astype(bool),
+        "is_leaf": is_leaf.astype(bool),
+        "value": np.ascontiguousarray(value, dtype=np.float64),
+        "roots": np.asarray(roots, dtype=index),
+    }
+
+
+def _compile_forest(estimator) -> CompiledEnsemble:
+    trees = []
+    for member in estimator.estimators_:
+        tree = member.tree_
+        is_leaf = tree.children_left == -1
+        value = tree.value[:, 0, :]
+        if hasattr(estimator, "classes_"):
+            # Leaf class weights to fractions, as DecisionTreeClassifier.predict_proba does
+            totals = value.sum(axis=1, keepdims=True)
+            value = value / np.where(totals == 0, 1, totals)
+        trees.append((
+            tree.feature, tree.threshold, tree.children_left, tree.children_right,
+            tree.missing_go_to_left, is_leaf, value,
+        ))
+    arrays = _flatten(trees)
+    common = dict(
+        depth=max(member.tree_.max_depth for member in estimator.estimators_),
+        n_features=estimator.n_features_in_, input_dtype=np.float32, n_outputs=arrays["value"].shape[1],
+    )
+    if hasattr(estimator, "classes_"):
+        return CompiledEnsembleClassifier("forest", **arrays, **common, classes=np.asarray(estimator.classes_))
+    return CompiledEnsemble("forest", **arrays, **common)
+
+
+def _compile_boosting(estimator) -> Optional[CompiledEnsemble]:
+    if estimator.is_categorical_ is not None and np.any(estimator.is_categorical_):
+        # Categorical splits test bitsets, which the flat arrays do not hold
+        return None
+    trees = []
+    for iteration in estimator._predictors:
+        for predictor in iteration:
+            nodes = predictor.nodes
+            trees.append((
+                nodes["feature_idx"], nodes["num_threshold"], nodes["left"].astype(np.int64),
+                nodes["right"].astype(np.int64), nodes["missing_go_to_left"], nodes["is_leaf"], nodes["value"],
+            ))
+    arrays = _flatten(trees)
+    baseline = np.asarray(estimator._baseline_prediction, dtype=np.float64).ravel()
+    common = dict(
+        depth=max(int(p.nodes["depth"].max()) for iteration in estimator._predictors for p in iteration),
+        n_features=estimator.n_features_in_, input_dtype=np.float64, baseline=baseline, n_outputs=len(baseline),
+    )
+    if hasattr(estimator, "classes_"):
+        link = "logistic" if len(baseline) == 1 else "softmax"
+        return CompiledEnsembleClassifier("boosting", **arrays, **common, link=link, classes=np.asarray(estimator.classes_))
+    link = "log" if estimator.loss in ("poisson", "gamma") else "identity"
+    return CompiledEnsemble("boosting", **arrays, **common, link=link)
+
+
+def compile_model(model) -> Optional[CompiledEnsemble]:
+    """Compiled form of a fitted Random Forest or HistGradientBoosting model, or None for other models."""
+    from sklearn.ensemble import (
+        RandomForestClassifier, RandomForestRegressor,
+        HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+    )
+
+    if isinstance(model, (RandomForestClassifier, RandomForestRegressor)):
+        if model.n_outputs_ != 1:
+            return None
+        return _compile_forest(model)
+    if isinstance(model, (HistGradientBoostingClassifier, HistGradientBoostingRegressor)):
+        return _compile_boosting(model)
+    return None
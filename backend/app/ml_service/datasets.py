@@ -0,0 +1,260 @@
+import json
+import os
+import shutil
+import uuid
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Iterator
+
+if TYPE_CHECKING:
+    import numpy as np
+
+DATASET_DIR = os.getenv("DATASET_DIR", os.path.join(os.getcwd(), "data", "datasets"))
+# Rows parsed per chunk while converting; bounds conversion memory
+INGEST_CHUNK_ROWS = int(os.getenv("DATASET_INGEST_CHUNK_ROWS", "200000"))
+
+MANIFEST = "manifest.json"
+FORMATS = ("csv", "parquet")
+
+
+class DatasetFormatError(ValueError):
+    pass
+
+
+class _TextColumns(Exception):
+    """Columns typed numeric by the first chunk that turned out to hold text in a later one."""
+
+    def __init__(self, columns: List[str]):
+        super().__init__(", ".join(columns))
+        self.columns = columns
+
+
+def detect_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    name = (filename or "").lower()
+    content_type = (content_type or "").lower()
+    if name.endswith(".parquet") or "parquet" in content_type:
+        return "parquet"
+    if name.endswith((".csv", ".txt")) or "csv" in content_type or not name:
+        return "csv"
+    raise DatasetFormatError(f"Unsupported dataset format: {filename}")
+
+
+class ColumnarDataset:
+    """
+    Read-only view over a converted dataset.
+    Each column is a typed binary file opened with np.memmap, so reading a
+    column costs no parsing and no copy until the pages are touched.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        self._columns = {column["name"]: column for column in self.manifest["columns"]}
+
+    @property
+    def content_hash(self) -> str:
+        return self.manifest["content_hash"]
+
+    @property
+    def n_rows(self) -> int:
+        return self.manifest["n_rows"]
+
+    @property
+    def columns(self) -> List[str]:
+        return [column["name"] for column in self.manifest["columns"]]
+
+    def kind(self, name: str) -> str:
+        return self._columns[name]["kind"]
+
+    def column(self, name: str) -> "np.ndarray":
+        """Zero-copy memory-mapped column. Categorical columns hold int32 codes (-1 = missing)."""
+        import numpy as np
+
+        column = self._columns[name]
+        if self.n_rows == 0:
+            return np.empty(0, dtype=column["dtype"])
+        return np.memmap(
+            os.path.join(self.path, column["file"]), dtype=column["dtype"], mode="r", shape=(self.n_rows,)
+        )
+
+    def categories(self, name: str) -> List[str]:
+        column = self._columns[name]
+        if column["kind"] != "categorical":
+            return []
+        with open(os.path.join(self.path, column["categories_file"])) as f:
+            return json.load(f)
+
+    def profile(self, name: str) -> Optional[Dict[str, Any]]:
+        """Statistics profiled while the column was converted (see profiling); None for older datasets."""
+        return self._columns[name].get("profile")
+
+
+class _ColumnWriter:
+    """
+    Appends one column chunk by chunk, fixing its kind from the first chunk,
+    and profiles the values it writes. A numeric column with values in a
+    later chunk that are not numbers raises _TextColumns rather than losing
+    them to NaN.
+    """
+
+    def __init__(self, directory: str, index: int, name: str, sample):
+        import numpy as np
+        import pandas as pd
+        from .profiling import ColumnProfiler
+
+        self.name = name
+        self.file = f"{index}.bin"
+        if pd.api.types.is_numeric_dtype(sample) or pd.api.types.is_bool_dtype(sample):
+            self.kind, self.dtype = "numeric", np.dtype("float64")
+        else:
+            self.kind, self.dtype = "categorical", np.dtype("int32")
+        self.categories: Dict[str, int] = {}
+        self.profiler = ColumnProfiler(name, self.kind, seed=index)
+        self._handle = open(os.path.join(directory, self.file), "wb")
+
+    def append(self, values):
+        import numpy as np
+        import pandas as pd
+
+        if self.kind == "numeric":
+            data = pd.to_numeric(values, errors="coerce").to_numpy(dtype=self.dtype, na_value=np.nan)
+            missing = np.isnan(data)
+            if missing.any() and (missing & values.notna().to_numpy()).any():
+                raise _TextColumns([self.name])
+        else:
+            # Factorize per chunk, then remap the (small) chunk dictionary onto the global one
+            local_codes, uniques = pd.factorize(values.astype("string"), use_na_sentinel=True)
+            remap = np.fromiter(
+                (self.categories.setdefault(value, len(self.categories)) for value in uniques),
+                dtype=self.dtype, count=len(uniques),
+            )
+            data = np.where(local_codes >= 0, remap[np.maximum(local_codes, 0)] if len(remap) else -1, -1).astype(self.dtype)
+        data.tofile(self._handle)
+        self.profiler.update(data)
+
+    def close(self, directory: str) -> Dict[str, Any]:
+        self._handle.close()
+        entry = {"name": self.name, "kind": self.kind, "dtype": self.dtype.str, "file": self.file}
+        categories = None
+        if self.kind == "categorical":
+            categories = list(self.categories)
+            entry["categories_file"] = f"{self.file}.categories.json"
+            with open(os.path.join(directory, entry["categories_file"]), "w") as f:
+                json.dump(categories, f)
+        entry["profile"] = self.profiler.result(categories)
+        return entry
+
+
+class DatasetStore:
+    """
+    Content-addressed store of converted datasets.
+    Raw uploads are parsed exactly once into per-column binary files plus a
+    JSON manifest (with each column's profile) under `<root>/<sha256>/`;
+    later jobs only mmap them.
+    """
+
+    def __init__(self, root: str = DATASET_DIR):
+        self.root = root
+
+    def path(self, content_hash: str) -> str:
+        return os.path.join(self.root, content_hash)
+
+    def exists(self, content_hash: str) -> bool:
+        return os.path.exists(os.path.join(self.path(content_hash), MANIFEST))
+
+    def open(self, content_hash: str) -> ColumnarDataset:
+        return ColumnarDataset(self.path(content_hash))
+
+    def upload_path(self) -> str:
+        """Scratch file for an incoming raw upload."""
+        directory = os.path.join(self.root, "uploads")
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"{uuid.uuid4()}.part")
+
+    def ingest(self, raw_path: str, fmt: str, content_hash: str) -> ColumnarDataset:
+        """
+        Convert a raw CSV/Parquet file into the columnar layout (no-op if
+        already converted). Column kinds come from the first chunk; if a
+        later chunk shows a numeric column holds text after all, the file
+        is converted again with that column read as text.
+        """
+        text_columns: List[str] = []
+        while True:
+            try:
+                return self._convert(raw_path, fmt, content_hash, text_columns)
+            except _TextColumns as e:
+                text_columns.extend(e.columns)
+
+    def _convert(self, raw_path: str, fmt: str, content_hash: str, text_columns: List[str]) -> ColumnarDataset:
+        if self.exists(content_hash):
+            return self.open(content_hash)
+
+        staging = os.path.join(self.root, f".{content_hash}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            writers: List[_ColumnWriter] = []
+            n_rows = 0
+            for chunk in self._read_chunks(raw_path, fmt, text_columns):
+                if not writers:
+                    writers = [_ColumnWriter(staging, i, str(name), chunk[name]) for i, name in enumerate(chunk.columns)]
+                conflicts = []
+                for writer, name in zip(writers, chunk.columns):
+                    try:
+                        writer.append(chunk[name])
+                    except _TextColumns as e:
+                        conflicts.extend(e.columns)
+                if conflicts:
+                    raise _TextColumns(conflicts)
+                n_rows += len(chunk)
+            if not writers:
+                raise DatasetFormatError("Dataset has no columns")
+
+            manifest = {
+                "version": 1,
+                "content_hash": content_hash,
+                "format": fmt,
+                "n_rows": n_rows,
+                "columns": [writer.close(staging) for writer in writers],
+            }
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(staging, self.path(content_hash))
+            except OSError:
+                # A concurrent ingest of the same content won the race
+                if not self.exists(content_hash):
+                    raise
+        finally:
+            for writer in writers:
+                if not writer._handle.closed:
+                    writer._handle.close()
+            shutil.rmtree(staging, ignore_errors=True)
+        return self.open(content_hash)
+
+    def _read_chunks(self, raw_path: str, fmt: str, text_columns: List[str]) -> Iterator:
+        import pandas as pd
+
+        if fmt == "csv":
+            try:
+                yield from pd.read_csv(
+                    raw_path, chunksize=INGEST_CHUNK_ROWS, low_memory=False,
+                    dtype={name: "string" for name in text_columns},
+                )
+            except pd.errors.ParserError as e:
+                raise DatasetFormatError(f"Could not parse CSV: {e}")
+            except pd.errors.EmptyDataError:
+                raise DatasetFormatError("Dataset has no columns")
+            except UnicodeDecodeError as e:
+                raise DatasetFormatError(f"CSV is not UTF-8 encoded: {e}")
+        elif fmt == "parquet":
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                raise DatasetFormatError("Parquet support requires pyarrow")
+            for batch in pq.ParquetFile(raw_path).iter_batches(batch_size=INGEST_CHUNK_ROWS):
+                chunk = batch.to_pandas()
+                yield chunk.astype({name: "string" for name in text_columns}) if text_columns else chunk
+        else:
+            raise DatasetFormatError(f"Unsupported dataset format: {fmt}")
+
+
+dataset_store = DatasetStore()
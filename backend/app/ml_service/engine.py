@@ -0,0 +1,407 @@
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from multiprocessing import shared_memory
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+import numpy as np
+
+# Upper bound on pool processes a single job may use (0 = all available cores)
+MAX_WORKERS_PER_JOB = int(os.getenv("ML_MAX_WORKERS_PER_JOB", "0"))
+# "spawn" is the safe default inside multi-threaded Celery workers
+START_METHOD = os.getenv("ML_START_METHOD", "spawn")
+CV_FOLDS = int(os.getenv("ML_CV_FOLDS", "3"))
+# Families by rough fitting cost, cheapest first. The search starts them in
+# this order, so one scores early even when the budget is short.
+FAMILIES_BY_COST = ("Logistic Regression", "Gradient Boosting", "Random Forest", "Neural Network", "SVM")
+# Kernel SVMs are quadratic in rows; skip them above this size
+SVM_MAX_ROWS = int(os.getenv("ML_SVM_MAX_ROWS", "50000"))
+# Rows gathered per step when training rows are copied into shared memory
+COPY_CHUNK_ROWS = 65536
+
+
+def available_cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def can_start_processes() -> bool:
+    """
+    False in daemonic processes, which may not have children: the pool
+    processes of Celery's prefork workers are daemonic.
+    """
+    return not multiprocessing.current_process().daemon
+
+
+def resolve_worker_count(n_tasks: int, max_workers: Optional[int] = None) -> int:
+    """Number of pool processes for a job: every core, capped per job and by the work available."""
+    if not can_start_processes():
+        return 1
+    cap = max_workers or MAX_WORKERS_PER_JOB or available_cpus()
+    return max(1, min(available_cpus(), cap, n_tasks))
+
+
+class SharedDataset:
+    """
+    Named NumPy arrays backed by POSIX shared memory.
+
+    The parent copies each array in once; pool workers attach by segment name
+    and get zero-copy views, so the dataset is never pickled per candidate.
+    Given row indices, only those rows are copied, a chunk at a time, so a
+    memory-mapped matrix is never loaded whole on the way in.
+    """
+
+    def __init__(self):
+        self._segments: Dict[str, shared_memory.SharedMemory] = {}
+        self._spec: Dict[str, Tuple[str, Tuple[int, ...], str]] = {}
+        self.arrays: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_arrays(cls, rows: Optional[np.ndarray] = None, **arrays: np.ndarray) -> "SharedDataset":
+        dataset = cls()
+        for name, array in arrays.items():
+            dataset.add(name, array, rows)
+        return dataset
+
+    def allocate(self, name: str, shape: Tuple[int, ...], dtype) -> np.ndarray:
+        """Reserve a shared block and return a writable view to fill in place."""
+        dtype = np.dtype(dtype)
+        nbytes = max(1, int(np.prod(shape)) * dtype.itemsize)
+        segment = shared_memory.SharedMemory(create=True, size=nbytes)
+        view = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+        self._segments[name] = segment
+        self._spec[name] = (segment.name, tuple(shape), dtype.str)
+        self.arrays[name] = view
+        return view
+
+    def add(self, name: str, array: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Copy in `array`, or its `rows` in that order."""
+        array = np.asarray(array)
+        n_rows = len(array) if rows is None else len(rows)
+        view = self.allocate(name, (n_rows, *array.shape[1:]), array.dtype)
+        for start in range(0, n_rows, COPY_CHUNK_ROWS):
+            chunk = slice(start, start + COPY_CHUNK_ROWS)
+            view[chunk] = array[chunk] if rows is None else array[rows[chunk]]
+        return view
+
+    @property
+    def spec(self) -> Dict[str, Tuple[str, Tuple[int, ...], str]]:
+        """Picklable description workers use to attach."""
+        return dict(self._spec)
+
+    @staticmethod
+    def attach(spec: Dict[str, Tuple[str, Tuple[int, ...], str]]):
+        arrays, segments = {}, []
+        for name, (segment_name, shape, dtype) in spec.items():
+            segment = shared_memory.SharedMemory(name=segment_name)
+            arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=segment.buf)
+            segments.append(segment)
+        return arrays, segments
+
+    def close(self):
+        self.arrays.clear()
+        for segment in self._segments.values():
+            segment.close()
+            try:
+                segment.unlink()
+            except FileNotFoundError:
+                pass
+        self._segments.clear()
+        self._spec.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Model families, keyed by the names MLTrainer.model_types exposes
+
+def _scaled(estimator):
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    return make_pipeline(StandardScaler(), estimator)
+
+
+def build_estimator(family: str, task_type: str, params: Optional[Dict[str, Any]] = None, random_state: int = 0):
+    params = params or {}
+    regression = task_type == "regression"
+
+    if family == "Random Forest":
+        from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+        cls = RandomForestRegressor if regression else RandomForestClassifier
+        return cls(**{"n_estimators": 100, "n_jobs": 1, "random_state": random_state, **params})
+    if family == "Gradient Boosting":
+        from sklearn.ensemble import HistGradientBoostingClassifier, HistGradientBoostingRegressor
+        cls = HistGradientBoostingRegressor if regression else HistGradientBoostingClassifier
+        return cls(**{"random_state": random_state, **params})
+    if family == "SVM":
+        from sklearn.svm import SVC, SVR
+        return _scaled(SVR(**params) if regression else SVC(**{"probability": True, "random_state": random_state, **params}))
+    if family == "Logistic Regression":
+        from sklearn.linear_model import LogisticRegression, Ridge
+        if regression:
+            return _scaled(Ridge(**params))
+        return _scaled(LogisticRegression(**{"max_iter": 1000, **params}))
+    if family == "Neural Network":
+        from sklearn.neural_network import MLPClassifier, MLPRegressor
+        cls = MLPRegressor if regression else MLPClassifier
+        return _scaled(cls(**{"early_stopping": True, "max_iter": 300, "random_state": random_state, **params}))
+    raise ValueError(f"Unknown model family: {family}")
+
+
+def scoring_for(task_type: str) -> str:
+    return "r2" if task_type == "regression" else "accuracy"
+
+
+# Pool worker state: views onto the shared dataset, set once per process
+_WORKER_ARRAYS: Dict[str, np.ndarray] = {}
+_WORKER_SEGMENTS: List[shared_memory.SharedMemory] = []
+
+
+def _init_worker(spec):
+    try:
+        from threadpoolctl import threadpool_limits
+        # Parallelism comes from the pool; keep BLAS/OpenMP to one thread per process
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    arrays, segments = SharedDataset.attach(spec)
+    _WORKER_ARRAYS.update(arrays)
+    _WORKER_SEGMENTS.extend(segments)
+
+
+def _evaluate_candidate(
+    family: str,
+    task_type: str,
+    params: Dict[str, Any],
+    cv_folds: int,
+    random_state: int,
+    n_rows: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Cross-validate one configuration, optionally on the first `n_rows` (pre-shuffled) rows."""
+    from sklearn.model_selection import cross_val_score
+
+    X, y = _WORKER_ARRAYS["X"], _WORKER_ARRAYS["y"]
+    if n_rows is not None:
+        X, y = X[:n_rows], y[:n_rows]
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    scores = cross_val_score(
+        build_estimator(family, task_type, params, random_state),
+        X, y, cv=cv_folds, scoring=scoring_for(task_type),
+    )
+    return {
+        "family": family,
+        "params": params,
+        "n_rows": len(X),
+        "score": float(np.mean(scores)),
+        "score_std": float(np.std(scores)),
+        "fit_time": time.perf_counter() - wall_start,
+        "cpu_time": time.process_time() - cpu_start,
+    }
+
+
+def evaluate_fold(
+    X: np.ndarray,
+    y: np.ndarray,
+    family: str,
+    task_type: str,
+    fold: int,
+    cv_folds: int = CV_FOLDS,
+    random_state: int = 0,
+    params: Optional[Dict[str, Any]] = None,
+    rows: Optional[np.ndarray] = None,
+) -> Dict[str, Any]:
+    """
+    Score one fold of the cross-validation _evaluate_candidate runs, over
+    the training `rows` of X and y (all of them if None). The splits are the
+    ones cross_val_score makes, so ranking the folds of a family with
+    rank_folds gives the score a single-node search would.
+    """
+    from sklearn.base import is_classifier
+    from sklearn.metrics import get_scorer
+    from sklearn.model_selection import check_cv
+
+    params = params or {}
+    rows = np.arange(len(y)) if rows is None else rows
+    y = np.asarray(y)[rows]
+    estimator = build_estimator(family, task_type, params, random_state)
+    cv = check_cv(cv_folds, y, classifier=is_classifier(estimator))
+    # Only this fold's rows are read from X, which may be memory-mapped
+    train, test = next(islice(cv.split(np.zeros(len(y)), y), fold, None))
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    estimator.fit(X[rows[train]], y[train])
+    score = get_scorer(scoring_for(task_type))(estimator, X[rows[test]], y[test])
+    return {
+        "family": family,
+        "params": params,
+        "fold": fold,
+        "n_rows": len(y),
+        "score": float(score),
+        "fit_time": time.perf_counter() - wall_start,
+        "cpu_time": time.process_time() - cpu_start,
+    }
+
+
+def rank_folds(folds: List[Dict[str, Any]], families: List[str], cv_folds: int = CV_FOLDS) -> List[Dict[str, Any]]:
+    """
+    Candidate results, ranked like ModelSearch.run's, from per-fold results
+    (evaluate_fold's, or {"family", "fold", "error"} for a fold that failed).
+    A family missing a fold or with a failed one is ranked last with the error.
+    """
+    by_family: Dict[str, Dict[int, Dict[str, Any]]] = {family: {} for family in families}
+    for result in folds:
+        if result["family"] in by_family:
+            by_family[result["family"]][result["fold"]] = result
+    results = []
+    for family, scored in by_family.items():
+        errors = [r["error"] for r in scored.values() if "error" in r]
+        if errors or len(scored) < cv_folds:
+            error = errors[0] if errors else f"{cv_folds - len(scored)} of {cv_folds} folds missing"
+            results.append({"family": family, "params": {}, "score": float("-inf"), "error": error})
+            continue
+        scores = [scored[fold]["score"] for fold in range(cv_folds)]
+        results.append({
+            "family": family,
+            "params": scored[0]["params"],
+            "n_rows": scored[0]["n_rows"],
+            "score": float(np.mean(scores)),
+            "score_std": float(np.std(scores)),
+            # Summed over the folds, as one process would have spent on them
+            "fit_time": sum(r["fit_time"] for r in scored.values()),
+            "cpu_time": sum(r["cpu_time"] for r in scored.values()),
+        })
+    results.sort(key=lambda r: r["score"], reverse=True)
+    return results
+
+
+class InProcessPool(ThreadPoolExecutor):
+    """
+    Stand-in for the process pool where processes can't be started: one
+    thread evaluating candidates against the parent's own arrays.
+    """
+
+    def __init__(self, shared: SharedDataset):
+        super().__init__(max_workers=1, initializer=_WORKER_ARRAYS.update, initargs=(shared.arrays,))
+
+
+def open_pool(shared: SharedDataset, n_workers: int):
+    """
+    Process pool whose workers are attached to `shared`, or an InProcessPool
+    inside a daemonic process (see can_start_processes).
+    """
+    if not can_start_processes():
+        return InProcessPool(shared)
+    return ProcessPoolExecutor(
+        max_workers=n_workers,
+        mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=_init_worker,
+        initargs=(shared.spec,),
+    )
+
+
+def terminate_pool(pool):
+    """Stop a pool immediately, killing evaluations that are still running."""
+    if isinstance(pool, InProcessPool):
+        # A thread can't be killed; its evaluation reads the shared arrays, so it is waited out
+        pool.shutdown(wait=True, cancel_futures=True)
+        _WORKER_ARRAYS.clear()
+        return
+    processes = list((getattr(pool, "_processes", None) or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join()
+
+
+class ModelSearch:
+    """
+    Cross-validates candidate model families in parallel and returns them
+    ranked. A budget that runs out stops the search once one family has
+    scored, so a job always ends up with a model however small its budget.
+    """
+
+    def __init__(
+        self,
+        task_type: str,
+        max_workers: Optional[int] = None,
+        cv_folds: int = CV_FOLDS,
+        random_state: int = 0,
+        budget=None,
+    ):
+        self.task_type = task_type
+        self.max_workers = max_workers
+        self.budget = budget
+        self.cv_folds = cv_folds
+        self.random_state = random_state
+
+    def candidates(self, families: List[str], n_rows: int) -> List[str]:
+        if n_rows > SVM_MAX_ROWS:
+            families = [family for family in families if family != "SVM"]
+        return families
+
+    def run(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        families: List[str],
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+        completed: Optional[List[Dict[str, Any]]] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Search on the training `rows` of X and y (all of them if None).
+        `completed` holds results from an earlier attempt; those families
+        are not run again.
+        """
+        families = self.candidates(families, len(X) if rows is None else len(rows))
+        results = [r for r in completed or [] if r["family"] in families]
+        done_families = {r["family"] for r in results}
+        families = [family for family in families if family not in done_families]
+        if not families:
+            results.sort(key=lambda r: r["score"], reverse=True)
+            return results
+        n_workers = resolve_worker_count(len(families), self.max_workers)
+
+        with SharedDataset.from_arrays(rows, X=X, y=y) as shared:
+            pool = open_pool(shared, n_workers)
+            try:
+                futures = {
+                    pool.submit(_evaluate_candidate, family, self.task_type, {}, self.cv_folds, self.random_state): family
+                    for family in sorted(families, key=FAMILIES_BY_COST.index)
+                }
+                pending = set(futures)
+                while pending:
+                    scored = any("error" not in r for r in results)
+                    timeout = self.budget.wait_timeout(overrun=not scored) if self.budget else None
+                    done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                    if self.budget:
+                        self.budget.raise_if_cancelled()
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = {"family": futures[future], "params": {}, "score": float("-inf"), "error": str(e)}
+                        if self.budget:
+                            self.budget.charge(result.get("cpu_time", 0.0))
+                        results.append(result)
+                        if on_result:
+                            on_result(result)
+                    scored = any("error" not in r for r in results)
+                    if self.budget and self.budget.exhausted() and pending and scored:
+                        # Out of budget: rank whatever finished, drop the rest
+                        for future in pending:
+                            results.append({"family": futures[future], "params": {}, "score": float("-inf"), "error": "time budget exhausted"})
+                        break
+            finally:
+                terminate_pool(pool)
+
+        results.sort(key=lambda r: r["score"], reverse=True)
+        return results
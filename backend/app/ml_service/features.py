@@ -0,0 +1,506 @@
+"""
+Feature engineering: turns a table of raw columns into the float matrix the
+model search trains on.
+
+Column types are inferred from the data (numeric, categorical, date), then
+each column is imputed, encoded and scaled with whole-column NumPy/pandas
+operations. Per-value work on categoricals (hashing, date parsing) runs once
+per distinct value and is gathered back through the integer codes, so it
+costs O(distinct values) rather than O(rows).
+
+The fitted FeatureTransform travels with the model (see serving.ModelBundle)
+and applies the same steps to prediction requests. It also keeps a histogram
+of every column it was fitted on; retraining compares appended rows against
+them to measure drift (dates and identifiers aside, which grow by design)
+and folds the new counts in. Matrices built from an uploaded dataset are
+cached on disk by FeatureCache.
+"""
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+FEATURE_DIR = os.getenv("FEATURE_DIR", os.path.join(os.getcwd(), "data", "features"))
+# Categoricals with more distinct values than this are hashed instead of one-hot encoded
+MAX_ONE_HOT = int(os.getenv("ML_MAX_ONE_HOT_CATEGORIES", "16"))
+HASH_BUCKETS = int(os.getenv("ML_HASH_BUCKETS", "32"))
+# Share of a categorical column's distinct values that must parse as dates for it to be one
+DATE_MIN_SHARE = 0.9
+DATE_PATTERN = r"\d{1,4}[-/.]\d{1,2}"
+# Bump when the transform's output changes so cached matrices are rebuilt
+TRANSFORM_VERSION = 2
+# Quantile bins of the numeric and date histograms used for drift
+DRIFT_BINS = 10
+# Share of distinct values above which an integer column counts as an identifier
+IDENTIFIER_MIN_DISTINCT = 0.95
+
+
+def feature_config() -> Dict[str, Any]:
+    """Settings that determine the engineered matrix; part of the cache key."""
+    return {
+        "version": TRANSFORM_VERSION,
+        "max_one_hot": MAX_ONE_HOT,
+        "hash_buckets": HASH_BUCKETS,
+        "scale": True,
+    }
+
+
+class Table:
+    """
+    Raw columns the feature stage reads. Numeric columns are float64 with
+    NaN for missing; categorical columns are int32 codes into a dictionary of
+    strings (-1 = missing), as kept by the dataset store. Columns are loaded
+    on first use, so a cache hit never touches them.
+    """
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        self._columns: Dict[str, Tuple[str, Callable[[], np.ndarray], Callable[[], List[str]]]] = {}
+
+    @classmethod
+    def from_dataset(cls, dataset, names: List[str], mask: np.ndarray, start: int = 0) -> "Table":
+        """
+        Rows `start:` of a ColumnarDataset where `mask` (aligned with those
+        rows) is set. With every row kept, columns are the store's memory
+        maps themselves rather than copies.
+        """
+        table = cls(int(mask.sum()))
+        rows = slice(None) if table.n_rows == len(mask) else mask
+        for name in names:
+            table._columns[name] = (
+                dataset.kind(name),
+                lambda name=name: np.asarray(dataset.column(name)[start:][rows]),
+                lambda name=name: dataset.categories(name),
+            )
+        return table
+
+    @classmethod
+    def from_matrix(cls, X: np.ndarray, names: List[str]) -> "Table":
+        table = cls(len(X))
+        for j, name in enumerate(names):
+            table._columns[name] = ("numeric", lambda j=j: X[:, j], list)
+        return table
+
+    def select(self, names: List[str]) -> "Table":
+        """The same rows with only the columns in `names`."""
+        table = Table(self.n_rows)
+        table._columns = {name: self._columns[name] for name in names if name in self._columns}
+        return table
+
+    def take(self, rows: np.ndarray) -> "Table":
+        """The rows at indices `rows` (e.g. a training split) with the same columns."""
+        table = Table(len(rows))
+        table._columns = {
+            name: (kind, lambda load=load: load()[rows], categories)
+            for name, (kind, load, categories) in self._columns.items()
+        }
+        return table
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._columns)
+
+    def kind(self, name: str) -> str:
+        return self._columns[name][0]
+
+    def values(self, name: str) -> np.ndarray:
+        return self._columns[name][1]()
+
+    def categories(self, name: str) -> List[str]:
+        return self._columns[name][2]()
+
+
+def hash_buckets(values, n_buckets: int) -> np.ndarray:
+    """Stable bucket per string value (the same in every process and release)."""
+    import pandas as pd
+
+    return (pd.util.hash_array(np.asarray(values, dtype=object)) % np.uint64(n_buckets)).astype(np.int64)
+
+
+def parse_dates(values) -> np.ndarray:
+    """datetime64[ns] per value, NaT where a value is missing or not a date."""
+    import pandas as pd
+
+    parsed = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", format="mixed", utc=True)
+    return parsed.dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+
+
+def _looks_like_dates(categories: List[str]) -> Optional[np.ndarray]:
+    """Parsed dictionary if most of the column's distinct values are dates."""
+    import pandas as pd
+
+    if not categories:
+        return None
+    if pd.Series(categories, dtype="string").str.contains(DATE_PATTERN).mean() < DATE_MIN_SHARE:
+        return None
+    parsed = parse_dates(categories)
+    return parsed if (~np.isnat(parsed)).mean() >= DATE_MIN_SHARE else None
+
+
+def _date_parts(dates: np.ndarray, parts: List[str]) -> np.ndarray:
+    """(rows, parts) float matrix of calendar fields, NaN where the date is missing."""
+    import pandas as pd
+
+    index = pd.DatetimeIndex(dates)
+    return np.column_stack([getattr(index, part).to_numpy(dtype=np.float64, na_value=np.nan) for part in parts])
+
+
+def _scaling(values: np.ndarray, scale: bool) -> Tuple[float, float]:
+    if not scale or len(values) == 0:
+        return 0.0, 1.0
+    std = float(values.std())
+    return float(values.mean()), std if std > 0 else 1.0
+
+
+def _fit_numeric(name: str, values: np.ndarray, config: Dict[str, Any]) -> Optional[dict]:
+    missing = np.isnan(values)
+    if missing.all():
+        return None
+    fill = float(np.nanmedian(values))
+    filled = np.where(missing, fill, values) if missing.any() else values
+    if filled.min() == filled.max() and not missing.any():
+        return None  # constant: nothing to learn from
+    mean, scale = _scaling(filled, config["scale"])
+    indicator = bool(missing.any())
+    return {
+        "column": name, "kind": "numeric",
+        "fill": fill, "mean": mean, "scale": scale, "indicator": indicator,
+        "outputs": [name] + ([f"{name}_missing"] if indicator else []),
+    }
+
+
+def _fit_categorical(name: str, codes: np.ndarray, categories: List[str], config: Dict[str, Any]) -> Optional[dict]:
+    if len(categories) <= 1:
+        return None
+    dates = _looks_like_dates(categories)
+    if dates is not None:
+        return _fit_date(name, _gather(dates, codes, np.datetime64("NaT")), config)
+    if len(categories) <= config["max_one_hot"]:
+        return {
+            "column": name, "kind": "onehot", "categories": list(categories),
+            "outputs": [f"{name}={value}" for value in categories],
+        }
+    n_buckets = config["hash_buckets"]
+    return {
+        "column": name, "kind": "hash", "buckets": n_buckets,
+        "outputs": [f"{name}#{i}" for i in range(n_buckets)],
+    }
+
+
+def _fit_date(name: str, dates: np.ndarray, config: Dict[str, Any]) -> Optional[dict]:
+    present = ~np.isnat(dates)
+    if not present.any():
+        return None
+    parts = ["year", "month", "day", "dayofweek"]
+    if (dates[present] != dates[present].astype("datetime64[D]")).any():
+        parts.append("hour")
+    matrix = _date_parts(dates[present], parts)
+    fill = np.median(matrix, axis=0)
+    scaling = [_scaling(matrix[:, k], config["scale"]) for k in range(len(parts))]
+    return {
+        "column": name, "kind": "date", "parts": parts,
+        "fill": fill.tolist(), "mean": [m for m, _ in scaling], "scale": [s for _, s in scaling],
+        "indicator": bool((~present).any()),
+        "outputs": [f"{name}_{part}" for part in parts] + ([f"{name}_missing"] if (~present).any() else []),
+    }
+
+
+def _bin_edges(values: np.ndarray) -> List[float]:
+    present = values[~np.isnan(values)]
+    if len(present) == 0:
+        return []
+    return np.unique(np.quantile(present, np.linspace(0, 1, DRIFT_BINS + 1)[1:-1])).tolist()
+
+
+def _histogram(spec: dict, raw) -> np.ndarray:
+    """
+    Counts of one column's values in the spec's drift bins; the last slot
+    counts missing (and, for one-hot columns, unseen) values.
+    """
+    kind = spec["kind"]
+    if kind in ("onehot", "hash"):
+        n_bins = len(spec["categories"]) if kind == "onehot" else spec["buckets"]
+        return np.bincount(np.where(raw >= 0, raw, n_bins), minlength=n_bins + 1)
+    values = _date_numbers(raw) if kind == "date" else raw
+    missing = np.isnan(values)
+    edges = spec["stats"]["edges"]
+    counts = np.bincount(np.searchsorted(edges, values[~missing], side="right"), minlength=len(edges) + 1)
+    return np.append(counts, missing.sum())
+
+
+def _date_numbers(dates: np.ndarray) -> np.ndarray:
+    """Dates as float days since the epoch, NaN for NaT."""
+    days = dates.astype("datetime64[s]").astype(np.float64) / 86400
+    days[np.isnat(dates)] = np.nan
+    return days
+
+
+def _identifier_like(values: np.ndarray) -> bool:
+    """Integers with (nearly) one distinct value per row: row ids, counters, epoch timestamps."""
+    present = values[~np.isnan(values)]
+    if len(present) < 2 or (present != np.round(present)).any():
+        return False
+    return len(np.unique(present)) >= IDENTIFIER_MIN_DISTINCT * len(present)
+
+
+def _add_stats(spec: dict, raw):
+    """Drift histogram of the column a spec was fitted on."""
+    spec["stats"] = {"edges": []}
+    if spec["kind"] in ("numeric", "date"):
+        spec["stats"]["edges"] = _bin_edges(_date_numbers(raw) if spec["kind"] == "date" else raw)
+    if spec["kind"] == "numeric":
+        spec["stats"]["identifier"] = _identifier_like(raw)
+    spec["stats"]["counts"] = _histogram(spec, raw).tolist()
+
+
+def _tracks_drift(spec: dict) -> bool:
+    """
+    Whether drift is measured on a spec's column. Dates and identifiers grow
+    with every append, so new rows fall past the fitted bins by design.
+    """
+    return "stats" in spec and spec["kind"] != "date" and not spec["stats"].get("identifier", False)
+
+
+def population_stability(expected: np.ndarray, actual: np.ndarray, floor: float = 1e-4) -> float:
+    """Population stability index of two histograms over the same bins (0 = same distribution)."""
+    p = np.clip(expected / max(expected.sum(), 1), floor, None)
+    q = np.clip(actual / max(actual.sum(), 1), floor, None)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def _raw_from_codes(spec: dict, codes: np.ndarray, categories: List[str]):
+    """A table column's codes, mapped through its dictionary into the representation _encode expects."""
+    if spec["kind"] == "onehot":
+        if categories == spec["categories"]:
+            return codes
+        # Another dataset's dictionary: remap its codes onto the fitted categories
+        lookup = {value: code for code, value in enumerate(spec["categories"])}
+        remap = np.array([lookup.get(value, -1) for value in categories], dtype=np.int64)
+        return _gather(remap, codes, -1)
+    if spec["kind"] == "hash":
+        return _gather(hash_buckets(categories, spec["buckets"]), codes, -1)
+    return _gather(parse_dates(categories), codes, np.datetime64("NaT"))
+
+
+def _gather(dictionary: np.ndarray, codes: np.ndarray, missing) -> np.ndarray:
+    """Per-row values from per-category values through the codes (-1 -> `missing`)."""
+    out = dictionary[np.maximum(codes, 0)] if len(dictionary) else np.empty(len(codes), dtype=dictionary.dtype)
+    out[codes < 0] = missing
+    return out
+
+
+class FeatureTransform:
+    """
+    Fitted feature engineering: one spec per kept source column, in output
+    order. Specs are plain dicts (numeric, onehot, hash, date) so the
+    transform pickles small and reads well in a debugger.
+    """
+
+    def __init__(self, specs: List[dict], config: Optional[Dict[str, Any]] = None):
+        self.specs = specs
+        self.config = config or feature_config()
+
+    @property
+    def features(self) -> List[str]:
+        """Names of the output columns."""
+        return [name for spec in self.specs for name in spec["outputs"]]
+
+    @property
+    def inputs(self) -> List[str]:
+        """Source columns a prediction request should supply."""
+        return [spec["column"] for spec in self.specs]
+
+    @classmethod
+    def fit(cls, table: Table, config: Optional[Dict[str, Any]] = None) -> "FeatureTransform":
+        config = config or feature_config()
+        specs = []
+        for name in table.names:
+            values = table.values(name)
+            if table.kind(name) == "numeric":
+                spec = _fit_numeric(name, values, config)
+                raw = values
+            else:
+                categories = table.categories(name)
+                spec = _fit_categorical(name, values, categories, config)
+                raw = _raw_from_codes(spec, values, categories) if spec is not None else None
+            if spec is not None:
+                _add_stats(spec, raw)
+                specs.append(spec)
+        if not specs:
+            raise ValueError("Dataset has no usable feature columns (all constant or empty)")
+        return cls(specs, config)
+
+    def transform_table(self, table: Table, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Feature matrix for a Table, written into `out` (e.g. a memory-mapped file) if given."""
+        if out is None:
+            out = np.empty((table.n_rows, len(self.features)), dtype=np.float64)
+        start = 0
+        for spec in self.specs:
+            width = len(spec["outputs"])
+            self._encode(spec, self._raw_from_table(spec, table), out[:, start:start + width])
+            start += width
+        return out
+
+    def drift(self, table: Table) -> Dict[str, float]:
+        """
+        Population stability index of each column in `table` against the rows
+        fitted so far; date and identifier-like columns are left out.
+        """
+        scores = {}
+        for spec in self.specs:
+            if _tracks_drift(spec):
+                observed = _histogram(spec, self._raw_from_table(spec, table))
+                scores[spec["column"]] = population_stability(np.asarray(spec["stats"]["counts"]), observed)
+        return scores
+
+    def update_stats(self, table: Table):
+        """
+        Fold appended rows into the column histograms. Imputation, encoding
+        and scaling parameters stay as fitted: the model was trained in
+        those coordinates.
+        """
+        for spec in self.specs:
+            if "stats" in spec:
+                counts = np.asarray(spec["stats"]["counts"]) + _histogram(spec, self._raw_from_table(spec, table))
+                spec["stats"]["counts"] = counts.tolist()
+
+    @property
+    def rows_seen(self) -> int:
+        """Rows the column statistics were built from."""
+        spec = next((spec for spec in self.specs if "stats" in spec), None)
+        return int(sum(spec["stats"]["counts"])) if spec else 0
+
+    def _raw_from_table(self, spec: dict, table: Table):
+        values = table.values(spec["column"])
+        if spec["kind"] == "numeric":
+            return values
+        return _raw_from_codes(spec, values, table.categories(spec["column"]))
+
+    def transform_rows(self, rows: List[Dict[str, Any]]) -> np.ndarray:
+        """Feature matrix for prediction requests given as {column: value} dicts."""
+        out = np.empty((len(rows), len(self.features)), dtype=np.float64)
+        start = 0
+        for spec in self.specs:
+            width = len(spec["outputs"])
+            values = [row.get(spec["column"]) for row in rows]
+            self._encode(spec, self._raw_from_values(spec, values), out[:, start:start + width])
+            start += width
+        return out
+
+    def _raw_from_values(self, spec: dict, values: List[Any]):
+        """Serving input: raw request values in the representation _encode expects."""
+        if spec["kind"] == "numeric":
+            try:
+                return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            except (TypeError, ValueError):
+                raise ValueError(f"Feature {spec['column']!r} must be numeric")
+        present = np.array([v is not None for v in values], dtype=bool)
+        strings = [str(v) for v in values if v is not None]
+        if spec["kind"] == "date":
+            dates = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[ns]")
+            dates[present] = parse_dates(strings)
+            return dates
+        codes = np.full(len(values), -1, dtype=np.int64)
+        if spec["kind"] == "hash":
+            codes[present] = hash_buckets(strings, spec["buckets"])
+        else:
+            # Unseen categories encode like missing ones
+            lookup = {value: code for code, value in enumerate(spec["categories"])}
+            codes[present] = [lookup.get(s, -1) for s in strings]
+        return codes
+
+    @staticmethod
+    def _encode(spec: dict, values, out: np.ndarray):
+        kind = spec["kind"]
+        if kind == "numeric":
+            missing = np.isnan(values)
+            filled = np.where(missing, spec["fill"], values)
+            np.subtract(filled, spec["mean"], out=out[:, 0])
+            out[:, 0] /= spec["scale"]
+            if spec["indicator"]:
+                out[:, 1] = missing
+        elif kind in ("onehot", "hash"):
+            out[...] = 0.0
+            rows = np.flatnonzero(values >= 0)
+            out[rows, values[rows]] = 1.0
+        else:
+            parts = _date_parts(values, spec["parts"])
+            missing = np.isnan(parts[:, 0])
+            parts[missing] = spec["fill"]
+            n_parts = len(spec["parts"])
+            out[:, :n_parts] = (parts - spec["mean"]) / spec["scale"]
+            if spec["indicator"]:
+                out[:, n_parts] = missing
+
+
+class FeatureCache:
+    """
+    Engineered matrices on disk, keyed by dataset content hash, target
+    column, transform config and the rows the transform was fitted on. Each
+    entry is `<root>/<key>/` holding X.npy (read back memory-mapped) and the
+    fitted transform, so repeated jobs on the same data skip the feature
+    stage.
+    """
+
+    def __init__(self, root: str = FEATURE_DIR):
+        self.root = root
+
+    @staticmethod
+    def key(content_hash: str, target: str, config: Dict[str, Any]) -> str:
+        return hashlib.sha256(json.dumps([content_hash, target, config], sort_keys=True).encode()).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def load(self, key: str) -> Optional[Tuple[np.ndarray, FeatureTransform]]:
+        import joblib
+
+        path = self.path(key)
+        try:
+            transform = joblib.load(os.path.join(path, "transform.joblib"))
+            X = np.load(os.path.join(path, "X.npy"), mmap_mode="r")
+        except FileNotFoundError:
+            return None
+        return X, transform
+
+    def get_or_build(self, key: str, table: Table, config: Dict[str, Any],
+                     fit_rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, FeatureTransform, bool]:
+        """
+        (X, transform, cache_hit). The transform is fitted on `fit_rows` of
+        the table (all of them if None) and the matrix covers every row. On a
+        miss the matrix is written straight into the cache file.
+        """
+        import joblib
+
+        cached = self.load(key)
+        if cached is not None:
+            return (*cached, True)
+
+        transform = FeatureTransform.fit(table if fit_rows is None else table.take(fit_rows), config)
+        staging = os.path.join(self.root, f".{key}.{uuid.uuid4().hex}")
+        os.makedirs(staging)
+        try:
+            out = np.lib.format.open_memmap(
+                os.path.join(staging, "X.npy"), mode="w+", dtype=np.float64,
+                shape=(table.n_rows, len(transform.features))
+            )
+            transform.transform_table(table, out=out)
+            out.flush()
+            del out
+            joblib.dump(transform, os.path.join(staging, "transform.joblib"))
+            try:
+                os.rename(staging, self.path(key))
+            except OSError:
+                # A concurrent job on the same data won the race
+                if not os.path.exists(self.path(key)):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return (*self.load(key), False)
+
+
+feature_cache = FeatureCache()
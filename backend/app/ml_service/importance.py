@@ -0,0 +1,222 @@
+"""
+Feature importance for the winning model.
+
+Models with native importances (impurity-based for random forests, scaled
+coefficients for linear models) report those. Others get permutation
+importance, built to cost no more than fitting the model did:
+
+- it scores a stratified subsample of the holdout rows, not all of them;
+- each feature's repeats, and several features at once, are permuted into
+  one stacked matrix and scored with a single predict call;
+- features are spread over a process pool when the work is worth the
+  pool's startup;
+- rows and repeats shrink to fit the time cap, and features left when the
+  cap runs out are not reported.
+
+Each permutation importance comes with a 95% confidence interval over its
+repeats.
+"""
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import multiprocessing
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .engine import START_METHOD, resolve_worker_count, terminate_pool
+
+IMPORTANCE_MAX_ROWS = int(os.getenv("ML_IMPORTANCE_MAX_ROWS", "2000"))
+IMPORTANCE_MIN_ROWS = int(os.getenv("ML_IMPORTANCE_MIN_ROWS", "200"))
+IMPORTANCE_REPEATS = int(os.getenv("ML_IMPORTANCE_REPEATS", "5"))
+MIN_REPEATS = 3
+# Permutation importance may take this share of the final model's fit time, but at least the floor
+IMPORTANCE_TIME_SHARE = float(os.getenv("ML_IMPORTANCE_TIME_SHARE", "1.0"))
+IMPORTANCE_MIN_SECONDS = float(os.getenv("ML_IMPORTANCE_MIN_SECONDS", "1.0"))
+# Largest stacked matrix scored in one predict call
+IMPORTANCE_BATCH_BYTES = int(os.getenv("ML_IMPORTANCE_BATCH_BYTES", str(64 * 1024 ** 2)))
+# Estimated cost of starting a pool; below a few of these the work runs in-process
+POOL_STARTUP_SECONDS = 1.0
+
+
+def native_importances(model) -> Optional[np.ndarray]:
+    estimator = model.steps[-1][1] if hasattr(model, "steps") else model
+    importances = getattr(estimator, "feature_importances_", None)
+    if importances is None and hasattr(estimator, "coef_"):
+        # Inputs are standardized ahead of linear models, so coefficient sizes compare
+        importances = np.abs(np.atleast_2d(estimator.coef_)).mean(axis=0)
+    return None if importances is None else np.asarray(importances, dtype=np.float64)
+
+
+def stratified_subsample(y: np.ndarray, n_rows: int, task_type: str, random_state: int = 0) -> np.ndarray:
+    """Indices of up to `n_rows` rows; for classification, every class keeps its share."""
+    if len(y) <= n_rows:
+        return np.arange(len(y))
+    rng = np.random.default_rng(random_state)
+    if task_type == "regression":
+        return np.sort(rng.choice(len(y), n_rows, replace=False))
+    classes, inverse = np.unique(y, return_inverse=True)
+    quota = np.maximum(1, np.round(np.bincount(inverse) * n_rows / len(y)).astype(np.int64))
+    picked = [
+        rng.choice(members, min(len(members), quota[c]), replace=False)
+        for c, members in enumerate(np.split(np.argsort(inverse, kind="stable"), np.cumsum(np.bincount(inverse))[:-1]))
+    ]
+    return np.sort(np.concatenate(picked))
+
+
+def block_scores(predictions: np.ndarray, y: np.ndarray, task_type: str) -> np.ndarray:
+    """Score of each len(y)-row block of stacked predictions: R² or accuracy, as the search ranks."""
+    blocks = predictions.reshape(-1, len(y))
+    if task_type == "regression":
+        total = np.square(y - y.mean()).sum()
+        residual = np.square(blocks - y).sum(axis=1)
+        return 1 - residual / total if total > 0 else np.zeros(len(blocks))
+    return (blocks == y).mean(axis=1)
+
+
+def permutation_scores(model, X: np.ndarray, y: np.ndarray, task_type: str, columns: List[int],
+                       n_repeats: int, random_state: int = 0) -> Dict[int, np.ndarray]:
+    """
+    Scores with each of `columns` permuted, `n_repeats` times, from stacked
+    predict calls of at most IMPORTANCE_BATCH_BYTES. Each column's
+    permutations depend only on the seed and the column, not on batching.
+    """
+    n, d = X.shape
+    block_bytes = n_repeats * n * d * X.itemsize
+    per_batch = max(1, IMPORTANCE_BATCH_BYTES // max(block_bytes, 1))
+    scores = {}
+    for start in range(0, len(columns), per_batch):
+        batch = columns[start:start + per_batch]
+        stacked = np.tile(X, (len(batch) * n_repeats, 1))
+        for b, column in enumerate(batch):
+            rng = np.random.default_rng([random_state, column])
+            order = np.argsort(rng.random((n_repeats, n)), axis=1)
+            rows = slice(b * n_repeats * n, (b + 1) * n_repeats * n)
+            stacked[rows, column] = X[order, column].ravel()
+        batch_scores = block_scores(model.predict(stacked), y, task_type).reshape(len(batch), n_repeats)
+        scores.update(zip(batch, batch_scores))
+    return scores
+
+
+# Pool worker state: the model and subsample, sent once per process
+_WORKER_STATE: Dict[str, Any] = {}
+
+
+def _init_worker(model, X, y, task_type, n_repeats, random_state):
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    _WORKER_STATE.update(model=model, X=X, y=y, task_type=task_type, n_repeats=n_repeats, random_state=random_state)
+
+
+def _score_columns(columns: List[int]) -> Dict[int, np.ndarray]:
+    s = _WORKER_STATE
+    return permutation_scores(s["model"], s["X"], s["y"], s["task_type"], columns, s["n_repeats"], s["random_state"])
+
+
+def _interval(scores: np.ndarray, baseline: float) -> Dict[str, float]:
+    """Importance (mean score drop) and its 95% t-interval over the repeats."""
+    from scipy import stats
+
+    drops = baseline - scores
+    mean, std = float(drops.mean()), float(drops.std(ddof=1)) if len(drops) > 1 else 0.0
+    half = float(stats.t.ppf(0.975, len(drops) - 1)) * std / math.sqrt(len(drops)) if len(drops) > 1 else 0.0
+    return {"importance": mean, "std": std, "ci_low": mean - half, "ci_high": mean + half}
+
+
+def feature_importance(
+    model,
+    task_type: str,
+    X: np.ndarray,
+    y: np.ndarray,
+    features: List[str],
+    fit_time: Optional[float] = None,
+    max_workers: Optional[int] = None,
+    random_state: int = 0,
+) -> Tuple[Optional[List[Dict[str, Any]]], Dict[str, Any]]:
+    """
+    Importance per feature, most important first, and how it was measured.
+    Permutation importance gets max(IMPORTANCE_MIN_SECONDS, fit_time *
+    IMPORTANCE_TIME_SHARE) seconds.
+    """
+    native = native_importances(model)
+    if native is not None:
+        ranked = sorted(
+            ({"feature": f, "importance": float(v)} for f, v in zip(features, native)),
+            key=lambda x: x["importance"], reverse=True
+        )
+        return ranked, {"method": "native"}
+    if len(y) < 2 or X.shape[1] == 0:
+        return None, {"method": "none"}
+
+    start = time.perf_counter()
+    limit = max(IMPORTANCE_MIN_SECONDS, (fit_time or 0.0) * IMPORTANCE_TIME_SHARE)
+    rows = stratified_subsample(y, IMPORTANCE_MAX_ROWS, task_type, random_state)
+    X, y = np.ascontiguousarray(X[rows]), np.asarray(y)[rows]
+    baseline = float(block_scores(model.predict(X), y, task_type)[0])
+    predict_time = time.perf_counter() - start
+
+    # Fit rows and repeats to the time cap, from the cost of that one predict call
+    d = X.shape[1]
+    n_repeats = IMPORTANCE_REPEATS
+    n_workers = resolve_worker_count(d, max_workers)
+    per_row = predict_time / len(y)
+
+    def projected(n_rows, repeats, workers):
+        return d * repeats * n_rows * per_row / workers + (POOL_STARTUP_SECONDS if workers > 1 else 0.0)
+
+    if projected(len(y), n_repeats, 1) < POOL_STARTUP_SECONDS * 3:
+        n_workers = 1
+    while projected(len(y), n_repeats, n_workers) > limit and len(y) > IMPORTANCE_MIN_ROWS:
+        keep = stratified_subsample(y, max(IMPORTANCE_MIN_ROWS, len(y) // 2), task_type, random_state)
+        X, y = X[keep], y[keep]
+        baseline = float(block_scores(model.predict(X), y, task_type)[0])
+    if projected(len(y), n_repeats, n_workers) > limit:
+        n_repeats = MIN_REPEATS
+
+    scores: Dict[int, np.ndarray] = {}
+    columns = list(range(d))
+    if n_workers == 1:
+        per_batch = max(1, IMPORTANCE_BATCH_BYTES // max(n_repeats * X.nbytes, 1))
+        for i in range(0, d, per_batch):
+            if time.perf_counter() - start > limit:
+                break
+            scores.update(permutation_scores(model, X, y, task_type, columns[i:i + per_batch], n_repeats, random_state))
+    else:
+        chunks = [columns[i::n_workers * 4] for i in range(min(d, n_workers * 4))]
+        pool = ProcessPoolExecutor(
+            max_workers=n_workers,
+            mp_context=multiprocessing.get_context(START_METHOD),
+            initializer=_init_worker,
+            initargs=(model, X, y, task_type, n_repeats, random_state),
+        )
+        try:
+            pending = {pool.submit(_score_columns, chunk) for chunk in chunks}
+            while pending:
+                remaining = limit - (time.perf_counter() - start)
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scores.update(future.result())
+        finally:
+            terminate_pool(pool)
+
+    ranked = sorted(
+        ({"feature": features[j], **_interval(s, baseline)} for j, s in scores.items()),
+        key=lambda x: x["importance"], reverse=True
+    )
+    info = {
+        "method": "permutation",
+        "rows": int(len(y)),
+        "repeats": n_repeats,
+        "workers": n_workers,
+        "features_scored": len(scores),
+        "features": d,
+        "seconds": round(time.perf_counter() - start, 3),
+        "time_limit": round(limit, 3),
+    }
+    return ranked, info
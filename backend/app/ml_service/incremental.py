@@ -0,0 +1,86 @@
+"""
+Incremental model updates for retraining on appended rows.
+
+Random Forests grow extra trees fitted on the new rows and Gradient Boosting
+adds boosting iterations on top of its current predictions, both through
+warm_start; the neural network continues training with partial_fit. Other
+families have no cheap update and are retrained in full.
+"""
+import math
+import os
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Ensembles grow in proportion to the share of new rows, by at least this many members
+MIN_NEW_ESTIMATORS = int(os.getenv("RETRAIN_MIN_NEW_ESTIMATORS", "10"))
+PARTIAL_FIT_EPOCHS = int(os.getenv("RETRAIN_PARTIAL_FIT_EPOCHS", "5"))
+
+
+def _final_step(model):
+    return model.steps[-1][1] if hasattr(model, "steps") else model
+
+
+def update_strategy(model) -> Optional[str]:
+    """How `model` can absorb new rows: "add_trees", "boost", "partial_fit", or None."""
+    from sklearn.ensemble import (
+        RandomForestClassifier, RandomForestRegressor,
+        HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+    )
+
+    estimator = _final_step(model)
+    if isinstance(estimator, (RandomForestClassifier, RandomForestRegressor)):
+        return "add_trees"
+    if isinstance(estimator, (HistGradientBoostingClassifier, HistGradientBoostingRegressor)):
+        return "boost"
+    if hasattr(estimator, "partial_fit"):
+        return "partial_fit"
+    return None
+
+
+def update_blocker(model, y: np.ndarray) -> Optional[str]:
+    """Why `model` cannot be updated with targets `y`, or None if it can."""
+    strategy = update_strategy(model)
+    if strategy is None:
+        return f"{type(_final_step(model)).__name__} has no incremental update"
+    classes = getattr(_final_step(model), "classes_", None)
+    if classes is None:
+        return None
+    present = np.unique(y)
+    if not np.isin(present, classes).all():
+        return "appended rows contain new target classes"
+    # Warm-started ensembles refit classes_ from the new rows, so every class must appear
+    if strategy != "partial_fit" and len(present) < len(classes):
+        return "appended rows do not contain every target class"
+    return None
+
+
+def update_model(model, X: np.ndarray, y: np.ndarray, rows_seen: int, random_state: int = 0) -> Dict[str, Any]:
+    """Update `model` in place with appended rows; returns what was done."""
+    strategy = update_strategy(model)
+    estimator = _final_step(model)
+    share = len(X) / max(rows_seen, 1)
+
+    if strategy == "add_trees":
+        added = max(MIN_NEW_ESTIMATORS, math.ceil(len(estimator.estimators_) * share))
+        estimator.set_params(warm_start=True, n_estimators=len(estimator.estimators_) + added)
+        estimator.fit(X, y)
+    elif strategy == "boost":
+        before = estimator.n_iter_
+        estimator.set_params(warm_start=True, max_iter=before + max(MIN_NEW_ESTIMATORS, math.ceil(before * share)))
+        estimator.fit(X, y)
+        # Early stopping may end the new iterations sooner
+        added = estimator.n_iter_ - before
+    else:
+        # Earlier pipeline steps (the scaler) stay as fitted
+        for _, step in getattr(model, "steps", [])[:-1]:
+            X = step.transform(X)
+        # partial_fit has no validation split to stop early on
+        if getattr(estimator, "early_stopping", False):
+            estimator.set_params(early_stopping=False)
+        rng = np.random.default_rng(random_state)
+        for _ in range(PARTIAL_FIT_EPOCHS):
+            order = rng.permutation(len(X))
+            estimator.partial_fit(X[order], y[order])
+        added = PARTIAL_FIT_EPOCHS
+    return {"strategy": strategy, "added": int(added)}
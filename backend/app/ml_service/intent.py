@@ -0,0 +1,251 @@
+"""
+Prompt intent router: turns a free-text prompt into a training plan (task
+type, target column hints, candidate model families) without randomness.
+
+The catalog's phrases are compiled once into an Aho-Corasick automaton over
+word tokens, so a prompt is scanned in a single pass however many phrases
+the catalog holds. Phrases may carry a {target} slot ("predict {target}",
+"{target} prediction"): the words filling the slot become hints for the
+target column. Plans are memoized per normalized prompt.
+"""
+import json
+import os
+import re
+from collections import Counter, deque
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Memoized plans, keyed by the prompt's normalized tokens
+INTENT_CACHE_SIZE = int(os.getenv("INTENT_CACHE_SIZE", "10000"))
+# Optional JSON file of extra catalog rules, same shape as CATALOG entries
+INTENT_CATALOG_FILE = os.getenv("INTENT_CATALOG_FILE")
+
+FAMILIES = ("Random Forest", "Gradient Boosting", "Neural Network", "SVM", "Logistic Regression")
+DEFAULT_TASK = "classification"
+MAX_TARGET_TOKENS = 3
+
+# Each rule lists phrases and what matching one implies:
+#   task:     vote (with weight, default 1) for classification / regression / clustering
+#   families: model families to try first; exclude: families to leave out
+# A {target} slot in a phrase marks where the prompt names the target.
+CATALOG: List[Dict[str, Any]] = [
+    {"task": "classification", "weight": 2, "phrases": [
+        "classify", "classification", "classifier", "categorize", "categorise", "label",
+        "detect", "detection", "identify", "recognize", "flag", "is it", "yes or no",
+    ]},
+    {"task": "classification", "phrases": [
+        "whether", "which category", "which class", "spam", "fraud", "fraudulent", "churn",
+        "sentiment", "default", "diagnose", "approve", "approval",
+    ]},
+    {"task": "regression", "weight": 2, "phrases": [
+        "regression", "forecast", "forecasting", "estimate", "how much", "how many", "how long",
+    ]},
+    {"task": "regression", "phrases": [
+        "price", "prices", "cost", "revenue", "sales", "demand", "amount", "value", "duration",
+        "time", "temperature", "score", "rate", "quantity", "count", "age", "salary", "income",
+    ]},
+    {"task": "regression", "weight": 0.5, "phrases": ["predict", "prediction", "project"]},
+    {"task": "clustering", "weight": 3, "phrases": [
+        "cluster", "clustering", "segment", "segmentation", "group similar", "unsupervised",
+    ]},
+    {"phrases": [
+        "predict {target}", "forecast {target}", "estimate {target}", "classify {target}",
+        "detect {target}", "identify {target}", "whether {target}", "target {target}",
+        "how many {target}", "how much {target}",
+        "{target} prediction", "{target} forecast", "{target} classification", "{target} detection",
+    ]},
+    {"families": ["Logistic Regression", "Random Forest"], "phrases": [
+        "interpretable", "explainable", "explain", "simple model", "baseline", "coefficients",
+    ]},
+    {"families": ["Gradient Boosting", "Random Forest"], "phrases": [
+        "tabular", "accurate", "accuracy", "best model", "boosting", "xgboost", "lightgbm",
+    ]},
+    {"families": ["Neural Network"], "phrases": ["neural", "deep learning", "nonlinear", "complex patterns"]},
+    {"families": ["SVM"], "phrases": ["svm", "support vector", "small dataset", "few samples"]},
+    {"families": ["Random Forest"], "phrases": ["random forest", "robust", "noisy", "outliers"]},
+    {"families": ["Logistic Regression", "Gradient Boosting"], "exclude": ["SVM"], "phrases": [
+        "large dataset", "big data", "millions", "fast", "quick", "real time", "low latency",
+    ]},
+]
+
+# Words that end a {target} slot
+STOP_WORDS = frozenset({
+    "from", "using", "use", "with", "based", "given", "for", "by", "in", "on", "of", "and", "or",
+    "to", "at", "per", "into", "via", "data", "dataset", "features", "model", "a", "an", "the",
+    "which", "whether", "will", "if", "is", "are", "be", "my", "our", "their", "each", "every",
+})
+# Words skipped at the start of a slot ("predict the price" -> "price")
+LEADING_WORDS = frozenset({"a", "an", "the", "which", "whether", "if", "my", "our", "their", "each", "every"})
+SLOT = "{target}"
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class PromptPlan:
+    """What to train for a prompt. Shared through the memo cache, so treat as read-only."""
+
+    __slots__ = ("task_type", "confidence", "families", "target_hints", "matched")
+
+    def __init__(self, task_type: str, confidence: float, families: Tuple[str, ...],
+                 target_hints: Tuple[str, ...], matched: Tuple[str, ...]):
+        self.task_type = task_type
+        self.confidence = confidence
+        self.families = families
+        self.target_hints = target_hints
+        self.matched = matched
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "task_type": self.task_type,
+            "confidence": self.confidence,
+            "families": list(self.families),
+            "target_hints": list(self.target_hints),
+            "matched": list(self.matched),
+        }
+
+
+class IntentRouter:
+    """
+    Compiled catalog. Building the automaton is the only non-trivial cost;
+    routing a prompt is one pass over its tokens plus a memo lookup.
+    """
+
+    def __init__(self, catalog: Iterable[Dict[str, Any]] = CATALOG, cache_size: int = INTENT_CACHE_SIZE):
+        self.rules = list(catalog)
+        self._compile()
+        self._route_tokens = lru_cache(maxsize=cache_size)(self._plan)
+
+    def _compile(self):
+        # Node 0 is the root; each node has token transitions, a failure
+        # link and the (rule, phrase length, slot side, phrase) ending there
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, int, Optional[str], str]]] = [[]]
+        for index, rule in enumerate(self.rules):
+            for phrase in rule["phrases"]:
+                tokens = phrase.split()
+                slot = "after" if tokens[-1] == SLOT else "before" if tokens[0] == SLOT else None
+                words = [t for t in tokens if t != SLOT]
+                node = 0
+                for word in words:
+                    if word not in self._goto[node]:
+                        self._goto.append({})
+                        self._fail.append(0)
+                        self._out.append([])
+                        self._goto[node][word] = len(self._goto) - 1
+                    node = self._goto[node][word]
+                self._out[node].append((index, len(words), slot, " ".join(words)))
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and word not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(word, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def matches(self, tokens: List[str]):
+        """(start, end, rule index, slot side, phrase) for every catalog phrase in `tokens`."""
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(token, 0)
+            for index, length, slot, phrase in self._out[node]:
+                yield i - length + 1, i + 1, index, slot, phrase
+
+    def route(self, prompt: str) -> PromptPlan:
+        return self._route_tokens(tuple(tokenize(prompt)))
+
+    def route_many(self, prompts: Iterable[str]) -> List[PromptPlan]:
+        """Plans for many prompts; repeated prompts are planned once."""
+        return [self._route_tokens(tuple(tokenize(prompt))) for prompt in prompts]
+
+    def cache_info(self):
+        return self._route_tokens.cache_info()
+
+    def _plan(self, tokens: Tuple[str, ...]) -> PromptPlan:
+        votes: Counter = Counter()
+        boosts: Counter = Counter()
+        excluded = set()
+        hints: List[str] = []
+        matched: List[str] = []
+        for start, end, index, slot, phrase in self.matches(list(tokens)):
+            rule = self.rules[index]
+            matched.append(phrase)
+            if "task" in rule:
+                votes[rule["task"]] += rule.get("weight", 1)
+            for rank, family in enumerate(rule.get("families", [])):
+                boosts[family] += 1 - rank / 10
+            excluded.update(rule.get("exclude", []))
+            if slot:
+                hint = _slot_words(tokens, start, end, slot)
+                if hint and hint not in hints:
+                    hints.append(hint)
+
+        if votes:
+            # Ties go to the task listed first in the catalog
+            order = {rule["task"]: i for i, rule in reversed(list(enumerate(self.rules))) if "task" in rule}
+            task_type = max(votes, key=lambda task: (votes[task], -order[task]))
+            confidence = round(votes[task_type] / sum(votes.values()), 3)
+        else:
+            task_type, confidence = DEFAULT_TASK, 0.0
+
+        families = sorted((f for f in FAMILIES if f not in excluded), key=lambda f: (-boosts[f], FAMILIES.index(f)))
+        return PromptPlan(task_type, confidence, tuple(families or FAMILIES), tuple(hints), tuple(dict.fromkeys(matched)))
+
+
+def _slot_words(tokens: Tuple[str, ...], start: int, end: int, side: str) -> str:
+    """Words filling a {target} slot next to a match, up to a stop word."""
+    words = []
+    if side == "after":
+        i = end
+        while i < len(tokens) and tokens[i] in LEADING_WORDS:
+            i += 1
+        while i < len(tokens) and tokens[i] not in STOP_WORDS and len(words) < MAX_TARGET_TOKENS:
+            words.append(tokens[i])
+            i += 1
+    else:
+        i = start - 1
+        while i >= 0 and tokens[i] not in STOP_WORDS and len(words) < MAX_TARGET_TOKENS:
+            words.insert(0, tokens[i])
+            i -= 1
+    return " ".join(words)
+
+
+def match_target(hints: Iterable[str], columns: List[str]) -> Optional[str]:
+    """
+    Column named by the first hint that names one. A column matches when all
+    its words appear in the hint ("customer churn" -> churn); the longest
+    such column wins.
+    """
+    column_words = [(name, {_stem(w) for w in tokenize(name)}) for name in columns]
+    for hint in hints:
+        hint_words = {_stem(w) for w in hint.split()}
+        named = [(len(words), name) for name, words in column_words if words and words <= hint_words]
+        if named:
+            return max(named)[1]
+    return None
+
+
+def _stem(word: str) -> str:
+    """Crude plural folding so "prices" names a "price" column."""
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+
+
+def load_catalog() -> List[Dict[str, Any]]:
+    catalog = list(CATALOG)
+    if INTENT_CATALOG_FILE:
+        with open(INTENT_CATALOG_FILE) as f:
+            catalog.extend(json.load(f))
+    return catalog
+
+
+intent_router = IntentRouter(load_catalog())
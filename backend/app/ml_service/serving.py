@@ -0,0 +1,73 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+if TYPE_CHECKING:
+    # numpy (and the feature stage) load with the first bundle, not with the API
+    import numpy as np
+    from .features import FeatureTransform
+
+
+def predict_path(job_id) -> str:
+    return f"/api/models/{job_id}/predict"
+
+
+def download_path(job_id) -> str:
+    return f"/api/models/{job_id}/download"
+
+
+class ModelBundle:
+    """
+    A fitted estimator together with the fitted FeatureTransform that turns
+    raw input rows into its feature matrix.
+    """
+
+    def __init__(
+        self,
+        model,
+        feature_transform: "FeatureTransform",
+        task_type: str,
+        class_labels: Optional[List[str]] = None,
+    ):
+        self.model = model
+        self.feature_transform = feature_transform
+        self.task_type = task_type
+        self.class_labels = class_labels
+
+    def compiled(self) -> Optional["ModelBundle"]:
+        """
+        The bundle with its tree ensemble compiled to flat arrays for
+        serving (see ml_service.compiled), or None for other models.
+        """
+        from .compiled import compile_model
+
+        model = compile_model(self.model)
+        if model is None:
+            return None
+        return ModelBundle(model, self.feature_transform, self.task_type, class_labels=self.class_labels)
+
+    @property
+    def features(self) -> List[str]:
+        return self.feature_transform.features
+
+    def transform(self, rows: List[Dict[str, Any]]) -> "np.ndarray":
+        """Feature matrix for `rows`, built column by column."""
+        return self.feature_transform.transform_rows(rows)
+
+    def label(self, prediction):
+        import numpy as np
+
+        if self.task_type == "regression":
+            return float(prediction)
+        if self.class_labels is not None:
+            return self.class_labels[int(prediction)]
+        return prediction.item() if isinstance(prediction, np.generic) else prediction
+
+    def predict(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        X = self.transform(rows)
+        predictions = self.model.predict(X)
+        confidence = [None] * len(rows)
+        if self.task_type != "regression" and hasattr(self.model, "predict_proba"):
+            confidence = self.model.predict_proba(X).max(axis=1).tolist()
+        return [
+            {"prediction": self.label(p), "confidence": c}
+            for p, c in zip(predictions, confidence)
+        ]
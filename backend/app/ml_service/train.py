@@ -1,113 +1,634 @@
-import random
-import uuid
-from typing import Dict, Any, List
+import hashlib
+import os
+import time
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import numpy as np
+
+from .engine import CV_FOLDS, ModelSearch
+from .features import FeatureTransform, Table, feature_cache, feature_config
+from .importance import feature_importance as feature_importance_for
+from .incremental import update_blocker, update_model
+from .intent import FAMILIES, intent_router, match_target
+from .profiling import profile_dataset, profile_table, select_features
+from .serving import ModelBundle
+from .tuning import Budget, SuccessiveHalvingSearch, DEFAULT_TIME_BUDGET
+
+# Rows generated for prompts that do not come with a dataset
+SYNTHETIC_ROWS = int(os.getenv("ML_SYNTHETIC_ROWS", "5000"))
+# Retraining: population stability index of any column above which appended
+# rows count as drifted, and the score drop on them, that force a full retrain
+RETRAIN_DRIFT_THRESHOLD = float(os.getenv("RETRAIN_DRIFT_THRESHOLD", "0.2"))
+RETRAIN_MAX_SCORE_DROP = float(os.getenv("RETRAIN_MAX_SCORE_DROP", "0.05"))
+# Fewer appended rows than this are not worth an update; the model is retrained
+MIN_APPENDED_ROWS = int(os.getenv("RETRAIN_MIN_APPENDED_ROWS", "50"))
+
+def format_size(n_bytes: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n_bytes < 1024:
+            return f"{n_bytes:.0f}{unit}" if unit == "B" else f"{n_bytes:.1f}{unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f}GB"
 
 class MLTrainer:
     """
-    Placeholder ML training service.
-    This will be replaced with actual ML training logic.
+    ML training service.
+    Analyzes the prompt, prepares a dataset and searches the candidate
+    model families in parallel, keeping the best cross-validated model.
     """
     
-    def __init__(self, prompt: str):
+    def __init__(
+        self,
+        prompt: str,
+        max_workers: Optional[int] = None,
+        time_budget: Optional[float] = None,
+        cpu_budget: Optional[float] = None,
+        dataset=None,
+        target_column: Optional[str] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+        checkpoints=None,
+    ):
         self.prompt = prompt
-        self.model_types = [
-            "Random Forest",
-            "XGBoost",
-            "Neural Network",
-            "SVM",
-            "Logistic Regression"
-        ]
+        self.dataset = dataset  # ColumnarDataset from the dataset store, if one was uploaded
+        self.target_column = target_column
+        self.class_labels: Optional[List[str]] = None
+        # Input encoding the fitted model expects, kept for serving
+        self.target: Optional[str] = None
+        self.feature_transform: Optional[FeatureTransform] = None
+        self.features_cached = False
+        self.features_key: Optional[str] = None  # feature cache key of an uploaded dataset's matrix
+        self.max_workers = max_workers
+        self.time_budget = time_budget or DEFAULT_TIME_BUDGET
+        self.cpu_budget = cpu_budget
+        self.cancelled = cancelled  # polled during training; True stops it with JobCancelled
+        self.stage_timings: Dict[str, float] = {}  # seconds per pipeline stage, filled by train_model
+        # Durable store of finished stage results (workers.recovery.JobCheckpoints), if any
+        self.checkpoints = checkpoints
+        self.resumed: List[str] = []  # checkpoints an interrupted attempt left that this run reused
+        self.model_types = list(FAMILIES)
+        # Seed everything from the prompt so identical prompts train identically
+        self.random_state = int(hashlib.sha256(prompt.encode()).hexdigest()[:8], 16)
         
     def analyze_prompt(self) -> Dict[str, Any]:
         """
-        Analyze the user's prompt to determine the best ML approach.
-        In a real implementation, this would use NLP to understand the task.
+        Training plan for the prompt from the intent router: task type,
+        target column hints and model families in the order to try them.
+        Deterministic and memoized, so replayed prompts cost a cache lookup.
         """
-        # Simple keyword analysis for demo
-        prompt_lower = self.prompt.lower()
-        
-        if any(word in prompt_lower for word in ["classify", "classification", "detect", "identify"]):
-            task_type = "classification"
-        elif any(word in prompt_lower for word in ["predict", "forecast", "estimate", "regression"]):
-            task_type = "regression"
-        elif any(word in prompt_lower for word in ["cluster", "group", "segment"]):
-            task_type = "clustering"
-        else:
-            task_type = "classification"  # default
-            
+        plan = intent_router.route(self.prompt)
         return {
-            "task_type": task_type,
-            "suggested_model": random.choice(self.model_types),
-            "confidence": random.uniform(0.7, 0.95)
+            **plan.to_dict(),
+            "suggested_model": plan.families[0],
         }
     
-    def generate_mock_results(self) -> Dict[str, Any]:
+    def resolve_target(self) -> str:
         """
-        Generate mock training results.
-        In production, this would contain actual ML training results.
+        Explicit target column, else the column the prompt's target hints
+        name, else any column named in the prompt, else the last column.
         """
-        analysis = self.analyze_prompt()
-        
-        # Generate realistic-looking metrics
-        accuracy = random.uniform(0.75, 0.95)
-        precision = random.uniform(0.7, 0.9)
-        recall = random.uniform(0.7, 0.9)
-        f1_score = 2 * (precision * recall) / (precision + recall)  # Harmonic mean
-        
-        # Mock feature importance
-        features = [
-            "feature_1", "feature_2", "feature_3", "feature_4", "feature_5",
-            "feature_6", "feature_7", "feature_8", "feature_9", "feature_10"
-        ]
-        
-        feature_importance = [
-            {
-                "feature": feature,
-                "importance": random.uniform(0.05, 0.3)
+        columns = self.dataset.columns
+        if self.target_column:
+            return self.target_column
+        hinted = match_target(intent_router.route(self.prompt).target_hints, columns)
+        if hinted:
+            return hinted
+        prompt_lower = self.prompt.lower()
+        for name in columns:
+            if name.lower() in prompt_lower:
+                return name
+        return columns[-1]
+
+    def prepare_dataset(self, task_type: str):
+        """Load the data and engineer features; returns (X, y, features, task_type)."""
+        table, y, task_type = self.load_dataset(task_type)
+        X, features = self.engineer_features(table)
+        return X, y, features, task_type
+
+    def load_dataset(self, task_type: str):
+        """
+        Raw feature columns and the target: returns (table, y, task_type).
+        Uploaded datasets are read column by column from the memory-mapped
+        store, and only when the feature stage needs them; without one, a
+        synthetic dataset shaped by the task type stands in.
+        """
+        if self.dataset is not None:
+            return self._load_columnar(task_type)
+
+        from sklearn.datasets import make_classification, make_regression
+
+        n_features = 10
+        if task_type == "regression":
+            X, y = make_regression(
+                n_samples=SYNTHETIC_ROWS, n_features=n_features, n_informative=6,
+                noise=10.0, random_state=self.random_state % 2**32
+            )
+        else:
+            X, y = make_classification(
+                n_samples=SYNTHETIC_ROWS, n_features=n_features, n_informative=6,
+                random_state=self.random_state % 2**32
+            )
+        features = [f"feature_{i+1}" for i in range(n_features)]
+        return Table.from_matrix(X.astype(np.float64), features), y, task_type
+
+    def _load_columnar(self, task_type: str, start_row: int = 0):
+        dataset = self.dataset
+        self.target = target = self.resolve_target()
+        target_values = dataset.column(target)[start_row:]
+
+        if dataset.kind(target) == "categorical":
+            task_type = "classification"
+            mask = target_values >= 0
+            self.class_labels = dataset.categories(target)
+        else:
+            mask = ~np.isnan(target_values)
+            # Many distinct numeric targets means the prompt's "classify" was really a regression
+            if task_type == "classification" and len(np.unique(target_values[:100000][mask[:100000]])) > 50:
+                task_type = "regression"
+
+        features = [name for name in dataset.columns if name != target]
+        y = np.asarray(target_values[mask])
+        if task_type == "classification" and dataset.kind(target) == "categorical":
+            y = y.astype(np.int64)
+        return Table.from_dataset(dataset, features, mask, start=start_row), y, task_type
+
+    def engineer_features(self, table: Table, fit_rows: Optional[np.ndarray] = None):
+        """
+        Fit the feature transform on `fit_rows` (all rows if None) and build
+        the matrix for every row: returns (X, feature names). For uploaded
+        datasets the result is cached by dataset hash, target, config and the
+        fitted rows, so a repeated job reuses the fitted transform and matrix
+        instead of recomputing them.
+        """
+        config = feature_config()
+        if self.dataset is not None:
+            fitted = None
+            if fit_rows is not None:
+                fitted = hashlib.sha256(np.asarray(fit_rows, dtype=np.int64).tobytes()).hexdigest()
+            key = feature_cache.key(
+                self.dataset.content_hash, self.target, {**config, "columns": table.names, "fit_rows": fitted}
+            )
+            X, self.feature_transform, self.features_cached = feature_cache.get_or_build(key, table, config, fit_rows)
+            self.features_key = key
+        else:
+            self.feature_transform = FeatureTransform.fit(table if fit_rows is None else table.take(fit_rows), config)
+            X = self.feature_transform.transform_table(table)
+        return X, self.feature_transform.features
+
+    def profile_data(self, table: Table) -> Dict[str, Any]:
+        """
+        Column profiles and the feature selection they drive: which columns
+        feature engineering uses and why the others are left out. Uploaded
+        datasets were profiled when they were converted; synthetic data is
+        profiled here.
+        """
+        if self.dataset is not None:
+            profiles, rows = profile_dataset(self.dataset), self.dataset.n_rows
+        else:
+            profiles, rows = profile_table(table), table.n_rows
+        selected, dropped = select_features(profiles, exclude=[self.target] if self.target else [])
+        return {"rows": rows, "target": self.target, "columns": profiles, "selected": selected, "dropped": dropped}
+
+    def evaluate(self, model, task_type: str, X_test: np.ndarray, y_test: np.ndarray, features: List[str],
+                 fit_time: Optional[float] = None, predictor=None) -> Dict[str, Any]:
+        """
+        Holdout metrics, importances and sample predictions for the winning
+        model. Permutation importance is held to about `fit_time`, the
+        seconds the model took to fit. Sample predictions come from
+        `predictor`, the compiled model that will serve, when given.
+        """
+        from sklearn import metrics as skm
+
+        predictions = model.predict(X_test)
+        probabilities = model.predict_proba(X_test) if hasattr(model, "predict_proba") else None
+
+        if task_type == "regression":
+            mse = skm.mean_squared_error(y_test, predictions)
+            accuracy = skm.r2_score(y_test, predictions)
+            loss = mse
+            metrics = {
+                "r2": accuracy,
+                "mae": skm.mean_absolute_error(y_test, predictions),
+                "rmse": float(np.sqrt(mse)),
             }
-            for feature in random.sample(features, k=random.randint(5, 8))
-        ]
-        
-        # Sort by importance
-        feature_importance.sort(key=lambda x: x["importance"], reverse=True)
-        
-        # Mock predictions
-        predictions_sample = [
-            {
-                "input": f"Sample input {i+1}",
-                "predicted": f"Class {random.choice(['A', 'B', 'C'])}",
-                "confidence": random.uniform(0.6, 0.95)
+        else:
+            accuracy = skm.accuracy_score(y_test, predictions)
+            loss = skm.log_loss(y_test, probabilities, labels=model.classes_) if probabilities is not None else 1 - accuracy
+            metrics = {
+                "precision": skm.precision_score(y_test, predictions, average="weighted", zero_division=0),
+                "recall": skm.recall_score(y_test, predictions, average="weighted", zero_division=0),
+                "f1_score": skm.f1_score(y_test, predictions, average="weighted", zero_division=0),
+                "confusion_matrix": skm.confusion_matrix(y_test, predictions).tolist(),
             }
-            for i in range(5)
-        ]
-        
+
+        feature_importance, importance_info = feature_importance_for(
+            model, task_type, X_test, y_test, features,
+            fit_time=fit_time, max_workers=self.max_workers,
+        )
+
+        n_sample = min(5, len(X_test))
+        sample_predictions = predictions[:n_sample]
+        sample_probabilities = probabilities[:n_sample] if probabilities is not None else None
+        if predictor is not None:
+            sample_predictions = predictor.predict(X_test[:n_sample])
+            if probabilities is not None:
+                sample_probabilities = predictor.predict_proba(X_test[:n_sample])
+        predictions_sample = []
+        for i in range(n_sample):
+            confidence = float(sample_probabilities[i].max()) if sample_probabilities is not None else None
+            predictions_sample.append({
+                "input": ", ".join(f"{f}={v:.3g}" for f, v in zip(features[:4], X_test[i])),
+                "predicted": self._label(sample_predictions[i], task_type),
+                "confidence": confidence,
+            })
+
         return {
-            "model_type": analysis["suggested_model"],
-            "accuracy": accuracy,
-            "loss": random.uniform(0.1, 0.5),
-            "training_time": random.uniform(30, 300),  # seconds
-            "dataset_size": random.randint(1000, 50000),
-            "features_used": random.sample(features, k=random.randint(5, 10)),
-            "model_size": f"{random.randint(10, 500)}MB",
-            "download_url": f"https://api.automlgpt.com/models/{uuid.uuid4()}/download",
-            "api_endpoint": f"https://api.automlgpt.com/models/{uuid.uuid4()}/predict",
-            "metrics": {
-                "precision": precision,
-                "recall": recall,
-                "f1_score": f1_score,
-                "confusion_matrix": [
-                    [random.randint(80, 120), random.randint(5, 20)],
-                    [random.randint(5, 20), random.randint(80, 120)]
-                ]
-            },
+            "accuracy": float(accuracy),
+            "loss": float(loss),
+            "metrics": {k: (float(v) if isinstance(v, (float, np.floating)) else v) for k, v in metrics.items()},
             "feature_importance": feature_importance,
-            "predictions_sample": predictions_sample
+            "importance_info": importance_info,
+            "predictions_sample": predictions_sample,
         }
-    
-    def train_model(self) -> Dict[str, Any]:
+
+    def _label(self, prediction, task_type: str) -> str:
+        if task_type == "regression":
+            return f"{prediction:.4g}"
+        if self.class_labels is not None:
+            return self.class_labels[int(prediction)]
+        return f"Class {prediction}"
+
+    def train_model(self, on_stage: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        Run the full pipeline: analyze the prompt, prepare data, search the
+        candidate families in a process pool, tune the winning family with
+        successive halving, refit it and evaluate it on a holdout split.
+        Everything up to the refit runs under the job's time/CPU budget.
+        `on_stage(name, progress)` is called as each stage starts; wall time
+        per stage is kept in `self.stage_timings` (also on failure).
+
+        With `checkpoints`, each candidate's CV result, each halving rung,
+        the refit model and the evaluation are saved as they finish, and a
+        rerun of the same job skips whatever an earlier attempt completed.
+        Data preparation is rerun: it is deterministic, and uploaded
+        datasets reuse their engineered features from the feature cache.
+        """
+        return self._run_stages(self._train, on_stage)
+
+    def prepare_training(self, on_stage: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+        """
+        The stages of train_model before the model search, for searching
+        elsewhere (the distributed mode in workers.ml_tasks): the feature
+        matrix and its split, candidate families and the trainer state the
+        final stages need. Pass it to finish_training with the search's ranking.
+        """
+        def prepare(stage, budget, seed):
+            prepared = self._prepare(stage, seed)
+            prepared["families"] = ModelSearch(prepared["task_type"]).candidates(prepared["families"], len(prepared["train_rows"]))
+            return {
+                **prepared,
+                "feature_transform": self.feature_transform,
+                "class_labels": self.class_labels,
+                "target": self.target,
+                "features_cached": self.features_cached,
+                "features_key": self.features_key,
+            }
+        return self._run_stages(prepare, on_stage)
+
+    def finish_training(
+        self,
+        prepared: Dict[str, Any],
+        ranking: List[Dict[str, Any]],
+        spent: Tuple[float, float] = (0.0, 0.0),
+        on_stage: Optional[Callable[[str, int], None]] = None,
+    ) -> Dict[str, Any]:
         """
-        Actual model training would happen here.
-        This is where you'd integrate with scikit-learn, TensorFlow, PyTorch, etc.
+        The stages of train_model after the model search (tuning, refit,
+        evaluation) on data from prepare_training, given the candidates'
+        `ranking`. `spent` is the (wall, CPU) seconds the job already used.
         """
-        # Placeholder for actual ML training
-        return self.generate_mock_results()
\ No newline at end of file
+        self.feature_transform = prepared["feature_transform"]
+        self.class_labels = prepared["class_labels"]
+        self.target = prepared["target"]
+        self.features_cached = prepared["features_cached"]
+
+        def finish(stage, budget, seed):
+            return self._finish(stage, budget, seed, prepared, ranking)
+        return self._run_stages(finish, on_stage, spent)
+
+    def retrain_model(
+        self,
+        bundle: ModelBundle,
+        base_rows: int,
+        base_model_type: str,
+        base_score: float,
+        drift_threshold: Optional[float] = None,
+        on_stage: Optional[Callable[[str, int], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Retrain a model on a dataset that grew past its first `base_rows`
+        rows. The appended rows are encoded with the model's fitted feature
+        transform and checked for drift; unless drift (or a score drop on
+        those rows) passes the threshold, the model is updated in place via
+        warm start / partial_fit and the transform's column statistics are
+        updated with the new rows only. Otherwise, or if the update lowers
+        the score on held-out appended rows, the full pipeline runs on the
+        whole dataset. The result says which happened under "retrain".
+        """
+        def retrain(stage, budget, seed):
+            return self._retrain(
+                stage, budget, seed, bundle, base_rows, base_model_type, base_score,
+                drift_threshold or RETRAIN_DRIFT_THRESHOLD
+            )
+        return self._run_stages(retrain, on_stage)
+
+    def _run_stages(
+        self,
+        pipeline: Callable,
+        on_stage: Optional[Callable[[str, int], None]],
+        spent: Tuple[float, float] = (0.0, 0.0),
+    ) -> Dict[str, Any]:
+        spent_time, spent_cpu = map(max, self._resume("budget") or (0.0, 0.0), spent)
+        budget = Budget(self.time_budget, self.cpu_budget, self.cancelled, spent_time, spent_cpu)
+        seed = self.random_state % 2**32
+
+        self.stage_timings = {}
+        current = {"key": None, "start": 0.0}
+
+        def stage(key, name, progress):
+            end_stage()
+            budget.raise_if_cancelled()
+            current.update(key=key, start=time.perf_counter())
+            if on_stage:
+                on_stage(name, progress)
+
+        def end_stage():
+            if current["key"] is not None:
+                self.stage_timings[current["key"]] = time.perf_counter() - current["start"]
+                current["key"] = None
+
+        try:
+            return pipeline(stage, budget, seed)
+        finally:
+            end_stage()
+
+    def _retrain(self, stage, budget: Budget, seed: int, bundle: ModelBundle, base_rows: int,
+                 base_model_type: str, base_score: float, drift_threshold: float) -> Dict[str, Any]:
+        from sklearn.model_selection import train_test_split
+
+        stage("dataset_prep", "Loading appended rows...", 20)
+        task_type = bundle.task_type
+        table, y, _ = self._load_columnar(task_type, start_row=base_rows)
+        reason = None
+        if bundle.class_labels is not None:
+            # Target codes of the grown dataset -> the model's class indices
+            index = {label: i for i, label in enumerate(bundle.class_labels)}
+            remap = np.array([index.get(label, -1) for label in self.class_labels], dtype=np.int64)
+            y = remap[y] if len(remap) else y
+            self.class_labels = bundle.class_labels
+        if table.n_rows < MIN_APPENDED_ROWS:
+            reason = f"only {table.n_rows} appended rows"
+
+        stage("feature_engineering", "Encoding appended rows...", 30)
+        transform = bundle.feature_transform
+        drift = {}
+        if reason is None:
+            X = transform.transform_table(table)
+            X_update, X_test, y_update, y_test = train_test_split(X, y, test_size=0.2, random_state=seed)
+
+            stage("drift_check", "Checking for drift...", 40)
+            drift = transform.drift(table)
+            score = self.score(bundle.model, task_type, X, y)
+            drifted = max(drift, key=drift.get) if drift else None
+            if (y < 0).any():
+                reason = "appended rows contain new target classes"
+            elif drifted and drift[drifted] > drift_threshold:
+                reason = f"drift in {drifted} (PSI {drift[drifted]:.2f} > {drift_threshold:.2f})"
+            elif base_score - score > RETRAIN_MAX_SCORE_DROP:
+                reason = f"score on appended rows fell from {base_score:.3f} to {score:.3f}"
+            else:
+                reason = update_blocker(bundle.model, y_update)
+
+        info = {"rows_added": table.n_rows, "drift": {k: round(v, 4) for k, v in drift.items()}}
+
+        def full_retrain(reason):
+            result = self._train(stage, budget, seed)
+            result["retrain"] = {**info, "mode": "full", "reason": reason}
+            return result
+
+        if reason is not None:
+            return full_retrain(reason)
+
+        stage("training", f"Updating {base_model_type} with {table.n_rows} appended rows...", 60)
+        model = bundle.model
+        before = self.score(model, task_type, X_test, y_test)
+        fit_start = time.perf_counter()
+        update = update_model(model, X_update, y_update, transform.rows_seen, seed)
+        fit_time = time.perf_counter() - fit_start
+        # The update changed the model in place; the full pipeline starts over from the data
+        after = self.score(model, task_type, X_test, y_test)
+        if before - after > RETRAIN_MAX_SCORE_DROP:
+            return full_retrain(f"update lowered the score on held-out appended rows from {before:.3f} to {after:.3f}")
+        transform.update_stats(table)
+        self.feature_transform = transform
+
+        stage("evaluation", "Evaluating performance...", 90)
+        features = transform.features
+        bundle = ModelBundle(model, transform, task_type, class_labels=self.class_labels)
+        serving = bundle.compiled()
+        evaluation = self.evaluate(
+            model, task_type, X_test, y_test, features, fit_time=fit_time,
+            predictor=serving.model if serving else None,
+        )
+
+        return {
+            "model_type": base_model_type,
+            "task_type": task_type,
+            "accuracy": evaluation["accuracy"],
+            "loss": evaluation["loss"],
+            "training_time": budget.elapsed,
+            "cpu_time": budget.cpu_used,
+            "time_budget": self.time_budget,
+            "cpu_budget": self.cpu_budget,
+            "dataset_size": self.dataset.n_rows,
+            "features_used": features,
+            "metrics": evaluation["metrics"],
+            "feature_importance": evaluation["feature_importance"],
+            "importance_info": evaluation.get("importance_info"),
+            "predictions_sample": evaluation["predictions_sample"],
+            "best_params": None,
+            "tuning": {"configs_evaluated": 0, "rungs": []},
+            "candidates": [],
+            "features_cached": False,
+            "data_profile": None,
+            "retrain": {**info, "mode": "incremental", **update},
+            "bundle": bundle,
+            "serving_bundle": serving,
+        }
+
+    def _resume(self, key: str):
+        """What an earlier attempt checkpointed under `key`, or None."""
+        if self.checkpoints is None:
+            return None
+        value = self.checkpoints.load(key)
+        if value is not None and key != "budget":
+            self.resumed.append(key)
+        return value
+
+    def _checkpoint(self, key: str, value, budget: Budget):
+        if self.checkpoints is not None:
+            self.checkpoints.save({key: value, "budget": (budget.elapsed, budget.cpu_used)})
+
+    @staticmethod
+    def score(model, task_type: str, X: np.ndarray, y: np.ndarray) -> float:
+        """The metric the search ranks by: R² for regression, accuracy otherwise."""
+        from sklearn import metrics as skm
+
+        if len(y) == 0:
+            return float("nan")
+        predictions = model.predict(X)
+        if task_type == "regression":
+            return float(skm.r2_score(y, predictions))
+        return float(skm.accuracy_score(y, predictions))
+
+    def _train(self, stage, budget: Budget, seed: int) -> Dict[str, Any]:
+        prepared = self._prepare(stage, seed)
+
+        stage("training", "Training model...", 40)
+        families = prepared["families"]
+        completed = [r for r in (self._resume(f"candidate:{family}") for family in families) if r is not None]
+
+        def on_result(result):
+            # Failed candidates are tried again on resume
+            if "error" not in result:
+                self._checkpoint(f"candidate:{result['family']}", result, budget)
+
+        search = ModelSearch(prepared["task_type"], max_workers=self.max_workers, random_state=seed, budget=budget)
+        ranking = search.run(
+            prepared["X"], prepared["y"], families, on_result=on_result, completed=completed, rows=prepared["train_rows"]
+        )
+        return self._finish(stage, budget, seed, prepared, ranking)
+
+    def _prepare(self, stage, seed: int) -> Dict[str, Any]:
+        from sklearn.model_selection import train_test_split
+
+        stage("prompt_analysis", "Analyzing prompt...", 10)
+        analysis = self.analyze_prompt()
+        # Clustering prompts are trained as classification until unsupervised search lands
+        task_type = "regression" if analysis["task_type"] == "regression" else "classification"
+
+        stage("dataset_prep", "Preparing dataset...", 25)
+        table, y, task_type = self.load_dataset(task_type)
+
+        stage("profiling", "Profiling columns...", 28)
+        profile = self.profile_data(table)
+        if profile["selected"]:
+            table = table.select(profile["selected"])
+
+        stage("feature_engineering", "Engineering features...", 32)
+        # Hold out the test rows first, so imputation, scaling and category
+        # vocabularies are fitted on training rows only. Splitting row indices
+        # rather than X, which may be memory-mapped from the feature cache,
+        # lets the search gather the training rows into shared memory itself,
+        # and only the final fit holds them all in RAM
+        train_rows, test_rows = train_test_split(
+            np.arange(table.n_rows), test_size=0.2, random_state=seed,
+            stratify=y if task_type == "classification" else None
+        )
+        X, features = self.engineer_features(table, fit_rows=train_rows)
+        return {
+            "task_type": task_type,
+            "families": analysis["families"],
+            "X": X,
+            "y": y,
+            "train_rows": train_rows,
+            "test_rows": test_rows,
+            "X_test": X[test_rows],
+            "y_test": y[test_rows],
+            "features": features,
+            "dataset_size": int(len(X)),
+            "data_profile": profile,
+        }
+
+    def _finish(self, stage, budget: Budget, seed: int, prepared: Dict[str, Any], ranking: List[Dict[str, Any]]) -> Dict[str, Any]:
+        from .engine import build_estimator
+
+        task_type, features = prepared["task_type"], prepared["features"]
+        X, y, train_rows = prepared["X"], prepared["y"], prepared["train_rows"]
+        best = ranking[0]
+        if best["score"] == float("-inf"):
+            raise RuntimeError(f"All candidate models failed: {ranking[0].get('error')}")
+
+        stage("tuning", f"Tuning {best['family']} hyperparameters...", 60)
+        tuned = self._resume("tuning")
+        if tuned is not None:
+            best, tuning = tuned["best"], tuned["summary"]
+        else:
+            rung_state = self._resume("tuning_rung")
+            tuning = rung_state.pop("summary") if rung_state else {"configs_evaluated": 0, "rungs": []}
+
+            def on_rung(rung, n_rows, scored):
+                tuning["configs_evaluated"] += len(scored)
+                tuning["rungs"].append({"rows": n_rows, "configs": len(scored), "best_score": scored[0]["score"]})
+
+            def on_state(state):
+                self._checkpoint("tuning_rung", {**state, "summary": tuning}, budget)
+
+            tuner = SuccessiveHalvingSearch(
+                best["family"], task_type, budget, max_workers=self.max_workers, random_state=seed
+            )
+            best = tuner.run(
+                X, y, baseline=best, on_rung=on_rung, on_state=on_state, resume=rung_state, rows=train_rows
+            )
+            self._checkpoint("tuning", {"best": best, "summary": tuning}, budget)
+
+        stage("final_fit", "Fitting final model...", 80)
+        bundle = self._resume("final_fit")
+        if bundle is not None:
+            model = bundle.model
+            # Resumed past the fit: the search timed each family over its CV folds
+            fit_time = (ranking[0].get("fit_time") or 0.0) / CV_FOLDS
+        else:
+            model = build_estimator(best["family"], task_type, best["params"], seed)
+            fit_start = time.perf_counter()
+            model.fit(X[train_rows], y[train_rows])
+            fit_time = time.perf_counter() - fit_start
+            bundle = ModelBundle(model, self.feature_transform, task_type, class_labels=self.class_labels)
+            self._checkpoint("final_fit", bundle, budget)
+
+        stage("evaluation", "Evaluating performance...", 90)
+        # Tree ensembles are served compiled; cheap enough to redo on resume
+        serving = bundle.compiled()
+        evaluation = self._resume("evaluation")
+        if evaluation is None:
+            evaluation = self.evaluate(
+                model, task_type, prepared["X_test"], prepared["y_test"], features, fit_time=fit_time,
+                predictor=serving.model if serving else None,
+            )
+            self._checkpoint("evaluation", evaluation, budget)
+
+        return {
+            "model_type": best["family"],
+            "task_type": task_type,
+            "accuracy": evaluation["accuracy"],
+            "loss": evaluation["loss"],
+            "training_time": budget.elapsed,
+            "cpu_time": budget.cpu_used,
+            "time_budget": self.time_budget,
+            "cpu_budget": self.cpu_budget,
+            "dataset_size": prepared["dataset_size"],
+            "features_used": features,
+            "metrics": evaluation["metrics"],
+            "feature_importance": evaluation["feature_importance"],
+            "importance_info": evaluation.get("importance_info"),
+            "predictions_sample": evaluation["predictions_sample"],
+            "best_params": best["params"],
+            "tuning": tuning,
+            "candidates": [
+                {k: r.get(k) for k in ("family", "score", "score_std", "fit_time", "error") if k in r}
+                for r in ranking
+            ],
+            "features_cached": self.features_cached,
+            "data_profile": prepared["data_profile"],
+            "bundle": bundle,
+            "serving_bundle": serving,
+        }
@@ -0,0 +1,260 @@
+import math
+import os
+import time
+from concurrent.futures import wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Optional, Callable
+
+import numpy as np
+
+from .engine import (
+    CV_FOLDS,
+    SharedDataset,
+    _evaluate_candidate,
+    open_pool,
+    resolve_worker_count,
+    terminate_pool,
+)
+
+DEFAULT_TIME_BUDGET = float(os.getenv("ML_DEFAULT_TIME_BUDGET", "600"))
+# Configurations sampled for the first rung of successive halving
+HALVING_CONFIGS = int(os.getenv("ML_HALVING_CONFIGS", "27"))
+HALVING_ETA = int(os.getenv("ML_HALVING_ETA", "3"))
+# Smallest data subset a configuration is ever scored on
+HALVING_MIN_ROWS = int(os.getenv("ML_HALVING_MIN_ROWS", "300"))
+# Longest a search waits on its pool before checking whether the job was cancelled
+CANCEL_POLL_SECONDS = float(os.getenv("ML_CANCEL_POLL_SECONDS", "1"))
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Budget:
+    """
+    Wall-clock and CPU allowance for one job.
+    CPU time is charged explicitly: the parent process plus whatever pool
+    workers report for the evaluations they ran. `cancelled` is polled by
+    the search loops; when it returns True they stop with JobCancelled.
+    A resumed job starts with what its interrupted attempts already spent.
+    """
+
+    def __init__(
+        self,
+        time_limit: Optional[float] = None,
+        cpu_limit: Optional[float] = None,
+        cancelled: Optional[Callable[[], bool]] = None,
+        spent_time: float = 0.0,
+        spent_cpu: float = 0.0,
+    ):
+        self.time_limit = time_limit
+        self.cpu_limit = cpu_limit
+        self.cancelled = cancelled
+        self._wall_start = time.perf_counter() - spent_time
+        self._cpu_start = time.process_time()
+        self._worker_cpu = spent_cpu
+
+    def charge(self, cpu_seconds: float):
+        self._worker_cpu += cpu_seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._wall_start
+
+    @property
+    def cpu_used(self) -> float:
+        return time.process_time() - self._cpu_start + self._worker_cpu
+
+    def remaining(self) -> Optional[float]:
+        """Wall-clock seconds left, or None when unlimited."""
+        if self.time_limit is None:
+            return None
+        return max(0.0, self.time_limit - self.elapsed)
+
+    def wait_timeout(self, overrun: bool = False) -> Optional[float]:
+        """
+        How long a search may block on its pool before re-checking the
+        budget; with `overrun`, past the time limit, only cancellation is polled.
+        """
+        remaining = None if overrun else self.remaining()
+        if self.cancelled is None:
+            return remaining
+        return CANCEL_POLL_SECONDS if remaining is None else min(remaining, CANCEL_POLL_SECONDS)
+
+    def raise_if_cancelled(self):
+        if self.cancelled is not None and self.cancelled():
+            raise JobCancelled()
+
+    def exhausted(self) -> bool:
+        if self.time_limit is not None and self.elapsed >= self.time_limit:
+            return True
+        if self.cpu_limit is not None and self.cpu_used >= self.cpu_limit:
+            return True
+        return False
+
+
+# Search spaces: ("log", low, high) samples log-uniformly, ("int", low, high)
+# uniformly over integers, and a list picks one of its values.
+SEARCH_SPACES: Dict[str, Dict[str, Any]] = {
+    "Random Forest": {
+        "n_estimators": ("int", 50, 400),
+        "max_depth": [None, 8, 16, 32],
+        "min_samples_leaf": ("int", 1, 10),
+        "max_features": ["sqrt", "log2", 0.5, 1.0],
+    },
+    "Gradient Boosting": {
+        "learning_rate": ("log", 0.01, 0.3),
+        "max_iter": ("int", 50, 500),
+        "max_leaf_nodes": ("int", 8, 64),
+        "min_samples_leaf": ("int", 5, 50),
+        "l2_regularization": ("log", 1e-6, 1.0),
+    },
+    "SVM": {
+        "C": ("log", 0.01, 100.0),
+        "gamma": ["scale", "auto"],
+    },
+    "Logistic Regression": {
+        "C": ("log", 1e-3, 100.0),
+    },
+    "Neural Network": {
+        "hidden_layer_sizes": [(64,), (128,), (64, 32), (128, 64)],
+        "alpha": ("log", 1e-6, 1e-2),
+        "learning_rate_init": ("log", 1e-4, 1e-2),
+    },
+}
+
+
+def sample_params(family: str, task_type: str, rng: np.random.Generator) -> Dict[str, Any]:
+    params = {}
+    for name, space in SEARCH_SPACES.get(family, {}).items():
+        if isinstance(space, list):
+            params[name] = space[rng.integers(len(space))]
+        elif space[0] == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(space[1]), math.log(space[2]))))
+        else:
+            params[name] = int(rng.integers(space[1], space[2] + 1))
+    if family == "Logistic Regression" and task_type == "regression":
+        # Ridge exposes regularisation as alpha rather than C
+        params = {"alpha": 1.0 / params.pop("C")}
+    return params
+
+
+class SuccessiveHalvingSearch:
+    """
+    Budgeted hyperparameter search for a single model family.
+
+    Random configurations are scored on a small data subset; each rung keeps
+    the best 1/eta of them and grows the subset by eta, so full-size fits are
+    only paid for the few configurations that survive. The search stops as
+    soon as the budget runs out and returns the best configuration scored on
+    the largest subset reached.
+    """
+
+    def __init__(
+        self,
+        family: str,
+        task_type: str,
+        budget: Budget,
+        max_workers: Optional[int] = None,
+        n_configs: int = HALVING_CONFIGS,
+        eta: int = HALVING_ETA,
+        min_rows: int = HALVING_MIN_ROWS,
+        cv_folds: int = CV_FOLDS,
+        random_state: int = 0,
+    ):
+        self.family = family
+        self.task_type = task_type
+        self.budget = budget
+        self.max_workers = max_workers
+        self.n_configs = n_configs
+        self.eta = eta
+        self.min_rows = min_rows
+        self.cv_folds = cv_folds
+        self.random_state = random_state
+
+    def rungs(self, n_rows: int) -> List[int]:
+        """Subset size per rung, ending with the full training set."""
+        n_rungs = 1
+        while self.eta ** n_rungs <= self.n_configs:
+            n_rungs += 1
+        sizes = [n_rows // self.eta ** (n_rungs - 1 - i) for i in range(n_rungs)]
+        sizes = [size for size in sizes if size >= max(self.min_rows, self.cv_folds * 2)]
+        return sizes[:-1] + [n_rows] if sizes else [n_rows]
+
+    def run(
+        self,
+        X: np.ndarray,
+        y: np.ndarray,
+        baseline: Optional[Dict[str, Any]] = None,
+        on_rung: Optional[Callable[[int, int, List[Dict[str, Any]]], None]] = None,
+        on_state: Optional[Callable[[Dict[str, Any]], None]] = None,
+        resume: Optional[Dict[str, Any]] = None,
+        rows: Optional[np.ndarray] = None,
+    ) -> Dict[str, Any]:
+        """
+        Search on the training `rows` of X and y (all of them if None) and
+        return the best result dict (as produced by the engine).
+        `baseline` is the default-parameter result already scored on the full
+        training set; it wins unless a tuned configuration beats it.
+        `on_state(state)` is called after each rung with what the next rung
+        needs; passing that state back as `resume` continues from there.
+        """
+        rows = np.arange(len(X)) if rows is None else rows
+        rng = np.random.default_rng(self.random_state)
+        # Shuffle once so every rung's prefix is a random subsample
+        order = rng.permutation(len(rows))
+        configs = [{}] + [sample_params(self.family, self.task_type, rng) for _ in range(self.n_configs - 1)]
+        rungs = self.rungs(len(rows))
+        best, deepest, start = baseline, None, 0
+        if resume is not None:
+            configs, best, deepest, start = resume["configs"], resume["best"], resume["deepest"], resume["rung"]
+        if start >= len(rungs):
+            return best or deepest
+
+        with SharedDataset.from_arrays(rows[order], X=X, y=y) as shared:
+            pool = open_pool(shared, resolve_worker_count(len(configs), self.max_workers))
+            try:
+                for rung, n_rows in enumerate(rungs[start:], start):
+                    if self.budget.exhausted():
+                        break
+                    scored = self._run_rung(pool, configs, n_rows)
+                    if not scored:
+                        break
+                    scored.sort(key=lambda r: r["score"], reverse=True)
+                    if on_rung:
+                        on_rung(rung, n_rows, scored)
+                    deepest = scored[0]
+                    if n_rows == len(rows) and (best is None or deepest["score"] > best["score"]):
+                        best = deepest
+                    configs = [r["params"] for r in scored[:max(1, len(scored) // self.eta)]]
+                    if on_state:
+                        on_state({"rung": rung + 1, "configs": configs, "best": best, "deepest": deepest})
+            finally:
+                terminate_pool(pool)
+
+        # Without a full-data score, the deepest rung's winner is the best estimate
+        return best or deepest
+
+    def _run_rung(self, pool, configs: List[Dict[str, Any]], n_rows: int) -> List[Dict[str, Any]]:
+        futures = [
+            pool.submit(
+                _evaluate_candidate, self.family, self.task_type, params,
+                self.cv_folds, self.random_state, n_rows,
+            )
+            for params in configs
+        ]
+        scored, pending = [], set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self.budget.wait_timeout(), return_when=FIRST_COMPLETED)
+            self.budget.raise_if_cancelled()
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception:
+                    continue
+                self.budget.charge(result["cpu_time"])
+                scored.append(result)
+            if self.budget.exhausted():
+                for future in pending:
+                    future.cancel()
+                break
+        return scored
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, Text, JSON, Integer, Float, ForeignKey, Boolean
+from sqlalchemy import Column, String, DateTime, Text, JSON, Integer, BigInteger, Float, ForeignKey, Boolean, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -19,25 +19,76 @@ class User(Base):
     
     # Relationships
     jobs = relationship("PromptJob", back_populates="user")
+    datasets = relationship("Dataset", back_populates="user")
+
+class Dataset(Base):
+    __tablename__ = "datasets"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    content_hash = Column(String(64), nullable=False, index=True)  # key into the columnar store
+    filename = Column(String, nullable=True)
+    format = Column(String, nullable=False)  # csv, parquet
+    size_bytes = Column(BigInteger, nullable=False)
+    n_rows = Column(BigInteger, nullable=False)
+    columns = Column(JSON, default=list)  # [{"name": ..., "kind": "numeric" | "categorical"}]
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    user = relationship("User", back_populates="datasets")
 
 class PromptJob(Base):
     __tablename__ = "prompt_jobs"
+    __table_args__ = (
+        # Keyset pagination of a user's jobs, newest first
+        Index("ix_prompt_jobs_user_created_id", "user_id", "created_at", "id"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
+    dataset_id = Column(UUID(as_uuid=True), ForeignKey("datasets.id"), nullable=True)
     prompt = Column(Text, nullable=False)
-    status = Column(String, default="pending")  # pending, running, completed, failed
+    status = Column(String, default="pending")  # pending, running, cancelling, completed, failed, cancelled
     progress = Column(Integer, default=0)
-    logs = Column(JSON, default=list)
     error_message = Column(Text, nullable=True)
     result_summary = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    settings = Column(JSON, default=dict)  # time_budget_seconds, cpu_budget_seconds, target_column
+    fingerprint = Column(String(64), nullable=True, index=True)  # normalized prompt + dataset + settings
+    attached_to_job_id = Column(UUID(as_uuid=True), ForeignKey("prompt_jobs.id"), nullable=True, index=True)
+    lane = Column(String(16), nullable=True)  # scheduler priority lane: small, large
+    queued_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    queue_wait_seconds = Column(Float, nullable=True)
+    stage_timings = Column(JSON, nullable=True)  # seconds per training stage, see MLTrainer.train_model
+    attempts = Column(Integer, default=0, nullable=False)  # worker runs started, including resumed ones
+    heartbeat_at = Column(DateTime, nullable=True)  # refreshed while a worker runs the job
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="jobs")
+    dataset = relationship("Dataset")
     result = relationship("JobResult", back_populates="job", uselist=False)
 
+class JobLogEvent(Base):
+    __tablename__ = "job_log_events"
+    
+    # (job_id, seq) doubles as the index for ranged and tail reads
+    job_id = Column(UUID(as_uuid=True), ForeignKey("prompt_jobs.id"), primary_key=True)
+    seq = Column(Integer, primary_key=True, autoincrement=False)
+    ts = Column(DateTime, default=datetime.utcnow, nullable=False)
+    level = Column(String(16), default="info", nullable=False)  # info, warning, error
+    message = Column(Text, nullable=False)
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+    
+    # Pickled stage results of a job in progress, see workers/recovery.py
+    job_id = Column(UUID(as_uuid=True), ForeignKey("prompt_jobs.id"), primary_key=True)
+    key = Column(String(64), primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
 class JobResult(Base):
     __tablename__ = "job_results"
     
@@ -47,11 +98,17 @@ class JobResult(Base):
     accuracy = Column(Float, nullable=False)
     loss = Column(Float, nullable=False)
     training_time = Column(Float, nullable=False)
+    time_budget = Column(Float, nullable=True)
+    cpu_time = Column(Float, nullable=True)
+    cpu_budget = Column(Float, nullable=True)
     dataset_size = Column(Integer, nullable=False)
     features_used = Column(JSON, default=list)
-    model_size = Column(String, nullable=False)
+    data_profile = Column(JSON, nullable=True)  # column profiles and feature selection (ml_service.profiling)
+    model_size = Column(BigInteger, nullable=False)  # bytes
     download_url = Column(String, nullable=True)
     api_endpoint = Column(String, nullable=True)
+    model_key = Column(String(64), nullable=True)  # artifact store key of the ModelBundle, shared by cloned results
+    estimator_key = Column(String(64), nullable=True)  # bundle with the fitted estimator when model_key's is compiled (ml_service.compiled)
     metrics = Column(JSON, nullable=False)  # precision, recall, f1_score, etc.
     feature_importance = Column(JSON, nullable=True)
     predictions_sample = Column(JSON, nullable=True)
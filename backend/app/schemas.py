@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from uuid import UUID
@@ -28,14 +28,69 @@ class AuthResponse(BaseModel):
     user: User
     token: str
 
+# Dataset schemas
+class DatasetColumn(BaseModel):
+    name: str
+    kind: str
+    # From the profile taken at upload (see ColumnProfile)
+    type: Optional[str] = None
+    null_rate: Optional[float] = None
+    distinct: Optional[int] = None
+
+class Dataset(BaseModel):
+    id: UUID
+    content_hash: str
+    filename: Optional[str] = None
+    format: str
+    size_bytes: int
+    n_rows: int
+    columns: List[DatasetColumn]
+    created_at: datetime
+    
+    class Config:
+        from_attributes = True
+
 # Job schemas
 class PromptSubmission(BaseModel):
     prompt: str
+    dataset_id: Optional[UUID] = None
+    target_column: Optional[str] = None
+    # Wall-clock and CPU limits for model search and tuning (seconds)
+    time_budget_seconds: Optional[float] = Field(None, gt=0, le=24 * 3600)
+    cpu_budget_seconds: Optional[float] = Field(None, gt=0)
+    # Cross-validate candidates in fold tasks across the worker cluster;
+    # unset, large datasets are distributed and the rest train on one worker
+    distributed: Optional[bool] = None
+
+class PromptBatchSubmission(BaseModel):
+    prompts: List[PromptSubmission] = Field(..., min_length=1, max_length=1000)
+
+class RetrainRequest(BaseModel):
+    # The grown dataset: the job's training rows followed by the appended ones
+    dataset_id: UUID
+    # Population stability index above which the model is retrained from scratch
+    drift_threshold: Optional[float] = Field(None, gt=0)
+
+class PromptPlanRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1, max_length=1000)
+
+class PromptPlan(BaseModel):
+    task_type: str  # classification, regression, clustering
+    confidence: float  # share of the catalog's task votes the chosen task got
+    families: List[str]  # model families in the order training tries them
+    target_hints: List[str]  # phrases the prompt uses for the target column
+    matched: List[str]  # catalog phrases found in the prompt
+
+class PromptPlanResponse(BaseModel):
+    plans: List[PromptPlan]
 
 class JobResponse(BaseModel):
     job_id: UUID
     message: str
 
+class JobBatchResponse(BaseModel):
+    jobs: List[JobResponse]  # in submission order
+
 class Job(BaseModel):
     id: UUID
     prompt: str
@@ -48,27 +103,86 @@ class Job(BaseModel):
     class Config:
         from_attributes = True
 
-class JobStatus(Job):
-    logs: List[str]
+class JobPage(BaseModel):
+    jobs: List[Job]
+    next_cursor: Optional[str] = None  # pass back as ?cursor= for the next page; None on the last page
+
+class JobState(Job):
     error_message: Optional[str] = None
+    attached_to_job_id: Optional[UUID] = None
+    lane: Optional[str] = None
+    # Seconds between queueing and a worker starting the job
+    queue_wait_seconds: Optional[float] = None
+    # Seconds per training stage (prompt_analysis, dataset_prep, training, ...)
+    stage_timings: Optional[Dict[str, float]] = None
     
     class Config:
         from_attributes = True
 
+class JobStatusBatchRequest(BaseModel):
+    job_ids: List[UUID] = Field(..., min_length=1, max_length=1000)
+
+class JobStatusBatchResponse(BaseModel):
+    jobs: List[JobState]  # in request order
+    missing: List[UUID] = []  # ids that are unknown or belong to another user
+
+class JobStatus(JobState):
+    logs: List[str]
+    # Highest log seq included; poll again with ?after_seq= to get only newer lines
+    last_log_seq: Optional[int] = None
+    
+    @classmethod
+    def from_job(cls, job, log_events) -> "JobStatus":
+        data = {name: getattr(job, name) for name in cls.model_fields if hasattr(job, name)}
+        data["logs"] = [f"[{event.ts.strftime('%H:%M:%S')}] {event.message}" for event in log_events]
+        data["last_log_seq"] = log_events[-1].seq if log_events else None
+        return cls.model_validate(data)
+
 class JobMetrics(BaseModel):
-    precision: float
-    recall: float
-    f1_score: float
+    # Classification
+    precision: Optional[float] = None
+    recall: Optional[float] = None
+    f1_score: Optional[float] = None
     confusion_matrix: Optional[List[List[int]]] = None
+    # Regression
+    r2: Optional[float] = None
+    mae: Optional[float] = None
+    rmse: Optional[float] = None
 
 class FeatureImportance(BaseModel):
     feature: str
     importance: float
+    # Permutation importance only: spread over the repeats and its 95% interval
+    std: Optional[float] = None
+    ci_low: Optional[float] = None
+    ci_high: Optional[float] = None
 
 class PredictionSample(BaseModel):
     input: str
     predicted: str
-    confidence: float
+    confidence: Optional[float] = None
+
+class ColumnProfile(BaseModel):
+    name: str
+    kind: str  # storage kind: numeric or categorical
+    type: str  # inferred: empty, constant, binary, date, identifier, categorical, numeric
+    count: int
+    nulls: int
+    null_rate: float
+    distinct: int  # approximate (HyperLogLog)
+    mean: Optional[float] = None
+    std: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    quantiles: Optional[Dict[str, Optional[float]]] = None  # approximate, p1 ... p99
+    sample: List[Any] = []
+
+class DataProfile(BaseModel):
+    rows: int
+    target: Optional[str] = None
+    columns: List[ColumnProfile]
+    selected: List[str]  # columns features were engineered from
+    dropped: Dict[str, str]  # column -> why it was left out
 
 class JobResult(BaseModel):
     id: UUID
@@ -79,9 +193,13 @@ class JobResult(BaseModel):
     accuracy: float
     loss: float
     training_time: float
+    time_budget: Optional[float] = None
+    cpu_time: Optional[float] = None
+    cpu_budget: Optional[float] = None
     dataset_size: int
     features_used: List[str]
-    model_size: str
+    data_profile: Optional[DataProfile] = None
+    model_size: int  # bytes
     download_url: Optional[str] = None
     api_endpoint: Optional[str] = None
     metrics: JobMetrics
@@ -89,4 +207,22 @@ class JobResult(BaseModel):
     predictions_sample: Optional[List[PredictionSample]] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+    
+    @classmethod
+    def from_job(cls, job, result) -> "JobResult":
+        """Merge a PromptJob row and its JobResult row into one response."""
+        data = {name: getattr(result, name) for name in cls.model_fields if hasattr(result, name)}
+        data.update(id=job.id, prompt=job.prompt, status=job.status, created_at=job.created_at)
+        return cls.model_validate(data)
+
+class PredictionRequest(BaseModel):
+    # Feature name -> raw value; missing features are imputed as in training
+    instances: List[Dict[str, Any]] = Field(..., min_length=1, max_length=1000)
+
+class Prediction(BaseModel):
+    prediction: Any
+    confidence: Optional[float] = None
+
+class PredictionResponse(BaseModel):
+    predictions: List[Prediction]
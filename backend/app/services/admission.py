@@ -0,0 +1,111 @@
+import logging
+import math
+import os
+import time
+
+import redis
+from fastapi import HTTPException, status
+
+from ..metrics import ADMISSION_REJECTED
+from .cluster_status import ADMITTED_KEY, DEPTH_KEY, REDIS_URL
+from ..workers.celery_app import CLUSTER_STATUS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Per-user token bucket: sustained submissions per second (0 turns admission
+# control off), and the burst allowed on top
+SUBMIT_RATE = float(os.getenv("ADMISSION_SUBMIT_RATE_PER_SECOND", "0.5"))
+SUBMIT_BURST = float(os.getenv("ADMISSION_SUBMIT_BURST", "20"))
+# Jobs waiting across lanes beyond which submissions are turned away (0 = no limit)
+MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "1000"))
+
+BUCKET_PREFIX = "automl:admission:bucket:"
+
+# Admit `cost` submissions or say why not. The queue is full when the depth
+# at the last snapshot plus what was admitted since reaches the limit; with
+# no recent snapshot that check is skipped. A batch larger than the burst
+# gets in on a full bucket and leaves it in debt, so it is never refused
+# outright. Floats go back to the client as strings (Lua numbers truncate).
+_ADMIT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local cost, max_depth = tonumber(ARGV[4]), tonumber(ARGV[5])
+local depth = redis.call('GET', KEYS[2])
+if max_depth > 0 and depth then
+    local queued = tonumber(depth) + tonumber(redis.call('GET', KEYS[3]) or '0')
+    if queued >= max_depth then return {0, 'queue', tostring(queued)} end
+end
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(bucket[1]) or burst
+local at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - at) * rate)
+local needed = math.min(cost, burst)
+if tokens < needed then return {0, 'user', tostring((needed - tokens) / rate)} end
+tokens = tokens - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+-- Once refilled to the burst the bucket is the same as no bucket
+redis.call('EXPIRE', KEYS[1], math.ceil((burst - tokens) / rate) + 1)
+if depth then redis.call('INCRBY', KEYS[3], cost) end
+return {1, '', '0'}
+"""
+
+
+class AdmissionControl:
+    """
+    Gate in front of job submission: a token bucket per user and a bound on
+    the jobs waiting cluster-wide, checked together in one Lua script. The
+    queue depth comes from the cluster status snapshot (services.cluster_status),
+    so admission costs one Redis round trip however deep the queue is.
+    If Redis is unavailable, submissions are let through.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL, rate: float = SUBMIT_RATE, burst: float = SUBMIT_BURST,
+                 max_queue_depth: int = MAX_QUEUE_DEPTH):
+        self.redis_url = redis_url
+        self.rate = rate
+        self.burst = burst
+        self.max_queue_depth = max_queue_depth
+        self._client = None
+        self._script = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=2, decode_responses=True)
+        return self._client
+
+    def admit(self, user_id, cost: int = 1):
+        """
+        Charge `cost` submissions to the user, or raise 429 with Retry-After
+        if their bucket is empty or the queue is full. Blocking.
+        """
+        if self.rate <= 0:
+            return
+        try:
+            if self._script is None:
+                self._script = self.client.register_script(_ADMIT)
+            admitted, reason, value = self._script(
+                keys=[BUCKET_PREFIX + str(user_id), DEPTH_KEY, ADMITTED_KEY],
+                args=[self.rate, self.burst, time.time(), cost, self.max_queue_depth],
+            )
+        except redis.RedisError as e:
+            logger.warning("Admission control unavailable, admitting: %s", e)
+            return
+        if admitted:
+            return
+
+        ADMISSION_REJECTED.labels(reason).inc()
+        if reason == "queue":
+            # The queue only looks shorter after the next snapshot
+            retry_after = CLUSTER_STATUS_INTERVAL
+            detail = f"The job queue is full ({value} jobs waiting); try again later"
+        else:
+            retry_after = float(value)
+            detail = "Too many submissions; try again later"
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=detail,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+
+admission_control = AdmissionControl()
@@ -0,0 +1,96 @@
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Tuple
+import os
+import re
+
+from ..ml_service.artifacts import artifact_store, ArtifactNotFound
+
+DOWNLOAD_CHUNK_BYTES = int(os.getenv("ARTIFACT_DOWNLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)")
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range, None to send the whole
+    artifact. Multiple ranges are answered with the whole artifact, which
+    RFC 9110 allows.
+    """
+    if not header:
+        return None
+    match = _RANGE.fullmatch(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        # Suffix range: the final `last` bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+class ArtifactService:
+    async def download(self, request: Request, key: str, filename: str) -> Response:
+        """
+        Stream an artifact in fixed-size chunks, honouring Range, If-Range and
+        If-None-Match. The content hash key doubles as a strong ETag.
+        """
+        try:
+            size = await run_in_threadpool(artifact_store.size, key)
+        except ArtifactNotFound:
+            raise HTTPException(status_code=404, detail="Model artifact not found")
+
+        etag = f'"{key}"'
+        headers = {
+            "ETag": etag,
+            "Accept-Ranges": "bytes",
+            # Content-addressed, so a given URL's bytes only change if the key does
+            "Cache-Control": "private, max-age=31536000, immutable",
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        byte_range = None
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() == etag:
+            byte_range = parse_range(request.headers.get("range"), size)
+
+        start, end = byte_range or (0, size - 1)
+        headers["Content-Length"] = str(end - start + 1)
+        if byte_range:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        f = await run_in_threadpool(artifact_store.open, key)
+
+        async def chunks():
+            try:
+                await run_in_threadpool(f.seek, start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await run_in_threadpool(f.read, min(DOWNLOAD_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            finally:
+                f.close()
+
+        return StreamingResponse(
+            chunks(),
+            status_code=status.HTTP_206_PARTIAL_CONTENT if byte_range else status.HTTP_200_OK,
+            media_type="application/octet-stream",
+            headers=headers
+        )
@@ -1,11 +1,19 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 from datetime import datetime, timedelta
 from passlib.context import CryptContext
 from jose import jwt
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+import asyncio
 import os
 
 from .. import models, schemas
+from .principal_cache import principal_cache
+
+# bcrypt is deliberately slow; hashing runs on this many threads, off the event loop
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "4"))
 
 class AuthService:
     def __init__(self):
@@ -13,12 +21,15 @@ class AuthService:
         self.secret_key = os.getenv("SECRET_KEY", "your-secret-key")
         self.algorithm = "HS256"
         self.access_token_expire_minutes = 30
+        self.hash_executor = ThreadPoolExecutor(max_workers=AUTH_HASH_WORKERS, thread_name_prefix="bcrypt")
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, self.pwd_context.verify, plain_password, hashed_password)
 
-    def get_password_hash(self, password):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.hash_executor, self.pwd_context.hash, password)
 
     def create_access_token(self, data: dict):
         to_encode = data.copy()
@@ -27,9 +38,11 @@ class AuthService:
         encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
         return encoded_jwt
 
-    async def create_user(self, db: Session, user: schemas.UserCreate):
+    async def create_user(self, db: AsyncSession, user: schemas.UserCreate):
         # Check if user exists
-        db_user = db.query(models.User).filter(models.User.email == user.email).first()
+        db_user = (await db.execute(
+            select(models.User).where(models.User.email == user.email)
+        )).scalar_one_or_none()
         if db_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -37,28 +50,29 @@ class AuthService:
             )
         
         # Create new user
-        hashed_password = self.get_password_hash(user.password)
+        hashed_password = await self.get_password_hash(user.password)
         db_user = models.User(
             email=user.email,
             name=user.name,
             hashed_password=hashed_password
         )
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
         
         # Create access token
         access_token = self.create_access_token(data={"sub": str(db_user.id)})
         
         return schemas.AuthResponse(
-            user=schemas.User.from_orm(db_user),
+            user=schemas.User.model_validate(db_user),
             token=access_token
         )
 
-    async def authenticate_user(self, db: Session, credentials: schemas.UserLogin):
-        user = db.query(models.User).filter(models.User.email == credentials.email).first()
+    async def authenticate_user(self, db: AsyncSession, credentials: schemas.UserLogin):
+        user = (await db.execute(
+            select(models.User).where(models.User.email == credentials.email)
+        )).scalar_one_or_none()
         
-        if not user or not self.verify_password(credentials.password, user.hashed_password):
+        if not user or not await self.verify_password(credentials.password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect email or password"
@@ -74,6 +88,16 @@ class AuthService:
         access_token = self.create_access_token(data={"sub": str(user.id)})
         
         return schemas.AuthResponse(
-            user=schemas.User.from_orm(user),
+            user=schemas.User.model_validate(user),
             token=access_token
-        )
\ No newline at end of file
+        )
+
+    async def deactivate_user(self, db: AsyncSession, user_id: UUID):
+        user = await db.get(models.User, user_id)
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        user.is_active = False
+        await db.commit()
+        # Cached principals would otherwise keep the account usable until they expire
+        await principal_cache.broadcast_invalidation(str(user_id))
+        return schemas.User.model_validate(user)
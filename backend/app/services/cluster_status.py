@@ -0,0 +1,90 @@
+import json
+import logging
+import math
+import os
+import time
+from typing import Optional
+
+import redis
+
+from ..workers.celery_app import CLUSTER_STATUS_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# How long the refresh waits for workers to answer the stats broadcast
+INSPECT_TIMEOUT = float(os.getenv("CLUSTER_STATUS_INSPECT_TIMEOUT_SECONDS", "2"))
+# A snapshot older than this is reported stale, and admission control stops
+# limiting queue depth on it until the refresher is back
+CLUSTER_STATUS_MAX_AGE = float(os.getenv("CLUSTER_STATUS_MAX_AGE_SECONDS", str(3 * CLUSTER_STATUS_INTERVAL)))
+
+KEY_PREFIX = "automl:cluster-status"
+SNAPSHOT_KEY = KEY_PREFIX
+# Jobs waiting at the last refresh, and jobs admitted since (see services.admission)
+DEPTH_KEY = f"{KEY_PREFIX}:queue-depth"
+ADMITTED_KEY = f"{KEY_PREFIX}:admitted"
+
+
+class ClusterStatus:
+    """
+    Snapshot of the cluster in Redis: worker stats and queue depths. A beat
+    task (ml_tasks.refresh_cluster_status) refreshes it every
+    CLUSTER_STATUS_INTERVAL, so a broadcast to every worker runs once per
+    interval rather than once per status request.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis_url = redis_url
+        self._client = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=2, decode_responses=True)
+        return self._client
+
+    def refresh(self) -> dict:
+        """Take a new snapshot; worker side."""
+        from ..workers.celery_app import celery_app
+        from .fair_queue import fair_queue, LANES, lane_queue
+
+        # Read before the depth, so jobs admitted meanwhile stay counted until the next refresh
+        admitted = int(self.client.get(ADMITTED_KEY) or 0)
+        stats = celery_app.control.inspect(timeout=INSPECT_TIMEOUT).stats() or {}
+        queues = {
+            lane: {"waiting": fair_queue.depth(lane), "broker": fair_queue.client.llen(lane_queue(lane))}
+            for lane in LANES
+        }
+        depth = sum(queue["waiting"] for queue in queues.values())
+        snapshot = {
+            "celery_status": "active" if stats else "inactive",
+            "workers": stats,
+            "queues": queues,
+            "queue_depth": depth,
+            "updated_at": time.time(),
+        }
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(SNAPSHOT_KEY, json.dumps(snapshot, default=str))
+        pipe.set(DEPTH_KEY, depth, ex=math.ceil(CLUSTER_STATUS_MAX_AGE))
+        if admitted:
+            pipe.decrby(ADMITTED_KEY, admitted)
+        pipe.execute()
+        return snapshot
+
+    def snapshot(self) -> Optional[dict]:
+        """The latest snapshot with its age, or None if there is none or Redis is unavailable."""
+        try:
+            raw = self.client.get(SNAPSHOT_KEY)
+        except redis.RedisError as e:
+            logger.warning("Reading the cluster status failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        snapshot = json.loads(raw)
+        age = time.time() - snapshot["updated_at"]
+        snapshot["age_seconds"] = round(age, 1)
+        snapshot["stale"] = age > CLUSTER_STATUS_MAX_AGE
+        return snapshot
+
+
+cluster_status = ClusterStatus()
@@ -0,0 +1,84 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import HTTPException, Request, status
+from starlette.concurrency import run_in_threadpool
+from uuid import UUID
+from typing import Optional
+import hashlib
+import os
+
+import anyio
+
+from .. import models
+from ..ml_service.datasets import dataset_store, detect_format, DatasetFormatError
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 ** 3)))
+
+def _column_summary(dataset, name: str) -> dict:
+    profile = dataset.profile(name) or {}
+    return {
+        "name": name,
+        "kind": dataset.kind(name),
+        **{key: profile[key] for key in ("type", "null_rate", "distinct") if key in profile},
+    }
+
+class DatasetService:
+    async def upload(self, db: AsyncSession, request: Request, filename: Optional[str], user_id: UUID):
+        """
+        Stream the request body to disk while hashing it, then convert it once
+        into the columnar store. Identical content is only converted once.
+        """
+        try:
+            fmt = detect_format(filename, request.headers.get("content-type"))
+        except DatasetFormatError as e:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
+
+        raw_path = dataset_store.upload_path()
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            async with await anyio.open_file(raw_path, "wb") as f:
+                async for chunk in request.stream():
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="Dataset exceeds the upload limit"
+                        )
+                    digest.update(chunk)
+                    await f.write(chunk)
+            if size == 0:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty upload")
+
+            content_hash = digest.hexdigest()
+            try:
+                dataset = await run_in_threadpool(dataset_store.ingest, raw_path, fmt, content_hash)
+            except DatasetFormatError as e:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+        db_dataset = models.Dataset(
+            user_id=user_id,
+            content_hash=content_hash,
+            filename=filename,
+            format=fmt,
+            size_bytes=size,
+            n_rows=dataset.n_rows,
+            columns=[_column_summary(dataset, name) for name in dataset.columns]
+        )
+        db.add(db_dataset)
+        await db.commit()
+        return db_dataset
+
+    async def get_dataset(self, db: AsyncSession, dataset_id: UUID, user_id: UUID):
+        dataset = (await db.execute(
+            select(models.Dataset).where(
+                models.Dataset.id == dataset_id,
+                models.Dataset.user_id == user_id
+            )
+        )).scalar_one_or_none()
+        if not dataset:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        return dataset
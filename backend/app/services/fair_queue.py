@@ -0,0 +1,181 @@
+import logging
+import os
+from typing import List, Optional, Tuple
+
+import redis
+
+from ..workers.celery_app import celery_app
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Jobs estimated above either bound run in the large lane
+LARGE_JOB_CELLS = int(os.getenv("SCHEDULER_LARGE_JOB_CELLS", str(5_000_000)))
+LARGE_JOB_BUDGET = float(os.getenv("SCHEDULER_LARGE_JOB_BUDGET_SECONDS", "900"))
+# Synthetic datasets used when a prompt comes without one (see ml_service.train)
+SYNTHETIC_CELLS = int(os.getenv("ML_SYNTHETIC_ROWS", "5000")) * 10
+
+LANES = ("small", "large")
+KEY_PREFIX = "automl:fair-queue"
+CLAIMS_KEY = f"{KEY_PREFIX}:claims"
+
+# Append a job to its user's list; a user joins the lane's ring on their first pending job
+_ENQUEUE = """
+local n = redis.call('RPUSH', KEYS[2], ARGV[2])
+if n == 1 then redis.call('RPUSH', KEYS[1], ARGV[1]) end
+return n
+"""
+
+# Next job round-robin across users: take the head user's oldest job and
+# send the user to the back of the ring if they still have jobs pending
+_POP = """
+while true do
+    local user = redis.call('LPOP', KEYS[1])
+    if not user then return false end
+    local user_key = ARGV[1] .. user
+    local job = redis.call('LPOP', user_key)
+    if job then
+        if redis.call('LLEN', user_key) > 0 then redis.call('RPUSH', KEYS[1], user) end
+        redis.call('HSET', KEYS[2], ARGV[2], job)
+        return job
+    end
+end
+"""
+
+_REMOVE = """
+local removed = redis.call('LREM', KEYS[2], 0, ARGV[2])
+if removed > 0 and redis.call('LLEN', KEYS[2]) == 0 then redis.call('LREM', KEYS[1], 0, ARGV[1]) end
+return removed
+"""
+
+
+def choose_lane(settings: Optional[dict], dataset) -> str:
+    """Priority lane from the job's estimated cost: dataset cells and time budget."""
+    from ..ml_service.tuning import DEFAULT_TIME_BUDGET
+
+    settings = settings or {}
+    cells = dataset.n_rows * len(dataset.columns) if dataset is not None else SYNTHETIC_CELLS
+    budget = settings.get("time_budget_seconds") or DEFAULT_TIME_BUDGET
+    return "large" if cells > LARGE_JOB_CELLS or budget > LARGE_JOB_BUDGET else "small"
+
+
+def lane_queue(lane: str) -> str:
+    return f"ml_{lane}"
+
+
+class FairQueue:
+    """
+    Per-user round-robin queues in Redis, one set per priority lane.
+
+    Celery only carries interchangeable "run the next job in lane X" tokens;
+    which job a token runs is decided when a worker takes it, so a user with
+    hundreds of pending jobs gets one turn per round like everyone else. The
+    job a token claimed is recorded until it finishes, so a redelivered token
+    resumes the same job.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis_url = redis_url
+        self._client = None
+        self._scripts = {}
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=2, decode_responses=True)
+        return self._client
+
+    def _script(self, name: str):
+        if name not in self._scripts:
+            source = {"enqueue": _ENQUEUE, "pop": _POP, "remove": _REMOVE}[name]
+            self._scripts[name] = self.client.register_script(source)
+        return self._scripts[name]
+
+    def _ring_key(self, lane: str) -> str:
+        return f"{KEY_PREFIX}:{lane}:users"
+
+    def _user_prefix(self, lane: str) -> str:
+        return f"{KEY_PREFIX}:{lane}:user:"
+
+    def dispatch(self, job_id, user_id, lane: str):
+        """Queue a job fairly and hand Celery a token for its lane."""
+        try:
+            self._script("enqueue")(
+                keys=[self._ring_key(lane), self._user_prefix(lane) + str(user_id)],
+                args=[str(user_id), str(job_id)]
+            )
+        except redis.RedisError as e:
+            # Unfair but not lost: send the job itself instead of a token
+            logger.warning("Fair queue unavailable, sending job %s directly: %s", job_id, e)
+            celery_app.send_task("ml_tasks.process_prompt", args=[str(job_id)], task_id=str(job_id), queue=lane_queue(lane))
+            return
+        celery_app.send_task("ml_tasks.run_next_job", args=[lane], queue=lane_queue(lane))
+
+    def dispatch_many(self, jobs: List[Tuple]):
+        """
+        dispatch for many (job_id, user_id, lane) at once: the enqueues go to
+        Redis in one pipeline and the tokens to the broker over one producer.
+        """
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            enqueue = self._script("enqueue")
+            for job_id, user_id, lane in jobs:
+                enqueue(
+                    keys=[self._ring_key(lane), self._user_prefix(lane) + str(user_id)],
+                    args=[str(user_id), str(job_id)],
+                    client=pipe
+                )
+            pipe.execute()
+            messages = [("ml_tasks.run_next_job", [lane], {"queue": lane_queue(lane)}) for _, _, lane in jobs]
+        except redis.RedisError as e:
+            logger.warning("Fair queue unavailable, sending %d jobs directly: %s", len(jobs), e)
+            messages = [
+                ("ml_tasks.process_prompt", [str(job_id)], {"task_id": str(job_id), "queue": lane_queue(lane)})
+                for job_id, _, lane in jobs
+            ]
+        with celery_app.producer_or_acquire() as producer:
+            for name, args, options in messages:
+                celery_app.send_task(name, args=args, producer=producer, **options)
+
+    def claim(self, lane: str, token_id: str) -> Optional[str]:
+        """Job for a token: the one it already claimed (redelivery), else the next in line."""
+        job_id = self.client.hget(CLAIMS_KEY, token_id)
+        if job_id:
+            return job_id
+        return self._script("pop")(
+            keys=[self._ring_key(lane), CLAIMS_KEY],
+            args=[self._user_prefix(lane), token_id]
+        ) or None
+
+    def release(self, token_id: str):
+        try:
+            self.client.hdel(CLAIMS_KEY, token_id)
+        except redis.RedisError as e:
+            logger.warning("Releasing fair queue claim failed: %s", e)
+
+    def forget(self, job_id):
+        """Drop claims on a requeued job, so its lost token, once redelivered, doesn't run it twice."""
+        claims = self.client.hgetall(CLAIMS_KEY)
+        stale = [token for token, claimed in claims.items() if claimed == str(job_id)]
+        if stale:
+            self.client.hdel(CLAIMS_KEY, *stale)
+
+    def remove(self, job_id, user_id, lane: str) -> bool:
+        """Take a pending job out of the queue; False if a worker already has it."""
+        return bool(self._script("remove")(
+            keys=[self._ring_key(lane), self._user_prefix(lane) + str(user_id)],
+            args=[str(user_id), str(job_id)]
+        ))
+
+    def depth(self, lane: str) -> int:
+        """Jobs waiting in a lane."""
+        users = self.client.lrange(self._ring_key(lane), 0, -1)
+        if not users:
+            return 0
+        pipe = self.client.pipeline()
+        for user in users:
+            pipe.llen(self._user_prefix(lane) + user)
+        return sum(pipe.execute())
+
+
+fair_queue = FairQueue()
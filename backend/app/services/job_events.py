@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import AsyncIterator, Dict, Optional, Set
+
+import redis
+import redis.asyncio as aioredis
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Events kept per job for clients resuming with Last-Event-ID
+JOB_EVENTS_MAXLEN = int(os.getenv("JOB_EVENTS_MAXLEN", "1000"))
+JOB_EVENTS_TTL = int(os.getenv("JOB_EVENTS_TTL_SECONDS", str(24 * 3600)))
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# Live events buffered per subscriber; a client that falls further behind loses the oldest
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SSE_SUBSCRIBER_QUEUE_SIZE", "100"))
+
+KEY_PREFIX = "automl:job-events"
+TERMINAL_EVENTS = {"completed", "failed", "cancelled"}
+
+
+def stream_key(job_id) -> str:
+    return f"{KEY_PREFIX}:{job_id}"
+
+
+def _event_id_key(event_id: str):
+    millis, _, seq = event_id.partition("-")
+    return int(millis), int(seq or 0)
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class JobEventPublisher:
+    """
+    Worker side: append each job event to a capped Redis stream (for replay)
+    and publish it on the job's channel (for live fan-out).
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis_url = redis_url
+        self._client = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1)
+        return self._client
+
+    def publish(self, job_id, event_type: str, **fields):
+        event = {"type": event_type, "job_id": str(job_id), "ts": time.time(), **fields}
+        key = stream_key(job_id)
+        try:
+            event_id = self.client.xadd(key, {"data": json.dumps(event)}, maxlen=JOB_EVENTS_MAXLEN, approximate=True)
+            event["id"] = event_id.decode() if isinstance(event_id, bytes) else event_id
+            pipe = self.client.pipeline()
+            pipe.expire(key, JOB_EVENTS_TTL)
+            pipe.publish(key, json.dumps(event))
+            pipe.execute()
+        except redis.RedisError as e:
+            # Progress is still persisted on the job row; only live push is lost
+            logger.warning("Publishing job event failed: %s", e)
+
+
+class JobEventHub:
+    """
+    API side: one pattern subscription per process, fanned out to every local
+    subscriber of a job. Thousands of dashboards cost one Redis connection.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL):
+        self.redis_url = redis_url
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._client: Optional[aioredis.Redis] = None
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            self._client = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._client
+
+    async def run(self):
+        """Dispatch published events to local subscribers until cancelled."""
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.psubscribe(f"{KEY_PREFIX}:*")
+                    async for message in pubsub.listen():
+                        if message["type"] != "pmessage":
+                            continue
+                        job_id = message["channel"][len(KEY_PREFIX) + 1:]
+                        event = json.loads(message["data"])
+                        for queue in list(self._subscribers.get(job_id, ())):
+                            _offer(queue, event)
+            except aioredis.RedisError as e:
+                logger.warning("Job event hub disconnected: %s", e)
+                await asyncio.sleep(2)
+
+    async def last_event_id(self, job_id: str) -> Optional[str]:
+        """Id of the newest stored event, or None if there is none."""
+        try:
+            entries = await self.client.xrevrange(stream_key(job_id), count=1)
+        except aioredis.RedisError as e:
+            logger.warning("Reading job events failed: %s", e)
+            return None
+        return entries[0][0] if entries else None
+
+    async def replay(self, job_id: str, after: Optional[str]):
+        """Stored events newer than `after` (all of them when None)."""
+        start = f"({after}" if after else "-"
+        try:
+            entries = await self.client.xrange(stream_key(job_id), min=start, max="+")
+        except aioredis.RedisError as e:
+            logger.warning("Replaying job events failed: %s", e)
+            return []
+        events = []
+        for event_id, fields in entries:
+            event = json.loads(fields["data"])
+            event["id"] = event_id
+            events.append(event)
+        return events
+
+    async def subscribe(self, job_id: str, last_event_id: Optional[str] = None, live: bool = True) -> AsyncIterator[dict]:
+        """
+        Events for one job: replayed from the stream after `last_event_id`,
+        then live unless `live` is False. Ends after a terminal event.
+        """
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        # Subscribe before replaying so nothing published in between is lost
+        self._subscribers[job_id].add(queue)
+        try:
+            last_seen = last_event_id
+            for event in await self.replay(job_id, last_event_id):
+                last_seen = event["id"]
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+            while live:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield {"type": "keepalive"}
+                    continue
+                if last_seen and _event_id_key(event["id"]) <= _event_id_key(last_seen):
+                    continue  # already replayed
+                last_seen = event["id"]
+                yield event
+                if event["type"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            self._subscribers[job_id].discard(queue)
+            if not self._subscribers[job_id]:
+                del self._subscribers[job_id]
+
+
+def format_sse(event: dict) -> str:
+    if event["type"] == "keepalive":
+        return ": keepalive\n\n"
+    event_id = f"id: {event['id']}\n" if "id" in event else ""
+    return f"{event_id}event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+job_event_publisher = JobEventPublisher()
+job_event_hub = JobEventHub()
@@ -0,0 +1,286 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..ml_service.artifacts import artifact_store
+
+if TYPE_CHECKING:
+    from ..ml_service.serving import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+# Loaded models are evicted least recently used first beyond this many bytes
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Rows coalesced into one predict() call, and how long the first request waits for company
+PREDICT_MAX_BATCH_SIZE = int(os.getenv("PREDICT_MAX_BATCH_SIZE", "64"))
+PREDICT_MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "5"))
+PREDICT_WORKERS = int(os.getenv("PREDICT_WORKERS", "4"))
+# Most recently trained models loaded when the API starts
+MODEL_WARMUP_COUNT = int(os.getenv("MODEL_WARMUP_COUNT", "20"))
+# Requests kept per model for latency percentiles; throughput is over the last minute
+STATS_WINDOW = 1000
+THROUGHPUT_WINDOW_SECONDS = 60
+
+
+class ModelCache:
+    """
+    In-process LRU of loaded ModelBundles, bounded by their serialized size.
+    Concurrent misses on the same model load it once.
+    """
+
+    def __init__(self, max_bytes: int = MODEL_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key: str) -> "ModelBundle":
+        """Cached bundle for `key`, loading it from the artifact store on a miss. Blocking."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    return entry[0]
+            # Arrays stay memory-mapped, so processes serving the same model share its pages
+            bundle = artifact_store.load(key)
+            nbytes = artifact_store.size(key)
+            with self._lock:
+                self._entries[key] = (bundle, nbytes)
+                self.total_bytes += nbytes
+                # Always keep the model just loaded, even if it alone exceeds the bound
+                while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                    evicted, (_, evicted_bytes) = self._entries.popitem(last=False)
+                    self.total_bytes -= evicted_bytes
+                    logger.info("Evicted model %s from the serving cache", evicted)
+                self._loading.pop(key, None)
+            return bundle
+
+    def full(self) -> bool:
+        return self.total_bytes >= self.max_bytes
+
+
+class ModelStats:
+    """Per-model request latency and throughput over a sliding window."""
+
+    def __init__(self):
+        self.requests = 0
+        self.rows = 0
+        self.batches = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=STATS_WINDOW)
+        self.compute_times = deque(maxlen=STATS_WINDOW)
+        self._completed = deque()  # (monotonic time, rows)
+
+    def record_batch(self, n_requests: int, n_rows: int, compute_seconds: float):
+        now = time.monotonic()
+        self.requests += n_requests
+        self.rows += n_rows
+        self.batches += 1
+        self.compute_times.append(compute_seconds)
+        self._completed.append((now, n_rows))
+        while self._completed and self._completed[0][0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._completed.popleft()
+
+    def snapshot(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        quantile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else None
+        now = time.monotonic()
+        recent_rows = sum(n for t, n in self._completed if t >= now - THROUGHPUT_WINDOW_SECONDS)
+        return {
+            "requests": self.requests,
+            "rows": self.rows,
+            "batches": self.batches,
+            "errors": self.errors,
+            "mean_batch_rows": self.rows / self.batches if self.batches else None,
+            "latency_p50_ms": quantile(0.50),
+            "latency_p95_ms": quantile(0.95),
+            "latency_p99_ms": quantile(0.99),
+            "mean_compute_ms": sum(self.compute_times) / len(self.compute_times) * 1000 if self.compute_times else None,
+            "rows_per_second": recent_rows / THROUGHPUT_WINDOW_SECONDS,
+        }
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent predict requests for one model into a single
+    vectorized predict() call of up to `max_batch_size` rows. The first
+    request of a batch waits at most `max_wait` seconds for others; under
+    load, requests queued while a batch is running form the next one.
+    """
+
+    def __init__(self, key: str, service: "PredictionService", max_batch_size: int, max_wait: float):
+        self.key = key
+        self.service = service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((rows, future))
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        # Exits once the queue drains; the next submit starts a new loop
+        while not self._queue.empty():
+            batch = [self._queue.get_nowait()]
+            n_rows = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0 and self._queue.empty():
+                    break
+                try:
+                    item = self._queue.get_nowait() if not self._queue.empty() else \
+                        await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                n_rows += len(item[0])
+            await self._execute(batch)
+
+    async def _execute(self, batch):
+        stats = self.service.stats_for(self.key)
+        rows = [row for request_rows, _ in batch for row in request_rows]
+        started = time.perf_counter()
+        try:
+            outputs = await self.service.run(self.key, rows)
+        except ValueError:
+            # One malformed request must not fail the requests batched with it
+            for request_rows, future in batch:
+                if future.cancelled():
+                    continue
+                try:
+                    future.set_result(await self.service.run(self.key, request_rows))
+                except Exception as e:
+                    stats.errors += 1
+                    future.set_exception(e)
+            return
+        except Exception as e:
+            stats.errors += len(batch)
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+        stats.record_batch(len(batch), len(rows), time.perf_counter() - started)
+
+        offset = 0
+        for request_rows, future in batch:
+            if not future.cancelled():
+                future.set_result(outputs[offset:offset + len(request_rows)])
+            offset += len(request_rows)
+
+
+class PredictionService:
+    """Online inference for trained jobs: model cache, micro-batching and stats."""
+
+    def __init__(
+        self,
+        cache: Optional[ModelCache] = None,
+        max_batch_size: int = PREDICT_MAX_BATCH_SIZE,
+        max_wait_ms: float = PREDICT_MAX_WAIT_MS,
+        workers: int = PREDICT_WORKERS,
+    ):
+        self.cache = cache or ModelCache()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="predict")
+        self._batchers: Dict[str, MicroBatcher] = {}
+        self._stats: Dict[str, ModelStats] = {}
+        # (job_id, user_id) -> model key; completed results never change
+        self._endpoints: "OrderedDict[tuple, str]" = OrderedDict()
+
+    def stats_for(self, key: str) -> ModelStats:
+        if key not in self._stats:
+            self._stats[key] = ModelStats()
+        return self._stats[key]
+
+    async def resolve(self, db: AsyncSession, job_id: UUID, user_id: UUID) -> Optional[str]:
+        """Model key behind a user's job, or None if it has no servable model."""
+        endpoint = (job_id, user_id)
+        key = self._endpoints.get(endpoint)
+        if key is None:
+            key = (await db.execute(
+                select(models.JobResult.model_key)
+                .join(models.PromptJob, models.PromptJob.id == models.JobResult.job_id)
+                .where(models.PromptJob.id == job_id, models.PromptJob.user_id == user_id)
+            )).scalar_one_or_none()
+            if key is None:
+                return None
+            self._endpoints[endpoint] = key
+            if len(self._endpoints) > 10000:
+                self._endpoints.popitem(last=False)
+        return key
+
+    async def run(self, key: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Predict `rows` with the model in a worker thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: self.cache.get(key).predict(rows))
+
+    async def predict(self, key: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._batchers[key] = MicroBatcher(key, self, self.max_batch_size, self.max_wait)
+        started = time.perf_counter()
+        outputs = await batcher.submit(rows)
+        self.stats_for(key).latencies.append(time.perf_counter() - started)
+        return outputs
+
+    def stats(self, key: str) -> Dict[str, Any]:
+        return {"loaded": key in self.cache, **self.stats_for(key).snapshot()}
+
+    async def warm_up(self, db: AsyncSession, limit: int = MODEL_WARMUP_COUNT):
+        """
+        Load the most recently trained models until the cache is full and run
+        one prediction through each, so the first real request pays no load.
+        """
+        try:
+            keys = (await db.execute(
+                select(models.JobResult.model_key)
+                .where(models.JobResult.model_key.isnot(None))
+                .order_by(models.JobResult.created_at.desc())
+                .limit(limit)
+            )).scalars().all()
+        except SQLAlchemyError as e:
+            logger.warning("Model warm-up skipped: %s", e)
+            return
+        finally:
+            await db.close()
+
+        for key in dict.fromkeys(keys):
+            if self.cache.full():
+                break
+            try:
+                await self.run(key, [{}])
+            except Exception as e:
+                logger.warning("Warming up model %s failed: %s", key, e)
+
+
+prediction_service = PredictionService()
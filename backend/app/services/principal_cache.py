@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import redis.asyncio as aioredis
+
+from .. import schemas
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+PRINCIPAL_CACHE_SIZE = int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000"))
+# Upper bound on how long another API process may serve a deactivated user
+# if it misses the invalidation broadcast
+PRINCIPAL_CACHE_TTL = float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+INVALIDATION_CHANNEL = "automl:principal-invalidate"
+
+
+class PrincipalCache:
+    """
+    In-process LRU of authenticated users keyed by token subject (user id),
+    with a per-entry TTL. Lets authenticated requests skip the user lookup.
+    """
+
+    def __init__(self, max_entries: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, subject: str) -> Optional[schemas.User]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def put(self, subject: str, principal: schemas.User):
+        with self._lock:
+            self._entries[subject] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, subject: str):
+        with self._lock:
+            self._entries.pop(subject, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def broadcast_invalidation(self, subject: str, redis_url: str = REDIS_URL):
+        """Drop `subject` here and tell every other API process to do the same."""
+        self.invalidate(subject)
+        client = aioredis.from_url(redis_url, socket_timeout=1)
+        try:
+            await client.publish(INVALIDATION_CHANNEL, subject)
+        except aioredis.RedisError as e:
+            logger.warning("Principal invalidation broadcast failed: %s", e)
+        finally:
+            await client.aclose()
+
+    async def listen(self, redis_url: str = REDIS_URL):
+        """Apply invalidations broadcast by other processes until cancelled."""
+        while True:
+            client = aioredis.from_url(redis_url)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(INVALIDATION_CHANNEL)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self.invalidate(message["data"].decode())
+            except aioredis.RedisError as e:
+                # Entries we miss meanwhile still expire after the TTL
+                logger.warning("Principal invalidation listener disconnected: %s", e)
+                self.clear()
+                await asyncio.sleep(5)
+            finally:
+                await client.aclose()
+
+
+principal_cache = PrincipalCache()
@@ -1,50 +1,487 @@
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from fastapi import HTTPException, status
+from starlette.concurrency import run_in_threadpool
 from uuid import UUID
+from typing import List, Optional
+import base64
+import binascii
 import uuid
 from datetime import datetime
 
 from .. import models, schemas
-from ..workers.celery_app import celery_app
+from .result_cache import result_cache, job_fingerprint, complete_from
+from .fair_queue import fair_queue, choose_lane
+from .admission import admission_control
+from kombu.exceptions import KombuError
+from redis import RedisError
+from .job_events import job_event_publisher
+
+# Columns a job list row needs; avoids hydrating full ORM objects per page
+JOB_LIST_COLUMNS = (
+    models.PromptJob.id,
+    models.PromptJob.prompt,
+    models.PromptJob.status,
+    models.PromptJob.progress,
+    models.PromptJob.result_summary,
+    models.PromptJob.created_at,
+    models.PromptJob.updated_at,
+)
+# ... plus what a batch status row adds (schemas.JobState)
+JOB_STATE_COLUMNS = JOB_LIST_COLUMNS + (
+    models.PromptJob.error_message,
+    models.PromptJob.attached_to_job_id,
+    models.PromptJob.lane,
+    models.PromptJob.queue_wait_seconds,
+    models.PromptJob.stage_timings,
+)
+
+def encode_job_cursor(created_at: datetime, job_id: UUID) -> str:
+    raw = f"{created_at.isoformat()}|{job_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_job_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, job_id = raw.split("|")
+        return datetime.fromisoformat(created_at), UUID(job_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def _abandon(jobs: List[models.PromptJob], followers: List[models.PromptJob]):
+    """Redis side of failing jobs that never reached the broker; blocking."""
+    for job in jobs:
+        try:
+            # The enqueue may have gone through before the broker send failed
+            fair_queue.remove(job.id, job.user_id, job.lane)
+        except RedisError:
+            pass
+        if job.fingerprint:
+            result_cache.release_inflight(job.fingerprint, str(job.id))
+    for job in [*jobs, *followers]:
+        job_event_publisher.publish(job.id, "failed", status="failed", progress=job.progress, message=job.error_message)
 
 class PromptService:
-    async def submit_prompt(self, db: Session, prompt_data: schemas.PromptSubmission, user_id: UUID):
+    async def submit_prompt(self, db: AsyncSession, prompt_data: schemas.PromptSubmission, user_id: UUID):
+        # Turned away (429) before any database work when the user or the queue is over its limit
+        await run_in_threadpool(admission_control.admit, user_id)
+        dataset = None
+        if prompt_data.dataset_id is not None:
+            dataset = (await db.execute(
+                select(models.Dataset).where(
+                    models.Dataset.id == prompt_data.dataset_id,
+                    models.Dataset.user_id == user_id
+                )
+            )).scalar_one_or_none()
+            if not dataset:
+                raise HTTPException(status_code=404, detail="Dataset not found")
+            self._check_target(dataset, prompt_data.target_column)
+        
+        settings = prompt_data.model_dump(exclude={"prompt", "dataset_id"}, exclude_none=True)
+        return await self._submit(db, prompt_data.prompt, dataset, settings, user_id)
+    
+    async def submit_batch(self, db: AsyncSession, batch: schemas.PromptBatchSubmission, user_id: UUID):
+        """
+        Submit many prompts at once, with the same caching, attaching and
+        queueing as submit_prompt but batched: one dataset query, one insert
+        for every job, pipelined Redis calls, and send_task over one shared
+        producer for the broker (see FairQueue.dispatch_many). Either every
+        prompt is accepted or none is, and each counts against the user's
+        submission rate.
+        """
+        await run_in_threadpool(admission_control.admit, user_id, len(batch.prompts))
+        dataset_ids = {p.dataset_id for p in batch.prompts if p.dataset_id is not None}
+        datasets = {}
+        if dataset_ids:
+            datasets = {dataset.id: dataset for dataset in (await db.execute(
+                select(models.Dataset).where(
+                    models.Dataset.id.in_(dataset_ids),
+                    models.Dataset.user_id == user_id
+                )
+            )).scalars()}
+            missing = dataset_ids - datasets.keys()
+            if missing:
+                raise HTTPException(status_code=404, detail=f"Dataset not found: {', '.join(map(str, missing))}")
+        
+        jobs = []
+        for prompt_data in batch.prompts:
+            dataset = datasets.get(prompt_data.dataset_id)
+            if dataset is not None:
+                self._check_target(dataset, prompt_data.target_column)
+            settings = prompt_data.model_dump(exclude={"prompt", "dataset_id"}, exclude_none=True)
+            jobs.append(models.PromptJob(
+                id=uuid.uuid4(),
+                user_id=user_id,
+                dataset_id=dataset.id if dataset else None,
+                prompt=prompt_data.prompt,
+                status="pending",
+                settings=settings,
+                fingerprint=job_fingerprint(prompt_data.prompt, dataset.content_hash if dataset else None, settings),
+                lane=choose_lane(settings, dataset)
+            ))
+        messages = {}
+        
+        # Identical jobs already trained: serve copies of their results
+        cached = await run_in_threadpool(result_cache.lookup_many, [job.fingerprint for job in jobs])
+        sources = await self._completed_results(db, {UUID(job_id) for job_id in cached if job_id})
+        results = []
+        for job, cached_job_id in zip(jobs, cached):
+            source = sources.get(UUID(cached_job_id)) if cached_job_id else None
+            if source:
+                results.extend(complete_from(job, *source))
+                messages[job.id] = "Result served from cache"
+            elif cached_job_id:
+                await run_in_threadpool(result_cache.invalidate, job.fingerprint)
+        
+        # Keys are set client-side, so the jobs go out as one multi-row INSERT
+        db.add_all(jobs)
+        db.add_all(results)
+        await db.commit()
+        
+        # Identical jobs still training, including earlier ones in this batch: attach
+        pending = [job for job in jobs if job.id not in messages]
+        holders = await run_in_threadpool(
+            result_cache.claim_inflight_many, [(job.fingerprint, str(job.id)) for job in pending]
+        )
+        attached = []
+        for job, holder in zip(pending, holders):
+            if holder:
+                job.attached_to_job_id = UUID(holder)
+                attached.append(job)
+        if attached:
+            await db.commit()
+            for job in await self._settle_attached_many(db, attached):
+                messages[job.id] = "Attached to an identical running job"
+        
+        queued = [job for job in pending if job.id not in messages]
+        now = datetime.utcnow()
+        for job in queued:
+            job.queued_at = now
+            messages[job.id] = "Job submitted successfully"
+        await db.commit()
+        if queued:
+            await self._dispatch(db, queued, user_id)
+        
+        return schemas.JobBatchResponse(
+            jobs=[schemas.JobResponse(job_id=job.id, message=messages[job.id]) for job in jobs]
+        )
+    
+    def _check_target(self, dataset: models.Dataset, target_column: Optional[str]):
+        column_names = [column["name"] for column in dataset.columns]
+        if target_column and target_column not in column_names:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown target column: {target_column}"
+            )
+    
+    async def retrain_job(self, db: AsyncSession, job_id: UUID, request: schemas.RetrainRequest, user_id: UUID):
+        """
+        Queue a retrain of a completed job's model on a grown version of its
+        dataset. The worker updates the model incrementally unless the
+        appended rows have drifted (see MLTrainer.retrain_model).
+        """
+        await run_in_threadpool(admission_control.admit, user_id)
+        row = await self._completed_result(db, job_id)
+        if row is None or row[0].user_id != user_id:
+            raise HTTPException(status_code=404, detail="No completed job with this id")
+        base_job, base_result = row
+        if base_job.dataset_id is None or base_result.model_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Only models trained on an uploaded dataset can be retrained"
+            )
+        base_dataset = await db.get(models.Dataset, base_job.dataset_id)
+        dataset = (await db.execute(
+            select(models.Dataset).where(
+                models.Dataset.id == request.dataset_id,
+                models.Dataset.user_id == user_id
+            )
+        )).scalar_one_or_none()
+        if not dataset:
+            raise HTTPException(status_code=404, detail="Dataset not found")
+        missing = {c["name"] for c in base_dataset.columns} - {c["name"] for c in dataset.columns}
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Dataset is missing columns the model was trained on: {', '.join(sorted(missing))}"
+            )
+        if dataset.n_rows <= base_dataset.n_rows:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Dataset has no rows beyond the {base_dataset.n_rows} the model was trained on"
+            )
+        
+        settings = {**(base_job.settings or {}), "retrain_from_job_id": str(base_job.id)}
+        if request.drift_threshold is not None:
+            settings["drift_threshold"] = request.drift_threshold
+        return await self._submit(db, base_job.prompt, dataset, settings, user_id)
+    
+    async def _submit(self, db: AsyncSession, prompt: str, dataset: Optional[models.Dataset], settings: dict, user_id: UUID):
+        fingerprint = job_fingerprint(prompt, dataset.content_hash if dataset else None, settings)
+        
         # Create job record
         job = models.PromptJob(
             user_id=user_id,
-            prompt=prompt_data.prompt,
-            status="pending"
+            dataset_id=dataset.id if dataset else None,
+            prompt=prompt,
+            status="pending",
+            settings=settings,
+            fingerprint=fingerprint,
+            lane=choose_lane(settings, dataset)
         )
+        
+        # Identical job already trained: serve a copy of its result without queueing
+        cached_job_id = await run_in_threadpool(result_cache.lookup, fingerprint)
+        if cached_job_id:
+            source = await self._completed_result(db, UUID(cached_job_id))
+            if source:
+                db.add(job)
+                await db.flush()
+                db.add_all(complete_from(job, *source))
+                await db.commit()
+                return schemas.JobResponse(job_id=job.id, message="Result served from cache")
+            await run_in_threadpool(result_cache.invalidate, fingerprint)
+        
         db.add(job)
-        db.commit()
-        db.refresh(job)
+        await db.commit()
         
-        # Queue the ML task
-        celery_app.send_task(
-            "ml_tasks.process_prompt",
-            args=[str(job.id), prompt_data.prompt],
-            task_id=str(job.id)
-        )
+        # Identical job still training: attach to it instead of training twice
+        running_job_id = await run_in_threadpool(result_cache.claim_inflight, fingerprint, str(job.id))
+        if running_job_id:
+            job.attached_to_job_id = UUID(running_job_id)
+            await db.commit()
+            if await self._settle_attached(db, job):
+                return schemas.JobResponse(job_id=job.id, message="Attached to an identical running job")
+        
+        # Queue the ML task fairly (Redis and broker I/O stay off the event loop)
+        job.queued_at = datetime.utcnow()
+        await db.commit()
+        await self._dispatch(db, [job], user_id)
         
         return schemas.JobResponse(
             job_id=job.id,
             message="Job submitted successfully"
         )
     
-    def get_job_status(self, db: Session, job_id: str, user_id: UUID):
-        job = db.query(models.PromptJob).filter(
-            models.PromptJob.id == job_id,
-            models.PromptJob.user_id == user_id
-        ).first()
+    async def _dispatch(self, db: AsyncSession, jobs: List[models.PromptJob], user_id: UUID):
+        """
+        Hand committed jobs to the fair queue and the broker. If that fails,
+        the jobs are failed on the spot and their in-flight claims released:
+        no worker will ever run them, so identical submissions must not keep
+        attaching to them. Jobs already attached are failed with them.
+        """
+        try:
+            await run_in_threadpool(fair_queue.dispatch_many, [(job.id, user_id, job.lane) for job in jobs])
+            return
+        except (RedisError, KombuError) as e:
+            error = f"Could not queue the job: {e}"
+        for job in jobs:
+            job.status = "failed"
+            job.error_message = error
+        followers = (await db.execute(
+            select(models.PromptJob).where(
+                models.PromptJob.attached_to_job_id.in_([job.id for job in jobs]),
+                models.PromptJob.status == "pending"
+            )
+        )).scalars().all()
+        for follower in followers:
+            follower.status = "failed"
+            follower.error_message = f"Identical job {follower.attached_to_job_id} failed: {error}"
+        await db.commit()
+        await run_in_threadpool(_abandon, jobs, followers)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The job queue is unavailable; try again later"
+        )
+    
+    async def _completed_result(self, db: AsyncSession, job_id: UUID):
+        """(job, result) for a completed job, or None."""
+        row = (await db.execute(
+            select(models.PromptJob, models.JobResult)
+            .join(models.JobResult, models.JobResult.job_id == models.PromptJob.id)
+            .where(models.PromptJob.id == job_id, models.PromptJob.status == "completed")
+        )).first()
+        return tuple(row) if row else None
+    
+    async def _completed_results(self, db: AsyncSession, job_ids) -> dict:
+        """{job id: (job, result)} for those of `job_ids` that completed."""
+        if not job_ids:
+            return {}
+        rows = (await db.execute(
+            select(models.PromptJob, models.JobResult)
+            .join(models.JobResult, models.JobResult.job_id == models.PromptJob.id)
+            .where(models.PromptJob.id.in_(job_ids), models.PromptJob.status == "completed")
+        )).all()
+        return {job.id: (job, result) for job, result in rows}
+    
+    async def _settle_attached(self, db: AsyncSession, job: models.PromptJob) -> bool:
+        """
+        Re-check the job we attached to, in case it finished before the
+        attachment was committed. Returns False if `job` must train on its own.
+        """
+        primary = await db.get(models.PromptJob, job.attached_to_job_id)
+        if primary is None or primary.status == "failed":
+            job.attached_to_job_id = None
+            await db.commit()
+            return False
+        if primary.status == "completed":
+            source = await self._completed_result(db, primary.id)
+            if source and job.status == "pending":
+                db.add_all(complete_from(job, *source))
+                await db.commit()
+        return True
+    
+    async def _settle_attached_many(self, db: AsyncSession, jobs: List[models.PromptJob]) -> List[models.PromptJob]:
+        """_settle_attached for many jobs in two queries; returns the jobs that stay attached."""
+        primary_ids = {job.attached_to_job_id for job in jobs}
+        statuses = dict((await db.execute(
+            select(models.PromptJob.id, models.PromptJob.status).where(models.PromptJob.id.in_(primary_ids))
+        )).all())
+        sources = await self._completed_results(
+            db, {job_id for job_id, job_status in statuses.items() if job_status == "completed"}
+        )
+        settled = []
+        for job in jobs:
+            primary_status = statuses.get(job.attached_to_job_id)
+            if primary_status in (None, "failed"):
+                job.attached_to_job_id = None
+                continue
+            source = sources.get(job.attached_to_job_id)
+            if source:
+                db.add_all(complete_from(job, *source))
+            settled.append(job)
+        await db.commit()
+        return settled
+    
+    async def list_jobs(self, db: AsyncSession, user_id: UUID, cursor: Optional[str] = None, limit: int = 50):
+        """
+        One page of a user's jobs, newest first. Seeks past the cursor on the
+        (user_id, created_at, id) index, so every page costs the same no
+        matter how deep the client has paged.
+        """
+        query = select(*JOB_LIST_COLUMNS).where(models.PromptJob.user_id == user_id)
+        if cursor:
+            query = query.where(
+                tuple_(models.PromptJob.created_at, models.PromptJob.id) < decode_job_cursor(cursor)
+            )
+        rows = (await db.execute(
+            query.order_by(models.PromptJob.created_at.desc(), models.PromptJob.id.desc()).limit(limit + 1)
+        )).all()
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_job_cursor(rows[-1].created_at, rows[-1].id)
+        return schemas.JobPage(
+            jobs=[schemas.Job.model_validate(row) for row in rows],
+            next_cursor=next_cursor
+        )
+    
+    async def get_job_status(self, db: AsyncSession, job_id: UUID, user_id: UUID):
+        return (await db.execute(
+            select(models.PromptJob).where(
+                models.PromptJob.id == job_id,
+                models.PromptJob.user_id == user_id
+            )
+        )).scalar_one_or_none()
+    
+    async def get_job_states(self, db: AsyncSession, job_ids: List[UUID], user_id: UUID):
+        """Status of many jobs in one query, in the order asked; unknown ids are listed as missing."""
+        rows = (await db.execute(
+            select(*JOB_STATE_COLUMNS).where(
+                models.PromptJob.id.in_(set(job_ids)),
+                models.PromptJob.user_id == user_id
+            )
+        )).all()
+        found = {row.id: schemas.JobState.model_validate(row) for row in rows}
+        return schemas.JobStatusBatchResponse(
+            jobs=[found[job_id] for job_id in job_ids if job_id in found],
+            missing=[job_id for job_id in job_ids if job_id not in found]
+        )
+    
+    async def get_job_result(self, db: AsyncSession, job_id: UUID, user_id: UUID):
+        """(job, result) in one round trip; result is None until the job completes."""
+        row = (await db.execute(
+            select(models.PromptJob, models.JobResult)
+            .outerjoin(models.JobResult, models.JobResult.job_id == models.PromptJob.id)
+            .where(
+                models.PromptJob.id == job_id,
+                models.PromptJob.user_id == user_id
+            )
+        )).first()
+        return tuple(row) if row else (None, None)
+    
+    async def cancel_job(self, db: AsyncSession, job_id: UUID, user_id: UUID):
+        """
+        Cancel a job. Queued and attached jobs are cancelled at once; a running
+        job is flagged "cancelling" and its worker stops at the next check.
+        """
+        job = await self.get_job_status(db, job_id, user_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job not found")
+        if job.status in ("completed", "failed", "cancelled"):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job already {job.status}")
+        if job.status == "cancelling":
+            return job
+        
+        leader = job.attached_to_job_id is None
+        removed = not leader
+        if job.status == "pending" and leader:
+            try:
+                removed = await run_in_threadpool(fair_queue.remove, job.id, user_id, job.lane)
+            except RedisError:
+                # The worker sees "cancelling" when it picks the job up
+                removed = False
+        job.status = "cancelled" if removed else "cancelling"
+        await db.commit()
+        if not removed:
+            return job
+        
+        await run_in_threadpool(
+            job_event_publisher.publish, job.id, "cancelled",
+            status="cancelled", progress=job.progress, message="Cancelled"
+        )
+        if leader:
+            if job.fingerprint:
+                await run_in_threadpool(result_cache.release_inflight, job.fingerprint, str(job.id))
+            # Jobs that attached to this one now have to train on their own
+            followers = (await db.execute(
+                select(models.PromptJob).where(
+                    models.PromptJob.attached_to_job_id == job.id,
+                    models.PromptJob.status == "pending"
+                )
+            )).scalars().all()
+            for follower in followers:
+                follower.attached_to_job_id = None
+                follower.lane = follower.lane or job.lane
+                follower.queued_at = datetime.utcnow()
+            await db.commit()
+            for follower in followers:
+                await run_in_threadpool(fair_queue.dispatch, follower.id, follower.user_id, follower.lane)
         return job
     
-    def update_job_status(self, db: Session, job_id: str, status: str, progress: int = None, logs: list = None, error_message: str = None):
+    async def get_job_logs(self, db: AsyncSession, job_id: UUID, after_seq: Optional[int] = None, limit: int = 200):
+        """
+        Log lines with seq > after_seq in order, or the last `limit` lines
+        when after_seq is None. Served from the (job_id, seq) primary key.
+        """
+        query = select(models.JobLogEvent).where(models.JobLogEvent.job_id == job_id)
+        if after_seq is None:
+            rows = (await db.execute(
+                query.order_by(models.JobLogEvent.seq.desc()).limit(limit)
+            )).scalars().all()
+            return list(reversed(rows))
+        return (await db.execute(
+            query.where(models.JobLogEvent.seq > after_seq).order_by(models.JobLogEvent.seq).limit(limit)
+        )).scalars().all()
+    
+    def update_job_status(self, db: Session, job_id: str, status: str, progress: int = None, error_message: str = None):
         job = db.query(models.PromptJob).filter(models.PromptJob.id == job_id).first()
         if job:
             job.status = status
             if progress is not None:
                 job.progress = progress
-            if logs is not None:
-                job.logs = logs
             if error_message is not None:
                 job.error_message = error_message
             job.updated_at = datetime.utcnow()
@@ -0,0 +1,195 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+
+import redis
+
+from .. import models
+from ..ml_service.serving import predict_path, download_path
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "100000"))
+# How long a running job may hold its fingerprint before others stop attaching to it
+INFLIGHT_TTL = int(os.getenv("RESULT_CACHE_INFLIGHT_TTL_SECONDS", str(6 * 3600)))
+# Bump when training changes in a way that invalidates previously cached results
+CACHE_VERSION = 1
+
+KEY_PREFIX = "automl:result-cache"
+
+
+def normalize_prompt(prompt: str) -> str:
+    prompt = re.sub(r"\s+", " ", prompt.strip().lower())
+    return prompt.rstrip(".!?")
+
+
+def job_fingerprint(prompt: str, dataset_hash: Optional[str], settings: Optional[dict]) -> str:
+    """Identity of a training job: normalized prompt, dataset content and settings."""
+    payload = json.dumps(
+        {
+            "v": CACHE_VERSION,
+            "prompt": normalize_prompt(prompt),
+            "dataset": dataset_hash,
+            "settings": settings or {},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def clone_job_result(result: models.JobResult, job_id) -> models.JobResult:
+    """Copy a JobResult onto another job."""
+    skip = {"id", "job_id", "created_at"}
+    values = {
+        column.name: getattr(result, column.name)
+        for column in models.JobResult.__table__.columns
+        if column.name not in skip
+    }
+    if values.get("model_key"):
+        values["api_endpoint"] = predict_path(job_id)
+        values["download_url"] = download_path(job_id)
+    return models.JobResult(job_id=job_id, **values)
+
+
+def complete_from(job: models.PromptJob, source_job: models.PromptJob, result: models.JobResult) -> List:
+    """
+    Mark `job` completed with a copy of `source_job`'s result.
+    Returns the new rows (result and log line); the caller adds and commits them.
+    """
+    job.status = "completed"
+    job.progress = 100
+    job.result_summary = source_job.result_summary
+    return [
+        clone_job_result(result, job.id),
+        models.JobLogEvent(job_id=job.id, seq=1, message=f"Reused the result of identical job {source_job.id}"),
+    ]
+
+
+class ResultCache:
+    """
+    Redis-backed map from job fingerprint to the job that produced the result.
+
+    Entries expire after RESULT_CACHE_TTL; a sorted set ordered by last use
+    evicts the least recently used fingerprints beyond RESULT_CACHE_MAX_ENTRIES.
+    A separate in-flight key lets identical submissions attach to the job that
+    is already training. Redis outages degrade to cache misses.
+    """
+
+    def __init__(self, redis_url: str = REDIS_URL, ttl: int = RESULT_CACHE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._client = None
+
+    @property
+    def client(self) -> redis.Redis:
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.redis_url, socket_timeout=1, decode_responses=True)
+        return self._client
+
+    def _result_key(self, fingerprint: str) -> str:
+        return f"{KEY_PREFIX}:result:{fingerprint}"
+
+    def _inflight_key(self, fingerprint: str) -> str:
+        return f"{KEY_PREFIX}:inflight:{fingerprint}"
+
+    @property
+    def _index_key(self) -> str:
+        return f"{KEY_PREFIX}:index"
+
+    def lookup(self, fingerprint: str) -> Optional[str]:
+        """Job id of a cached result, refreshing its recency."""
+        try:
+            job_id = self.client.get(self._result_key(fingerprint))
+            if job_id:
+                self.client.zadd(self._index_key, {fingerprint: time.time()}, xx=True)
+            return job_id
+        except redis.RedisError as e:
+            logger.warning("Result cache lookup failed: %s", e)
+            return None
+
+    def lookup_many(self, fingerprints: List[str]) -> List[Optional[str]]:
+        """lookup for many fingerprints in two round trips."""
+        try:
+            job_ids = self.client.mget([self._result_key(fp) for fp in fingerprints])
+            hits = {fp: time.time() for fp, job_id in zip(fingerprints, job_ids) if job_id}
+            if hits:
+                self.client.zadd(self._index_key, hits, xx=True)
+            return job_ids
+        except redis.RedisError as e:
+            logger.warning("Result cache lookup failed: %s", e)
+            return [None] * len(fingerprints)
+
+    def store(self, fingerprint: str, job_id: str):
+        now = time.time()
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(self._result_key(fingerprint), str(job_id), ex=self.ttl)
+            pipe.zadd(self._index_key, {fingerprint: now})
+            # Forget index entries whose keys already expired
+            pipe.zremrangebyscore(self._index_key, "-inf", now - self.ttl)
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                evicted = self.client.zpopmin(self._index_key, size - self.max_entries)
+                if evicted:
+                    self.client.delete(*(self._result_key(fp) for fp, _ in evicted))
+        except redis.RedisError as e:
+            logger.warning("Result cache store failed: %s", e)
+
+    def invalidate(self, fingerprint: str):
+        try:
+            pipe = self.client.pipeline()
+            pipe.delete(self._result_key(fingerprint))
+            pipe.zrem(self._index_key, fingerprint)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Result cache invalidate failed: %s", e)
+
+    def claim_inflight(self, fingerprint: str, job_id: str) -> Optional[str]:
+        """
+        Register `job_id` as the job training this fingerprint.
+        Returns the id of the job that already holds it, or None if the claim succeeded.
+        """
+        key = self._inflight_key(fingerprint)
+        try:
+            if self.client.set(key, str(job_id), nx=True, ex=INFLIGHT_TTL):
+                return None
+            holder = self.client.get(key)
+            return holder if holder != str(job_id) else None
+        except redis.RedisError as e:
+            logger.warning("Result cache in-flight claim failed: %s", e)
+            return None
+
+    def claim_inflight_many(self, claims: List[Tuple[str, str]]) -> List[Optional[str]]:
+        """claim_inflight for many (fingerprint, job_id) pairs in one pipeline, in order."""
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            for fingerprint, job_id in claims:
+                pipe.set(self._inflight_key(fingerprint), str(job_id), nx=True, ex=INFLIGHT_TTL)
+                pipe.get(self._inflight_key(fingerprint))
+            replies = pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Result cache in-flight claim failed: %s", e)
+            return [None] * len(claims)
+        holders = []
+        for (_, job_id), claimed, holder in zip(claims, replies[::2], replies[1::2]):
+            holders.append(None if claimed or holder == str(job_id) else holder)
+        return holders
+
+    def release_inflight(self, fingerprint: str, job_id: str):
+        key = self._inflight_key(fingerprint)
+        try:
+            if self.client.get(key) == str(job_id):
+                self.client.delete(key)
+        except redis.RedisError as e:
+            logger.warning("Result cache in-flight release failed: %s", e)
+
+
+result_cache = ResultCache()
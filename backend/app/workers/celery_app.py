@@ -1,6 +1,17 @@
 from celery import Celery
+from celery.signals import worker_init, worker_process_shutdown
+import glob
 import os
 
+# Long-running training tasks are acknowledged only after they finish. An
+# unacknowledged task is redelivered after this many seconds, so it must
+# exceed the longest job.
+VISIBILITY_TIMEOUT = int(os.getenv("CELERY_VISIBILITY_TIMEOUT_SECONDS", str(12 * 3600)))
+# Jobs lost with their worker are found by heartbeat instead (see recovery.py)
+REAP_INTERVAL = float(os.getenv("JOB_REAP_INTERVAL_SECONDS", "30"))
+# The cluster status snapshot behind /api/celery/status and admission control
+CLUSTER_STATUS_INTERVAL = float(os.getenv("CLUSTER_STATUS_INTERVAL_SECONDS", "10"))
+
 # Configure Celery
 celery_app = Celery(
     "automl_worker",
@@ -17,10 +28,56 @@ celery_app.conf.update(
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
+    # Fair-queue tokens are sent to ml_small / ml_large explicitly; periodic
+    # tasks get a queue of their own so busy training workers can't delay them
     task_routes={
-        "ml_tasks.*": {"queue": "ml_queue"},
+        "ml_tasks.reap_stuck_jobs": {"queue": "maintenance"},
+        "ml_tasks.refresh_cluster_status": {"queue": "maintenance"},
+        "ml_tasks.*": {"queue": "ml_small"},
+    },
+    beat_schedule={
+        "reap-stuck-jobs": {
+            "task": "ml_tasks.reap_stuck_jobs",
+            "schedule": REAP_INTERVAL,
+            "options": {"expires": REAP_INTERVAL},
+        },
+        "refresh-cluster-status": {
+            "task": "ml_tasks.refresh_cluster_status",
+            "schedule": CLUSTER_STATUS_INTERVAL,
+            "options": {"expires": CLUSTER_STATUS_INTERVAL},
+        },
     },
+    # Take one task at a time so queued jobs stay in Redis, where the fair
+    # queue can reorder them, instead of in a busy worker's prefetch buffer
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    broker_transport_options={"visibility_timeout": VISIBILITY_TIMEOUT},
 )
 
+# Training metrics are observed where tasks run: the worker itself with
+# --pool=threads, as docker-compose runs the ML workers, or its prefork
+# children. Those need PROMETHEUS_MULTIPROC_DIR to share files there, and the
+# main worker process serves the aggregate on WORKER_METRICS_PORT.
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    from ..metrics import WORKER_METRICS_PORT, worker_registry
+    from prometheus_client import start_http_server
+
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        # Values left over from an earlier run would be summed into this one
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+    if WORKER_METRICS_PORT:
+        start_http_server(WORKER_METRICS_PORT, registry=worker_registry())
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
 if __name__ == "__main__":
     celery_app.start()
\ No newline at end of file
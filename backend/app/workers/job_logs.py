@@ -0,0 +1,51 @@
+from sqlalchemy import insert, func
+from sqlalchemy.orm import Session
+from datetime import datetime
+import os
+import time
+
+from .. import models
+
+# Lines buffered before a batched insert, and the longest a line may wait
+LOG_FLUSH_SIZE = int(os.getenv("JOB_LOG_FLUSH_SIZE", "50"))
+LOG_FLUSH_INTERVAL = float(os.getenv("JOB_LOG_FLUSH_INTERVAL_SECONDS", "2"))
+
+class JobLogBuffer:
+    """
+    Buffers a job's log lines and appends them to job_log_events in batches.
+    Each line is one new row, so writing n lines costs O(n) instead of
+    rewriting a growing JSON array on every append.
+    """
+
+    def __init__(self, db: Session, job_id, flush_size: int = LOG_FLUSH_SIZE, flush_interval: float = LOG_FLUSH_INTERVAL):
+        self.db = db
+        self.job_id = job_id
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._last_flush = time.monotonic()
+        # Continue after lines written by an earlier attempt of this job
+        self.seq = db.query(func.coalesce(func.max(models.JobLogEvent.seq), 0)).filter(
+            models.JobLogEvent.job_id == job_id
+        ).scalar()
+
+    def log(self, message: str, level: str = "info"):
+        self.seq += 1
+        self._rows.append({
+            "job_id": self.job_id,
+            "seq": self.seq,
+            "ts": datetime.utcnow(),
+            "level": level,
+            "message": message
+        })
+        if len(self._rows) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, commit: bool = True):
+        """Insert buffered lines in one statement; commits pending job updates along with them."""
+        if self._rows:
+            self.db.execute(insert(models.JobLogEvent), self._rows)
+            self._rows = []
+        self._last_flush = time.monotonic()
+        if commit:
+            self.db.commit()
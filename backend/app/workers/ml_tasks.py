@@ -1,109 +1,627 @@
-from celery import current_task
+from uuid import UUID
+from celery import chord
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import List, Optional
+import os
 import time
-import random
-import json
-from datetime import datetime
 
 from .celery_app import celery_app
 from ..database import SessionLocal
 from .. import models
-from ..ml_service.train import MLTrainer
+from ..metrics import QUEUE_WAIT, STAGE_DURATION, JOBS_FINISHED
+from ..ml_service.train import MLTrainer, format_size
+from ..ml_service.datasets import dataset_store
+from ..ml_service.artifacts import artifact_store
+from ..ml_service.serving import predict_path, download_path
+from ..ml_service.engine import CV_FOLDS, evaluate_fold, rank_folds
+from ..ml_service.tuning import JobCancelled
+from ..services.result_cache import result_cache, complete_from
+from ..services.job_events import job_event_publisher
+from ..services.fair_queue import fair_queue, lane_queue
+from ..services.cluster_status import cluster_status
+from .job_logs import JobLogBuffer
+from .recovery import (
+    JobCheckpoints, Heartbeat, clear_checkpoints, FANOUT_STALL_TIMEOUT, HEARTBEAT_TIMEOUT, MAX_ATTEMPTS
+)
 
-@celery_app.task(bind=True)
-def process_prompt(self, job_id: str, prompt: str):
+# Seconds between checks of a running job's status for a cancellation request
+CANCEL_CHECK_INTERVAL = float(os.getenv("JOB_CANCEL_CHECK_INTERVAL_SECONDS", "2"))
+# Jobs on datasets with at least this many rows search their candidates in
+# fold tasks spread over the cluster (0 = only when the job asks for it)
+DISTRIBUTED_MIN_ROWS = int(os.getenv("ML_DISTRIBUTED_MIN_ROWS", "250000"))
+# Retries of a failed fold task before its family is ranked as failed
+FOLD_MAX_RETRIES = int(os.getenv("ML_FOLD_MAX_RETRIES", "2"))
+
+@celery_app.task(bind=True, name="ml_tasks.run_next_job")
+def run_next_job(self, lane: str):
+    """
+    Fair-queue token: run whichever job the scheduler hands out next in `lane`.
+    """
+    job_id = fair_queue.claim(lane, self.request.id)
+    if job_id is None:
+        # The job this token was sent for was cancelled before a worker got to it
+        return {"status": "idle", "lane": lane}
+    try:
+        return run_job(self, job_id)
+    finally:
+        fair_queue.release(self.request.id)
+
+@celery_app.task(bind=True, name="ml_tasks.process_prompt")
+def process_prompt(self, job_id: str, prompt: Optional[str] = None):
+    """Train one specific job, bypassing the fair queue."""
+    return run_job(self, job_id)
+
+def run_job(task, job_id: str):
     """
     Process a user's ML prompt and train a model.
-    This is a placeholder implementation that simulates ML training.
+    Candidate models are searched in a process pool sized by MLTrainer, or,
+    for jobs run distributed, in fold tasks across the cluster (see fan_out).
+    Cancellation is cooperative: the trainer polls the job's status and
+    stops at the next stage or candidate boundary.
+    A job whose earlier attempt was interrupted (worker lost, node
+    preempted) resumes from that attempt's checkpoints.
     """
     db = SessionLocal()
+    log_buffer = None
+    trainer = None
     try:
         # Update job status to running
-        job = db.query(models.PromptJob).filter(models.PromptJob.id == job_id).first()
+        job = db.query(models.PromptJob).filter(models.PromptJob.id == UUID(job_id)).first()
         if not job:
             raise Exception(f"Job {job_id} not found")
+        if job.status in ("cancelled", "completed", "failed"):
+            # Redelivered after the job already finished
+            return {"status": job.status, "job_id": job_id}
+        if job.status == "cancelling":
+            raise JobCancelled()
         
+        log_buffer = JobLogBuffer(db, job.id)
+        job.attempts = (job.attempts or 0) + 1
+        if job.attempts > MAX_ATTEMPTS:
+            raise RuntimeError(f"Gave up after {MAX_ATTEMPTS} interrupted attempts")
         job.status = "running"
-        job.progress = 0
-        job.logs = ["Starting ML pipeline..."]
-        db.commit()
+        if job.started_at is None:
+            job.progress = 0
+            job.started_at = datetime.utcnow()
+            if job.queued_at:
+                job.queue_wait_seconds = (job.started_at - job.queued_at).total_seconds()
+                QUEUE_WAIT.labels(job.lane or "small").observe(job.queue_wait_seconds)
+                log_buffer.log(f"Started after {job.queue_wait_seconds:.1f}s in the {job.lane} queue")
+            log_buffer.log("Starting ML pipeline...")
+        else:
+            log_buffer.log(f"Resuming interrupted job (attempt {job.attempts} of {MAX_ATTEMPTS})", level="warning")
+        log_buffer.flush()
+        checkpoints = JobCheckpoints(db, job.id)
         
-        # Initialize ML trainer
-        trainer = MLTrainer(prompt)
+        # Initialize ML trainer under the job's budget
+        settings = job.settings or {}
+        dataset = dataset_store.open(job.dataset.content_hash) if job.dataset else None
+        trainer = make_trainer(db, job, checkpoints, dataset)
+        on_stage = stage_reporter(task, job, log_buffer)
         
-        # Simulate training process with progress updates
-        stages = [
-            ("Analyzing prompt...", 10),
-            ("Preparing dataset...", 25),
-            ("Feature engineering...", 40),
-            ("Training model...", 70),
-            ("Evaluating performance...", 90),
-            ("Finalizing results...", 100)
-        ]
+        with Heartbeat(job.id):
+            if settings.get("retrain_from_job_id"):
+                result_data = retrain(db, trainer, UUID(settings["retrain_from_job_id"]), settings, on_stage)
+            elif "fanout" in checkpoints or distribute(settings, dataset):
+                # Fold tasks take it from here; finish_distributed_job completes the job
+                fan_out(db, job, trainer, checkpoints, on_stage, log_buffer)
+                return {"status": "distributed", "job_id": job_id}
+            else:
+                # Train candidates in parallel and keep the best model
+                result_data = trainer.train_model(on_stage=on_stage)
         
-        logs = job.logs.copy()
+        complete_job(db, job, trainer, result_data, log_buffer, on_stage)
+        return {"status": "completed", "job_id": job_id}
         
-        for stage_name, progress in stages:
-            # Update progress
-            job.progress = progress
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] {stage_name}")
-            job.logs = logs
-            db.commit()
-            
-            # Simulate work
-            time.sleep(random.uniform(2, 5))
-            
-            # Update task state
-            current_task.update_state(
-                state="PROGRESS",
-                meta={"current": progress, "total": 100, "status": stage_name}
-            )
+    except JobCancelled:
+        db.rollback()
+        cancel_job(db, job_id, trainer, log_buffer)
+        return {"status": "cancelled", "job_id": job_id}
         
-        # Generate mock results
-        result_data = trainer.generate_mock_results()
+    except Exception as e:
+        # Handle errors
+        db.rollback()
+        fail_job(db, job_id, trainer, log_buffer, e)
+        raise e
         
-        # Create job result
-        job_result = models.JobResult(
-            job_id=job_id,
-            model_type=result_data["model_type"],
-            accuracy=result_data["accuracy"],
-            loss=result_data["loss"],
-            training_time=result_data["training_time"],
-            dataset_size=result_data["dataset_size"],
-            features_used=result_data["features_used"],
-            model_size=result_data["model_size"],
-            download_url=result_data.get("download_url"),
-            api_endpoint=result_data.get("api_endpoint"),
-            metrics=result_data["metrics"],
-            feature_importance=result_data.get("feature_importance"),
-            predictions_sample=result_data.get("predictions_sample")
-        )
+    finally:
+        db.close()
+
+def make_trainer(db: Session, job: models.PromptJob, checkpoints: JobCheckpoints, dataset=None) -> MLTrainer:
+    """Trainer for `job` under its budget, polling the job's status for cancellation."""
+    settings = job.settings or {}
+    last_check = time.monotonic()
+    
+    def cancelled():
+        nonlocal last_check
+        if time.monotonic() - last_check < CANCEL_CHECK_INTERVAL:
+            return False
+        last_check = time.monotonic()
+        return db.query(models.PromptJob.status).filter(models.PromptJob.id == job.id).scalar() == "cancelling"
+    
+    return MLTrainer(
+        job.prompt,
+        time_budget=settings.get("time_budget_seconds"),
+        cpu_budget=settings.get("cpu_budget_seconds"),
+        dataset=dataset,
+        target_column=settings.get("target_column"),
+        cancelled=cancelled,
+        checkpoints=checkpoints
+    )
+
+def stage_reporter(task, job: models.PromptJob, log_buffer: JobLogBuffer):
+    """on_stage callback for the trainer: progress to the job, its log, events and task state."""
+    def on_stage(stage_name, progress):
+        # Update progress; buffered log lines go out in the same commit
+        job.progress = progress
+        log_buffer.log(stage_name)
+        log_buffer.flush()
         
-        db.add(job_result)
+        job_event_publisher.publish(str(job.id), "stage", status="running", progress=progress, message=stage_name)
         
-        # Update job status to completed
-        job.status = "completed"
-        job.progress = 100
-        job.result_summary = f"Model trained successfully with {result_data['accuracy']:.1%} accuracy"
-        logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Training completed successfully!")
-        job.logs = logs
+        # Update task state
+        task.update_state(
+            state="PROGRESS",
+            meta={"current": progress, "total": 100, "status": stage_name}
+        )
+    return on_stage
+
+def complete_job(db: Session, job: models.PromptJob, trainer: MLTrainer, result_data: dict, log_buffer: JobLogBuffer, on_stage):
+    """Store the trained model and its JobResult, and finish `job` and the jobs attached to it."""
+    job_id = str(job.id)
+    on_stage("Finalizing results...", 100)
+    
+    if trainer.resumed:
+        log_buffer.log(f"Reused {len(trainer.resumed)} checkpoints from the interrupted attempt")
+    profile = result_data.get("data_profile")
+    if profile:
+        log_buffer.log(f"Profiled {len(profile['columns'])} columns over {profile['rows']} rows")
+        if profile["dropped"]:
+            log_buffer.log("Left out: " + ", ".join(f"{name} ({reason})" for name, reason in profile["dropped"].items()))
+    log_buffer.log(
+        f"Engineered {len(result_data['features_used'])} features"
+        + (" (reused from the feature cache)" if result_data["features_cached"] else "")
+    )
+    for candidate in result_data["candidates"]:
+        if "error" in candidate:
+            log_buffer.log(f"{candidate['family']} failed: {candidate['error']}", level="warning")
+        else:
+            log_buffer.log(f"{candidate['family']}: CV score {candidate['score']:.4f}")
+    tuning = result_data["tuning"]
+    if tuning["rungs"]:
+        log_buffer.log(
+            f"Tuned {result_data['model_type']}: "
+            f"{tuning['configs_evaluated']} configurations over {len(tuning['rungs'])} halving rungs"
+        )
+    importance = result_data.get("importance_info")
+    if importance and importance["method"] == "permutation":
+        log_buffer.log(
+            f"Permutation importance: {importance['features_scored']} of {importance['features']} features, "
+            f"{importance['repeats']} repeats on {importance['rows']} rows in {importance['seconds']:.2f}s"
+        )
+    retrained = result_data.get("retrain")
+    if retrained:
+        drift = sorted(retrained["drift"].items(), key=lambda item: -item[1])[:3]
+        if drift:
+            log_buffer.log("Drift (PSI): " + ", ".join(f"{name} {psi:.3f}" for name, psi in drift))
+        if retrained["mode"] == "incremental":
+            log_buffer.log(f"Updated the model with {retrained['rows_added']} appended rows ({retrained['strategy']})")
+        else:
+            log_buffer.log(f"Retrained from scratch: {retrained['reason']}", level="warning")
+    log_buffer.log(
+        f"Training took {result_data['training_time']:.1f}s "
+        f"of a {result_data['time_budget']:.0f}s budget ({result_data['cpu_time']:.1f}s CPU)"
+    )
+    
+    # Persist the fitted model so the prediction API can serve and download it;
+    # a compiled ensemble is what gets served, the estimator is kept for retraining
+    save_start = time.perf_counter()
+    estimator_key = None
+    serving = result_data.get("serving_bundle")
+    if serving is not None:
+        estimator_key, estimator_size = artifact_store.save(result_data["bundle"])
+        model_key, model_size = artifact_store.save(serving)
+        log_buffer.log(
+            f"Saved compiled model artifact ({format_size(model_size)}; "
+            f"estimator {format_size(estimator_size)})"
+        )
+    else:
+        model_key, model_size = artifact_store.save(result_data["bundle"])
+        log_buffer.log(f"Saved model artifact ({format_size(model_size)})")
+    trainer.stage_timings["artifact_save"] = time.perf_counter() - save_start
+    
+    # Create job result
+    job_result = models.JobResult(
+        job_id=job.id,
+        model_type=result_data["model_type"],
+        accuracy=result_data["accuracy"],
+        loss=result_data["loss"],
+        training_time=result_data["training_time"],
+        time_budget=result_data["time_budget"],
+        cpu_time=result_data["cpu_time"],
+        cpu_budget=result_data["cpu_budget"],
+        dataset_size=result_data["dataset_size"],
+        features_used=result_data["features_used"],
+        data_profile=result_data.get("data_profile"),
+        model_size=model_size,
+        download_url=download_path(job.id),
+        model_key=model_key,
+        estimator_key=estimator_key,
+        api_endpoint=predict_path(job.id),
+        metrics=result_data["metrics"],
+        feature_importance=result_data.get("feature_importance"),
+        predictions_sample=result_data.get("predictions_sample")
+    )
+    
+    db.add(job_result)
+    clear_checkpoints(db, job.id)
+    
+    # Update job status to completed
+    job.status = "completed"
+    job.progress = 100
+    record_stage_timings(job, trainer)
+    verb = "updated" if retrained and retrained["mode"] == "incremental" else "trained"
+    job.result_summary = f"{result_data['model_type']} {verb} successfully with {result_data['accuracy']:.1%} {'R²' if result_data['task_type'] == 'regression' else 'accuracy'}"
+    log_buffer.log("Training completed successfully!")
+    log_buffer.flush()
+    
+    job_event_publisher.publish(
+        job_id, "completed", status="completed", progress=100, message=job.result_summary
+    )
+    
+    # Publish the result for identical submissions, now and later
+    if job.fingerprint:
+        result_cache.store(job.fingerprint, job_id)
+        result_cache.release_inflight(job.fingerprint, job_id)
+    _settle_attached_jobs(db, job, job_result)
+    JOBS_FINISHED.labels("completed").inc()
+
+def cancel_job(db: Session, job_id: str, trainer: Optional[MLTrainer], log_buffer: Optional[JobLogBuffer]):
+    job = db.query(models.PromptJob).filter(models.PromptJob.id == UUID(job_id)).first()
+    job.status = "cancelled"
+    record_stage_timings(job, trainer)
+    clear_checkpoints(db, job.id)
+    log_buffer = log_buffer or JobLogBuffer(db, job.id)
+    log_buffer.log("Cancelled", level="warning")
+    log_buffer.flush()
+    job_event_publisher.publish(job_id, "cancelled", status="cancelled", progress=job.progress, message="Cancelled")
+    if job.fingerprint:
+        result_cache.release_inflight(job.fingerprint, job_id)
+    requeue_attached_jobs(db, job)
+    JOBS_FINISHED.labels("cancelled").inc()
+
+def fail_job(db: Session, job_id: str, trainer: Optional[MLTrainer], log_buffer: Optional[JobLogBuffer], error: Exception):
+    job = db.query(models.PromptJob).filter(models.PromptJob.id == UUID(job_id)).first()
+    if job:
+        job.status = "failed"
+        job.error_message = str(error)
+        record_stage_timings(job, trainer)
+        clear_checkpoints(db, job.id)
+        log_buffer = log_buffer or JobLogBuffer(db, job.id)
+        log_buffer.log(f"Error: {str(error)}", level="error")
+        log_buffer.flush()
+        job_event_publisher.publish(job_id, "failed", status="failed", progress=job.progress, message=str(error))
+        if job.fingerprint:
+            result_cache.release_inflight(job.fingerprint, job_id)
+        _settle_attached_jobs(db, job, None)
+    JOBS_FINISHED.labels("failed").inc()
+
+def distribute(settings: dict, dataset) -> bool:
+    """Whether to search a job's candidates in fold tasks across the cluster instead of one worker."""
+    if settings.get("distributed") is not None:
+        return bool(settings["distributed"])
+    return bool(DISTRIBUTED_MIN_ROWS) and dataset is not None and dataset.n_rows >= DISTRIBUTED_MIN_ROWS
+
+def fan_out(db: Session, job: models.PromptJob, trainer: MLTrainer, checkpoints: JobCheckpoints, on_stage, log_buffer: JobLogBuffer):
+    """
+    Distributed mode: prepare the data here, then cross-validate every
+    candidate family as one run_fold task per CV fold, in a chord whose
+    callback (finish_distributed_job) ranks them and finishes the job.
+    Fold tasks read the feature matrix and training row indices,
+    memory-mapped, from the artifact store rather than the broker message.
+    The matrix is stored under its feature cache key (dataset content hash,
+    target, transform config, fitted rows), so fan-outs on the same data
+    share one copy; the rest of the prepared data is the job's own. A
+    resumed job reuses both and dispatches only folds no earlier attempt
+    finished.
+    """
+    fanout = checkpoints.load("fanout")
+    if fanout is None:
+        cpu_start = time.process_time()
+        prepared = trainer.prepare_training(on_stage=on_stage)
+        shared = {"X": prepared["X"]}
+        data_key, data_size = artifact_store.save(shared, key=prepared["features_key"])
+        # Tagged with the job so no other job shares the content-addressed key
+        job_key, _ = artifact_store.save({
+            **{name: value for name, value in prepared.items() if name not in ("X", "X_test")},
+            "job_id": str(job.id),
+        })
+        log_buffer.log(f"Shared the training data with the cluster ({format_size(data_size)})")
+        fanout = {
+            "data_key": data_key,
+            "job_key": job_key,
+            "task_type": prepared["task_type"],
+            "families": prepared["families"],
+            "seed": trainer.random_state % 2**32,
+            "prep_cpu": time.process_time() - cpu_start,
+        }
+        checkpoints.save({"fanout": fanout})
+        if not artifact_store.exists(data_key):
+            # Another job on the same data finished and dropped it before this checkpoint referred to it
+            artifact_store.save(shared, key=data_key)
+        record_stage_timings(job, trainer)
+    else:
+        trainer.resumed.append("fanout")
+    
+    pending = [
+        (family, fold) for family in fanout["families"] for fold in range(CV_FOLDS)
+        if f"fold:{family}:{fold}" not in checkpoints
+    ]
+    fanout.update(attempt=job.attempts, dispatched_at=time.time())
+    checkpoints.save({"fanout": fanout})
+    on_stage(f"Training {len(fanout['families'])} models across the cluster ({len(pending)} fold tasks)...", 40)
+    
+    queue = lane_queue(job.lane or "small")
+    finish = finish_distributed_job.signature((str(job.id), job.attempts), queue=queue)
+    if not pending:
+        finish.apply_async(args=([],))
+        return
+    header = [
+        run_fold.signature(
+            (
+                str(job.id), job.attempts, fanout["data_key"], fanout["job_key"],
+                family, fold, fanout["task_type"], fanout["seed"],
+            ),
+            queue=queue
+        )
+        for family, fold in pending
+    ]
+    chord(header)(finish)
+
+@lru_cache(maxsize=2)
+def load_prepared(data_key: str, job_key: str) -> dict:
+    """
+    A distributed job's prepared data, memory-mapped once per worker
+    process: its own part, with the feature matrix it shares by `data_key`.
+    """
+    prepared = artifact_store.load(job_key)
+    X = artifact_store.load(data_key)["X"]
+    return {**prepared, "X": X, "X_test": X[prepared["test_rows"]]}
+
+@celery_app.task(bind=True, name="ml_tasks.run_fold", max_retries=FOLD_MAX_RETRIES)
+def run_fold(
+    self, job_id: str, attempt: int, data_key: str, job_key: str, family: str, fold: int, task_type: str, seed: int
+):
+    """
+    Score one candidate family on one CV fold of a distributed job. A fold
+    that keeps failing after its retries is reported as an error rather
+    than raised, so the chord still completes and ranks that family last.
+    """
+    db = SessionLocal()
+    key = f"fold:{family}:{fold}"
+    try:
+        status, attempts = db.query(models.PromptJob.status, models.PromptJob.attempts).filter(
+            models.PromptJob.id == UUID(job_id)
+        ).one()
+        if status != "running" or attempts != attempt:
+            # Cancelled, finished, or requeued with a chord of its own
+            return {"family": family, "fold": fold, "error": f"job is {status}"}
+        checkpoints = JobCheckpoints(db, UUID(job_id))
+        if key in checkpoints:
+            # Redelivered after the fold finished
+            return checkpoints.load(key)
+        with Heartbeat(UUID(job_id)):
+            prepared = load_prepared(data_key, job_key)
+            result = evaluate_fold(
+                prepared["X"], prepared["y"], family, task_type, fold, CV_FOLDS, seed, rows=prepared["train_rows"]
+            )
+        checkpoints.save({key: result})
+        return result
+    except Exception as e:
+        db.rollback()
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=2 ** self.request.retries)
+        return {"family": family, "fold": fold, "error": str(e)}
+    finally:
+        db.close()
+
+@celery_app.task(bind=True, name="ml_tasks.finish_distributed_job")
+def finish_distributed_job(self, fold_results: List[dict], job_id: str, attempt: int):
+    """
+    Chord callback of a distributed job: rank the candidates by their fold
+    scores, then tune, refit and evaluate the winner and store the result,
+    as run_job does for a job trained on one worker. Callbacks of chords
+    from an earlier, requeued attempt do nothing.
+    """
+    db = SessionLocal()
+    log_buffer = None
+    trainer = None
+    try:
+        job = db.query(models.PromptJob).filter(models.PromptJob.id == UUID(job_id)).first()
+        if job is None or job.attempts != attempt or job.status not in ("running", "cancelling"):
+            return {"status": "stale", "job_id": job_id}
+        if job.status == "cancelling":
+            raise JobCancelled()
         
-        db.commit()
+        log_buffer = JobLogBuffer(db, job.id)
+        checkpoints = JobCheckpoints(db, job.id)
+        fanout = checkpoints.load("fanout")
+        search_seconds = time.time() - fanout["dispatched_at"]
+        # Folds finished by earlier attempts are not in this chord's results
+        folds = {(r["family"], r["fold"]): r for r in fold_results}
+        for family in fanout["families"]:
+            for fold in range(CV_FOLDS):
+                saved = checkpoints.load(f"fold:{family}:{fold}")
+                if saved is not None:
+                    folds[(family, fold)] = saved
+        ranking = rank_folds(list(folds.values()), fanout["families"], CV_FOLDS)
+        log_buffer.log(f"Cross-validated {len(fanout['families'])} models across the cluster in {search_seconds:.1f}s")
         
-        return {"status": "completed", "job_id": job_id}
+        trainer = make_trainer(db, job, checkpoints)
+        on_stage = stage_reporter(self, job, log_buffer)
+        spent = (
+            (datetime.utcnow() - job.started_at).total_seconds(),
+            fanout["prep_cpu"] + sum(r.get("cpu_time", 0.0) for r in folds.values()),
+        )
+        with Heartbeat(job.id):
+            result_data = trainer.finish_training(load_prepared(fanout["data_key"], fanout["job_key"]), ranking, spent, on_stage)
+        trainer.stage_timings["training"] = search_seconds
         
+        complete_job(db, job, trainer, result_data, log_buffer, on_stage)
+        return {"status": "completed", "job_id": job_id}
+    
+    except JobCancelled:
+        db.rollback()
+        cancel_job(db, job_id, trainer, log_buffer)
+        return {"status": "cancelled", "job_id": job_id}
+    
     except Exception as e:
-        # Handle errors
-        job = db.query(models.PromptJob).filter(models.PromptJob.id == job_id).first()
-        if job:
-            job.status = "failed"
-            job.error_message = str(e)
-            logs = job.logs.copy() if job.logs else []
-            logs.append(f"[{datetime.now().strftime('%H:%M:%S')}] Error: {str(e)}")
-            job.logs = logs
-            db.commit()
-        
+        db.rollback()
+        fail_job(db, job_id, trainer, log_buffer, e)
         raise e
+    
+    finally:
+        db.close()
+
+@celery_app.task(name="ml_tasks.reap_stuck_jobs")
+def reap_stuck_jobs():
+    """
+    Periodic (celery beat): find jobs whose worker stopped heartbeating.
+    A lost running job is requeued to resume from its checkpoints, or failed
+    once it has used up its attempts; a lost cancelling job is cancelled.
+    Without this, a job on a preempted node stays "running" until the broker
+    redelivers its task, hours later. Distributed jobs get the longer
+    FANOUT_STALL_TIMEOUT, as their fold tasks may sit in the queue.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        last_beat = func.coalesce(models.PromptJob.heartbeat_at, models.PromptJob.started_at)
+        stuck = db.query(models.PromptJob).filter(
+            models.PromptJob.status.in_(("running", "cancelling")),
+            last_beat < now - timedelta(seconds=HEARTBEAT_TIMEOUT)
+        ).with_for_update(skip_locked=True).all()
+        fanned_out = {
+            job_id for (job_id,) in db.query(models.JobCheckpoint.job_id).filter(
+                models.JobCheckpoint.job_id.in_([job.id for job in stuck]),
+                models.JobCheckpoint.key == "fanout"
+            )
+        } if stuck else set()
+        stall_cutoff = now - timedelta(seconds=FANOUT_STALL_TIMEOUT)
+        stuck = [
+            job for job in stuck
+            if job.id not in fanned_out or (job.heartbeat_at or job.started_at) < stall_cutoff
+        ]
+        requeued, failed, cancelled = [], [], []
+        for job in stuck:
+            log_buffer = JobLogBuffer(db, job.id)
+            if job.status == "cancelling":
+                job.status = "cancelled"
+                clear_checkpoints(db, job.id)
+                cancelled.append(job)
+                log_buffer.log("Worker lost while cancelling; cancelled", level="warning")
+            elif (job.attempts or 0) >= MAX_ATTEMPTS:
+                job.status = "failed"
+                job.error_message = f"Worker lost {job.attempts} times; giving up"
+                clear_checkpoints(db, job.id)
+                failed.append(job)
+                log_buffer.log(job.error_message, level="error")
+            else:
+                job.status = "pending"
+                job.queued_at = datetime.utcnow()
+                requeued.append(job)
+                log_buffer.log("Worker lost; requeued to resume from its last checkpoint", level="warning")
+            log_buffer.flush(commit=False)
+        db.commit()
         
+        for job in requeued:
+            fair_queue.forget(job.id)
+            fair_queue.dispatch(job.id, job.user_id, job.lane or "small")
+            job_event_publisher.publish(job.id, "requeued", status="pending", progress=job.progress, message="Worker lost; resuming")
+        for job in cancelled:
+            job_event_publisher.publish(job.id, "cancelled", status="cancelled", progress=job.progress, message="Cancelled")
+            if job.fingerprint:
+                result_cache.release_inflight(job.fingerprint, str(job.id))
+            requeue_attached_jobs(db, job)
+        for job in failed:
+            job_event_publisher.publish(job.id, "failed", status="failed", progress=job.progress, message=job.error_message)
+            if job.fingerprint:
+                result_cache.release_inflight(job.fingerprint, str(job.id))
+            _settle_attached_jobs(db, job, None)
+        return {"requeued": len(requeued), "failed": len(failed), "cancelled": len(cancelled)}
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@celery_app.task(name="ml_tasks.refresh_cluster_status")
+def refresh_cluster_status():
+    """
+    Periodic (celery beat): snapshot worker stats and queue depths for
+    /api/celery/status and admission control (see services.cluster_status).
+    """
+    snapshot = cluster_status.refresh()
+    return {"celery_status": snapshot["celery_status"], "queue_depth": snapshot["queue_depth"]}
+
+def retrain(db: Session, trainer: MLTrainer, base_job_id: UUID, settings: dict, on_stage):
+    """Retrain the model of `base_job_id` on the job's grown dataset (see MLTrainer.retrain_model)."""
+    base_job, base_result = db.query(models.PromptJob, models.JobResult).join(
+        models.JobResult, models.JobResult.job_id == models.PromptJob.id
+    ).filter(models.PromptJob.id == base_job_id).one()
+    return trainer.retrain_model(
+        artifact_store.load(base_result.estimator_key or base_result.model_key, mmap=False),
+        base_rows=base_job.dataset.n_rows,
+        base_model_type=base_result.model_type,
+        base_score=base_result.accuracy,
+        drift_threshold=settings.get("drift_threshold"),
+        on_stage=on_stage,
+    )
+
+def record_stage_timings(job: models.PromptJob, trainer: Optional[MLTrainer]):
+    """
+    Store the stages that ran on the job and observe them; partial if
+    training stopped early. Stages recorded by another task of a
+    distributed job are kept.
+    """
+    if trainer is None or not trainer.stage_timings:
+        return
+    job.stage_timings = {
+        **(job.stage_timings or {}),
+        **{stage: round(seconds, 4) for stage, seconds in trainer.stage_timings.items()},
+    }
+    for stage, seconds in trainer.stage_timings.items():
+        STAGE_DURATION.labels(stage).observe(seconds)
+
+def requeue_attached_jobs(db: Session, job: models.PromptJob):
+    """Queue the jobs waiting on a cancelled `job` to train on their own."""
+    attached = db.query(models.PromptJob).filter(
+        models.PromptJob.attached_to_job_id == job.id,
+        models.PromptJob.status == "pending"
+    ).all()
+    for follower in attached:
+        follower.attached_to_job_id = None
+        follower.lane = follower.lane or job.lane
+        follower.queued_at = datetime.utcnow()
+    db.commit()
+    for follower in attached:
+        fair_queue.dispatch(follower.id, follower.user_id, follower.lane)
+
+def _settle_attached_jobs(db: Session, job: models.PromptJob, result):
+    """Complete (or fail) the jobs that attached to `job` instead of training themselves."""
+    attached = db.query(models.PromptJob).filter(
+        models.PromptJob.attached_to_job_id == job.id,
+        models.PromptJob.status == "pending"
+    ).all()
+    for follower in attached:
+        if result is not None:
+            db.add_all(complete_from(follower, job, result))
+        else:
+            follower.status = "failed"
+            follower.error_message = f"Identical job {job.id} failed: {job.error_message}"
+    db.commit()
+    for follower in attached:
+        job_event_publisher.publish(
+            follower.id, follower.status, status=follower.status, progress=follower.progress,
+            message=follower.result_summary or follower.error_message
+        )
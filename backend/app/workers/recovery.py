@@ -0,0 +1,154 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+import logging
+import os
+import pickle
+import threading
+
+from ..database import SessionLocal
+from .. import models
+from ..ml_service.artifacts import artifact_store
+from ..ml_service.serving import ModelBundle
+
+logger = logging.getLogger(__name__)
+
+# A running job stamps heartbeat_at this often; one silent for the timeout
+# is presumed lost with its worker and reaped (see ml_tasks.reap_stuck_jobs)
+HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL_SECONDS", "15"))
+HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT_SECONDS", "120"))
+# A distributed job only beats while one of its fold tasks runs, and those
+# may wait behind other work; it is reaped after this long without progress
+FANOUT_STALL_TIMEOUT = float(os.getenv("JOB_FANOUT_STALL_TIMEOUT_SECONDS", "1800"))
+# Runs of a job (first plus resumed) before it is failed instead of resumed again
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+class ArtifactRef(NamedTuple):
+    key: str
+
+class JobCheckpoints:
+    """
+    Stage results of one job that outlive its worker, so a redelivered or
+    requeued job resumes after the last finished stage (see
+    MLTrainer.train_model). Values are pickled into job_checkpoints; model
+    bundles go to the artifact store and only their key is kept there.
+    Every save commits at once.
+    """
+
+    def __init__(self, db: Session, job_id):
+        self.db = db
+        self.job_id = job_id
+        rows = db.query(models.JobCheckpoint.key, models.JobCheckpoint.data).filter(
+            models.JobCheckpoint.job_id == job_id
+        ).all()
+        self._saved: Dict[str, bytes] = {key: data for key, data in rows}
+
+    def __len__(self):
+        return len(self._saved)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._saved
+
+    def load(self, key: str) -> Optional[Any]:
+        data = self._saved.get(key)
+        if data is None:
+            return None
+        value = pickle.loads(data)
+        if isinstance(value, ArtifactRef):
+            return artifact_store.load(value.key, mmap=False)
+        return value
+
+    def save(self, values: Dict[str, Any]):
+        replaced = []
+        for key, value in values.items():
+            if isinstance(value, ModelBundle):
+                value = ArtifactRef(artifact_store.save(value)[0])
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if key in self._saved:
+                # A resumed stage saved again: its earlier artifact goes unless it is the same one
+                kept = _artifact_keys(key, data)
+                replaced.extend(k for k in _artifact_keys(key, self._saved[key]) if k not in kept)
+            self.db.merge(models.JobCheckpoint(job_id=self.job_id, key=key, data=data))
+            self._saved[key] = data
+        self.db.commit()
+        delete_unreferenced(self.db, replaced)
+
+def _artifact_keys(key: str, data: bytes) -> List[str]:
+    """Artifact store keys a checkpoint holds: a bundle's, or a distributed job's prepared data."""
+    value = pickle.loads(data)
+    if isinstance(value, ArtifactRef):
+        return [value.key]
+    if key == "fanout":
+        return [value["data_key"], value["job_key"]]
+    return []
+
+def delete_unreferenced(db: Session, keys: List[str]):
+    """
+    Delete the artifacts at `keys` that no job result or stored checkpoint
+    refers to (keys are shared by content, and fan-outs on the same data
+    share their feature matrix).
+    """
+    if not keys:
+        return
+    db.flush()
+    results = db.query(models.JobResult.model_key, models.JobResult.estimator_key).filter(
+        or_(models.JobResult.model_key.in_(keys), models.JobResult.estimator_key.in_(keys))
+    )
+    referenced = {key for row in results for key in row}
+    fanouts = db.query(models.JobCheckpoint.data).filter(models.JobCheckpoint.key == "fanout")
+    referenced.update(artifact for (data,) in fanouts for artifact in _artifact_keys("fanout", data))
+    for key in set(keys) - referenced:
+        artifact_store.delete(key)
+
+def clear_checkpoints(db: Session, job_id):
+    """
+    Drop a finished job's checkpoints, with the artifacts they hold (model
+    bundles, a distributed job's prepared data) unless a job result or
+    another job's checkpoint refers to them; the caller commits.
+    """
+    rows = db.query(models.JobCheckpoint.key, models.JobCheckpoint.data).filter(
+        models.JobCheckpoint.job_id == job_id
+    ).all()
+    db.query(models.JobCheckpoint).filter(models.JobCheckpoint.job_id == job_id).delete(synchronize_session=False)
+    delete_unreferenced(db, [artifact for key, data in rows for artifact in _artifact_keys(key, data)])
+
+class Heartbeat:
+    """
+    Stamps the job's heartbeat_at from a daemon thread, on a session of its
+    own, while the worker runs it. The thread dies with the worker process,
+    so a stale heartbeat means the job's worker was lost.
+    """
+
+    def __init__(self, job_id, interval: float = HEARTBEAT_INTERVAL):
+        self.job_id = job_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self.beat()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.beat()
+
+    def beat(self):
+        db = SessionLocal()
+        try:
+            db.query(models.PromptJob).filter(models.PromptJob.id == self.job_id).update(
+                {models.PromptJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False
+            )
+            db.commit()
+        except Exception as e:
+            # A missed beat is harmless unless they keep failing past the timeout
+            logger.warning("Job %s heartbeat failed: %s", self.job_id, e)
+            db.rollback()
+        finally:
+            db.close()
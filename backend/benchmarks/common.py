@@ -0,0 +1,66 @@
+"""Shared helpers for the benchmark scripts: summaries, JSON output and regression checks."""
+import json
+import platform
+import statistics
+import sys
+from typing import Dict, List, Optional
+
+
+def summarize(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    """Latency percentiles in milliseconds for samples given in seconds."""
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    quantile = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    summary = {
+        "count": len(samples),
+        "p50_ms": quantile(0.50),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "mean_ms": statistics.fmean(samples) * 1000,
+    }
+    if elapsed:
+        summary["per_second"] = len(samples) / elapsed
+    return summary
+
+
+def environment() -> Dict[str, str]:
+    return {"python": sys.version.split()[0], "platform": platform.platform()}
+
+
+def write_results(results: dict, path: Optional[str]):
+    print(json.dumps(results, indent=2))
+    if path:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def find_regressions(
+    results: dict, baseline: dict, tolerance: float, metric: str = "p95_ms", min_delta_ms: float = 1.0
+) -> List[str]:
+    """
+    Names of the entries whose `metric` grew by more than `tolerance` (0.2 =
+    20%) over the baseline. Both dicts map names to summaries as produced by
+    summarize(). Changes under `min_delta_ms` are treated as noise.
+    """
+    regressions = []
+    for name, summary in results.items():
+        previous = baseline.get(name)
+        if not isinstance(summary, dict) or not isinstance(previous, dict):
+            continue
+        before, after = previous.get(metric), summary.get(metric)
+        if before and after and after > before * (1 + tolerance) and after - before >= min_delta_ms:
+            regressions.append(f"{name}: {metric} {before:.1f} -> {after:.1f}")
+    return regressions
+
+
+def check_baseline(results: dict, baseline_path: Optional[str], tolerance: float, key: str) -> int:
+    """Compare `results[key]` with the same section of a baseline file; returns an exit code."""
+    if not baseline_path:
+        return 0
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results[key], baseline.get(key, {}), tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
@@ -0,0 +1,160 @@
+"""
+Compiled tree ensembles against the estimators they were compiled from.
+
+For each model (Random Forest and HistGradientBoosting, classifier and
+regressor) the script fits the estimator on synthetic data, compiles it
+(ml_service.compiled) and reports for both:
+
+  - predict latency at each --batch-sizes, as the prediction service calls
+    it (predict, plus predict_proba for classifiers), p50/p95/p99;
+  - memory: artifact bytes on disk, and how much a fresh interpreter's
+    resident set grows loading it fully into memory, imports included;
+  - load time: joblib.load in this process (mmap, as the model cache loads),
+    and in a fresh interpreter including its imports (--cold-repeats).
+
+It also checks that the compiled model predicts what the estimator does.
+
+    python -m benchmarks.compiled_trees --rows 20000 --output compiled.json
+    python -m benchmarks.compiled_trees --baseline compiled.json   # exit 1 on p95 regressions
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from .common import summarize, environment, write_results, check_baseline
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Load in a fresh interpreter: seconds including imports, and peak resident
+# set growth (VmHWM, so Linux only; ru_maxrss would carry over the parent's)
+COLD_LOAD = """
+import json, sys, time
+
+def peak_rss():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) * 1024 for line in f if line.startswith("VmHWM:"))
+
+before = peak_rss()
+start = time.perf_counter()
+import joblib
+model = joblib.load({path!r}, mmap_mode={mmap!r})
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "rss_bytes": peak_rss() - before, "sklearn": "sklearn" in sys.modules}}))
+"""
+
+
+def cold_load(path: str, mmap) -> dict:
+    completed = subprocess.run(
+        [sys.executable, "-c", COLD_LOAD.format(path=path, mmap=mmap)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": BACKEND_DIR},
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def serve(model, X, classifier: bool):
+    model.predict(X)
+    if classifier:
+        model.predict_proba(X)
+
+
+def latency(model, X, batch_size: int, repeats: int, classifier: bool) -> dict:
+    samples = []
+    for i in range(repeats):
+        start = (i * batch_size) % max(len(X) - batch_size, 1)
+        batch = X[start:start + batch_size]
+        t = time.perf_counter()
+        serve(model, batch, classifier)
+        samples.append(time.perf_counter() - t)
+    return summarize(samples)
+
+
+def load_stats(obj, workdir: str, name: str, repeats: int, cold_repeats: int) -> dict:
+    import joblib
+
+    path = os.path.join(workdir, f"{name}.joblib")
+    joblib.dump(obj, path)
+    warm = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        joblib.load(path, mmap_mode="r")
+        warm.append(time.perf_counter() - t)
+    cold = [cold_load(path, "r") for _ in range(cold_repeats)]
+    # Resident growth of a full (not memory-mapped) load, imports included
+    loaded = cold_load(path, None)
+    return {
+        "artifact_bytes": os.path.getsize(path),
+        "loaded_rss_bytes": loaded["rss_bytes"],
+        "load_warm_ms": round(statistics.median(warm) * 1000, 3),
+        "load_cold_ms": round(statistics.median(c["seconds"] for c in cold) * 1000, 1) if cold else None,
+        "cold_load_imports_sklearn": loaded["sklearn"],
+    }
+
+
+def run(args) -> dict:
+    from sklearn.datasets import make_classification, make_regression
+    from app.ml_service.compiled import compile_model
+    from app.ml_service.engine import build_estimator
+
+    workdir = tempfile.mkdtemp(prefix="bench-compiled-")
+    n_test = max(args.batch_sizes) * 2
+    X_c, y_c = make_classification(args.rows + n_test, args.features, n_informative=args.features // 2,
+                                   n_classes=3, random_state=args.seed)
+    X_r, y_r = make_regression(args.rows + n_test, args.features, n_informative=args.features // 2,
+                               noise=10, random_state=args.seed)
+    data = {"classification": (X_c, y_c), "regression": (X_r, y_r)}
+
+    results = {"environment": environment(), "config": vars(args), "models": {}, "latency": {}}
+    for family in ("Random Forest", "Gradient Boosting"):
+        for task_type, (X, y) in data.items():
+            classifier = task_type == "classification"
+            name = f"{family.lower().replace(' ', '_')}_{task_type}"
+            estimator = build_estimator(family, task_type, {}, args.seed).fit(X[:args.rows], y[:args.rows])
+            compiled = compile_model(estimator)
+            X_test = X[args.rows:]
+
+            expected, got = estimator.predict(X_test), compiled.predict(X_test)
+            agreement = float((expected == got).mean()) if classifier else float(np.abs(expected - got).max())
+            results["models"][name] = {
+                "trees": compiled.n_trees,
+                "nodes": compiled.n_nodes,
+                "depth": compiled.depth,
+                "agreement" if classifier else "max_abs_diff": agreement,
+                "estimator": load_stats(estimator, workdir, f"{name}-estimator", args.repeats, args.cold_repeats),
+                "compiled": load_stats(compiled, workdir, f"{name}-compiled", args.repeats, args.cold_repeats),
+            }
+            for batch_size in args.batch_sizes:
+                for label, model in (("estimator", estimator), ("compiled", compiled)):
+                    results["latency"][f"{name}/{label}/batch_{batch_size}"] = latency(
+                        model, X_test, batch_size, args.repeats, classifier
+                    )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="training rows per model")
+    parser.add_argument("--features", type=int, default=20)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 64, 1024])
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--cold-repeats", type=int, default=3, help="fresh interpreters per load measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    write_results(results, args.output)
+    raise SystemExit(check_baseline(results, args.baseline, args.tolerance, "latency"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Compare the old and new database paths of an authenticated read under concurrency.
+
+"sync" reproduces the previous handler shape: an `async def` route that runs a
+blocking SQLAlchemy Session query on the event loop. "async" is the current
+path through the asyncpg/aiosqlite session. Both routes load a user by primary
+key from the same database; requests are driven in-process through one ASGI
+app, so the numbers are per worker.
+
+    python -m benchmarks.db_path --requests 5000 --concurrency 64 --output db_path.json
+
+Point DATABASE_URL at Postgres to see the effect of network round trips; on
+SQLite the gap is much smaller because queries never wait on I/O. Keep
+--concurrency within the sync pool (DB_POOL_SIZE + DB_MAX_OVERFLOW): past it the
+sync path blocks the event loop waiting for a connection that can only be
+returned by the loop, and stalls until the pool timeout.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+from uuid import UUID
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'db_path.db')}")
+
+import httpx
+from fastapi import Depends, FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal, async_engine, engine, get_async_db, get_db
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/sync/users/{user_id}")
+    async def sync_user(user_id: str, db: Session = Depends(get_db)):
+        user = db.query(models.User).filter(models.User.id == UUID(user_id)).first()
+        return {"id": str(user.id)}
+
+    @app.get("/async/users/{user_id}")
+    async def async_user(user_id: str, db: AsyncSession = Depends(get_async_db)):
+        user = await db.get(models.User, UUID(user_id))
+        return {"id": str(user.id)}
+
+    return app
+
+
+def seed_users(n: int):
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        users = [
+            models.User(email=f"bench-{i}-{time.time_ns()}@example.com", name="bench", hashed_password="x")
+            for i in range(n)
+        ]
+        db.add_all(users)
+        db.commit()
+        return [str(user.id) for user in users]
+    finally:
+        db.close()
+
+
+async def drive(app: FastAPI, path: str, user_ids, requests: int, concurrency: int):
+    latencies = []
+    counter = iter(range(requests))
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                response = await client.get(f"/{path}/users/{user_ids[i % len(user_ids)]}")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    quantile = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "requests_per_second": requests / elapsed,
+        "p50_ms": quantile(0.50),
+        "p95_ms": quantile(0.95),
+        "p99_ms": quantile(0.99),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+    }
+
+
+async def main(args):
+    user_ids = seed_users(args.users)
+    app = build_app()
+    results = {"database": os.environ["DATABASE_URL"].split("@")[-1]}
+    for path in ("sync", "async"):
+        # Warm pools and caches before measuring
+        await drive(app, path, user_ids, min(200, args.requests), args.concurrency)
+        results[path] = await drive(app, path, user_ids, args.requests, args.concurrency)
+    results["speedup"] = results["async"]["requests_per_second"] / results["sync"]["requests_per_second"]
+    await async_engine.dispose()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(main(args))
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
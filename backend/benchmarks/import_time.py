@@ -0,0 +1,158 @@
+"""
+Import-time budget for API and worker cold starts.
+
+Each target is imported in fresh interpreters. The script reports the median
+wall time over --repeats and, from one more run under `python -X importtime`,
+the packages that cost the most. The budgets cover what the app adds on top
+of its framework floor (FastAPI, SQLAlchemy, Celery, redis, ... imported on
+their own, measured the same way), so they hold across machines of different
+speed. The script exits 1 when a target goes over its budget, or when it
+loads a module that must stay lazy: ML libraries in the API, and
+pandas/scikit-learn in the worker, which imports them per job.
+
+    python -m benchmarks.import_time --repeats 7 --output import_time.json
+    python -m benchmarks.import_time --api-budget 0.25 --worker-budget 0.2
+
+tests/test_import_time.py runs the lazy-import check under pytest; the
+timing budgets stay here, as wall time on shared CI machines is too noisy to
+fail a build on.
+
+Importing must not touch the database (the schema is migrated by Alembic),
+so DATABASE_URL only needs to name a driver that is installed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from collections import Counter
+from typing import Dict, List
+
+from .common import environment, write_results
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# "framework": third-party packages the process needs whatever the app does
+TARGETS = {
+    "api": {
+        "modules": ["app.main"],
+        "framework": [
+            "fastapi", "pydantic", "sqlalchemy.orm", "sqlalchemy.ext.asyncio", "celery.app.base", "redis",
+            "redis.asyncio", "jwt", "passlib.context", "prometheus_client",
+        ],
+        "budget": float(os.getenv("IMPORT_BUDGET_API_SECONDS", "0.5")),
+        "lazy": ["numpy", "pandas", "sklearn", "scipy", "pyarrow", "joblib", "matplotlib", "seaborn"],
+    },
+    "worker": {
+        # What `celery -A app.workers.celery_app worker` imports before taking tasks
+        "modules": ["app.workers.celery_app", "app.workers.ml_tasks"],
+        "framework": ["celery.app.base", "sqlalchemy.orm", "redis", "prometheus_client", "numpy"],
+        "budget": float(os.getenv("IMPORT_BUDGET_WORKER_SECONDS", "0.3")),
+        "lazy": ["pandas", "sklearn", "scipy", "pyarrow", "matplotlib", "seaborn"],
+    },
+}
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+print(json.dumps({{"seconds": time.perf_counter() - start, "modules": sorted(sys.modules)}}))
+"""
+
+
+def import_once(modules: List[str], env: Dict[str, str], profile: bool = False) -> dict:
+    """
+    Import `modules` in a fresh interpreter: wall time and loaded modules,
+    plus self time per top-level package when profiling (which slows it).
+    """
+    flags = ["-X", "importtime"] if profile else []
+    completed = subprocess.run(
+        [sys.executable, *flags, "-c", PROBE.format(modules=modules)],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{completed.stderr[-2000:]}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    packages = Counter()
+    for line in completed.stderr.splitlines() if profile else []:
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    result["packages"] = packages
+    return result
+
+
+def probe_env(workdir: str) -> Dict[str, str]:
+    """Environment for the probes: the backend importable, and a SQLite DATABASE_URL in `workdir` unless one is set."""
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'import_time.db')}")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    return env
+
+
+def eager_imports(target: dict, loaded) -> List[str]:
+    """The target's lazy modules among `loaded`."""
+    return [module for module in target["lazy"] if module in loaded]
+
+
+def median_import(modules: List[str], repeats: int, env: Dict[str, str]) -> float:
+    return statistics.median(import_once(modules, env)["seconds"] for _ in range(repeats))
+
+
+def run_target(target: dict, repeats: int, env: Dict[str, str]) -> dict:
+    floor = median_import(target["framework"], repeats, env)
+    seconds = median_import(target["modules"], repeats, env)
+    profile = import_once(target["modules"], env, profile=True)
+    eager = eager_imports(target, set(profile["modules"]))
+    return {
+        "modules": target["modules"],
+        "median_s": round(seconds, 4),
+        "framework_floor_s": round(floor, 4),
+        "app_overhead_s": round(seconds - floor, 4),
+        "budget_s": target["budget"],
+        "heaviest_packages_ms": {
+            package: round(us / 1000, 1) for package, us in profile["packages"].most_common(10)
+        },
+        "loaded_eagerly": eager,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--api-budget", type=float, default=TARGETS["api"]["budget"])
+    parser.add_argument("--worker-budget", type=float, default=TARGETS["worker"]["budget"])
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    budgets = {"api": args.api_budget, "worker": args.worker_budget}
+
+    results = {"environment": environment(), "targets": {}}
+    failures = []
+    for name in args.targets:
+        target = {**TARGETS[name], "budget": budgets[name]}
+        with tempfile.TemporaryDirectory(prefix="import-time-") as workdir:
+            result = run_target(target, args.repeats, probe_env(workdir))
+        results["targets"][name] = result
+        if result["app_overhead_s"] > result["budget_s"]:
+            failures.append(
+                f"{name}: import took {result['median_s']:.3f}s, {result['app_overhead_s']:.3f}s over the "
+                f"framework floor; budget {result['budget_s']:.3f}s"
+            )
+        if result["loaded_eagerly"]:
+            failures.append(f"{name}: imports {', '.join(result['loaded_eagerly'])} at startup")
+    write_results(results, args.output)
+
+    for failure in failures:
+        print(f"OVER BUDGET {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
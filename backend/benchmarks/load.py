@@ -0,0 +1,257 @@
+"""
+End-to-end load benchmark of the API with a realistic request mix.
+
+Virtual users sign up, then loop over a weighted mix of login, profile,
+prompt submission, status polling, job listing and result fetches until the
+run ends. Requests go in-process through `app.main:app`, so no server is
+needed; numbers are per API worker.
+
+    python -m benchmarks.load --users 20 --duration 60 --output load.json
+    python -m benchmarks.load --baseline load.json   # exit 1 on p95 regressions
+
+Stand-ins, all local:
+  - DATABASE_URL defaults to a fresh SQLite file; point it at a local Postgres
+    for production-like numbers.
+  - --redis fake keeps the result cache, fair queue and job events in
+    fakeredis (pip install fakeredis lupa); --redis url uses REDIS_URL.
+  - --celery eager runs submitted jobs on an in-process thread pool
+    (--job-workers); --celery broker only publishes them, for a worker
+    started separately against the same Redis.
+
+Training is shortened (--job-budget, ML_SYNTHETIC_ROWS) so jobs complete
+within a run and the mix includes real result fetches.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench-db-'), 'load.db')}")
+os.environ.setdefault("DATASET_DIR", tempfile.mkdtemp(prefix="bench-datasets-"))
+os.environ.setdefault("ARTIFACT_DIR", tempfile.mkdtemp(prefix="bench-artifacts-"))
+os.environ.setdefault("FEATURE_DIR", tempfile.mkdtemp(prefix="bench-features-"))
+os.environ.setdefault("ML_SYNTHETIC_ROWS", "1000")
+os.environ.setdefault("ML_MAX_WORKERS_PER_JOB", "2")
+
+from .common import summarize, environment, write_results, check_baseline
+
+# Relative weight of each operation in a virtual user's loop
+MIX = {
+    "login": 5,
+    "profile": 5,
+    "submit_prompt": 10,
+    "status": 40,
+    "list_jobs": 25,
+    "result": 15,
+}
+
+PROMPTS = [
+    "classify customer churn from usage data",
+    "predict house prices from listing features",
+    "detect fraudulent transactions",
+    "forecast weekly sales per store",
+    "identify spam emails",
+    "estimate delivery time for orders",
+]
+
+
+def install_fake_redis():
+    import fakeredis
+    from app.services.admission import admission_control
+    from app.services.cluster_status import cluster_status
+    from app.services.fair_queue import fair_queue
+    from app.services.job_events import job_event_publisher
+    from app.services.result_cache import result_cache
+
+    server = fakeredis.FakeServer()
+    result_cache._client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    fair_queue._client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    admission_control._client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    cluster_status._client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    job_event_publisher._client = fakeredis.FakeRedis(server=server)
+
+
+def install_local_worker(n_workers: int):
+    """Run tasks sent to Celery on a local thread pool instead of the broker."""
+    from concurrent.futures import ThreadPoolExecutor
+    from importlib import import_module
+    from app.workers.celery_app import celery_app
+
+    # Imported for its side effect: defining the tasks registers them on celery_app
+    import_module("app.workers.ml_tasks")
+    executor = ThreadPoolExecutor(max_workers=n_workers, thread_name_prefix="bench-worker")
+    celery_app.conf.update(task_always_eager=True, result_backend="cache+memory://")
+
+    def run_task(name, args, kwargs):
+        result = celery_app.tasks[name].apply(args=args, kwargs=kwargs)
+        if result.failed():
+            print(f"{name} failed: {result.result!r}", file=sys.stderr)
+
+    def send_task(name, args=None, kwargs=None, **options):
+        executor.submit(run_task, name, args, kwargs)
+
+    celery_app.send_task = send_task
+    return executor
+
+
+class VirtualUser:
+    def __init__(self, client, stats, jobs, rng: random.Random, repeat_ratio: float, max_jobs: int):
+        self.client = client
+        self.stats = stats
+        self.jobs = jobs
+        self.rng = rng
+        self.repeat_ratio = repeat_ratio
+        self.max_jobs = max_jobs
+        self.email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+        self.headers = {}
+        self.job_ids = []
+        self.submitted_at = {}
+        self.completed = set()
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception:
+            self.stats[name]["errors"] += 1
+            return None
+        self.stats[name]["samples"].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.stats[name]["errors"] += 1
+        return response
+
+    async def signup(self):
+        response = await self.request(
+            "signup", "POST", "/api/auth/signup",
+            json={"email": self.email, "name": "Bench", "password": "bench-password"}
+        )
+        self.headers = {"Authorization": f"Bearer {response.json()['token']}"}
+
+    async def step(self):
+        operation = self.rng.choices(list(MIX), weights=list(MIX.values()))[0]
+        if operation in ("status", "result") and not self.job_ids:
+            operation = "submit_prompt"
+        elif operation == "submit_prompt" and len(self.job_ids) >= self.max_jobs:
+            operation = "status"
+        await getattr(self, operation)()
+
+    async def login(self):
+        await self.request("login", "POST", "/api/auth/login", json={"email": self.email, "password": "bench-password"})
+
+    async def profile(self):
+        await self.request("profile", "GET", "/api/auth/profile", headers=self.headers)
+
+    async def submit_prompt(self):
+        prompt = self.rng.choice(PROMPTS)
+        if self.rng.random() >= self.repeat_ratio:
+            # Unique prompts miss the result cache and train
+            prompt = f"{prompt} #{uuid.uuid4().hex[:8]}"
+        response = await self.request("submit_prompt", "POST", "/api/prompt", json={"prompt": prompt}, headers=self.headers)
+        if response is not None and response.status_code == 200:
+            job_id = response.json()["job_id"]
+            self.job_ids.append(job_id)
+            self.submitted_at[job_id] = time.perf_counter()
+            self.jobs["submitted"] += 1
+
+    async def status(self):
+        job_id = self.rng.choice(self.job_ids)
+        response = await self.request("status", "GET", f"/api/status/{job_id}", params={"limit": 20}, headers=self.headers)
+        if response is not None and response.status_code == 200 and job_id not in self.completed:
+            if response.json()["status"] == "completed":
+                self.completed.add(job_id)
+                self.jobs["completed"] += 1
+                self.jobs["turnaround"].append(time.perf_counter() - self.submitted_at[job_id])
+
+    async def list_jobs(self):
+        await self.request("list_jobs", "GET", "/api/jobs", params={"limit": 20}, headers=self.headers)
+
+    async def result(self):
+        if not self.completed:
+            return await self.status()
+        job_id = self.rng.choice(sorted(self.completed))
+        await self.request("result", "GET", f"/api/result/{job_id}", headers=self.headers)
+
+
+async def run(args):
+    import httpx
+    from app import models
+    from app.database import engine, async_engine
+    from app.main import app
+
+    models.Base.metadata.create_all(bind=engine)
+    stats = defaultdict(lambda: {"samples": [], "errors": 0})
+    jobs = {"submitted": 0, "completed": 0, "turnaround": []}
+    rng = random.Random(args.seed)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        users = [
+            VirtualUser(client, stats, jobs, random.Random(rng.random()), args.repeat_ratio, args.max_jobs_per_user)
+            for _ in range(args.users)
+        ]
+        await asyncio.gather(*(user.signup() for user in users))
+
+        deadline = time.perf_counter() + args.duration
+        started = time.perf_counter()
+
+        async def loop(user):
+            while time.perf_counter() < deadline:
+                await user.step()
+                if args.think_ms:
+                    await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+        await asyncio.gather(*(loop(user) for user in users))
+        elapsed = time.perf_counter() - started
+
+    await async_engine.dispose()
+    endpoints = {}
+    for name, entry in sorted(stats.items()):
+        endpoints[name] = {**summarize(entry["samples"], elapsed), "errors": entry["errors"]}
+    total = sum(len(entry["samples"]) for entry in stats.values())
+    return {
+        "database": os.environ["DATABASE_URL"].split("@")[-1],
+        "config": vars(args),
+        "environment": environment(),
+        "elapsed_seconds": elapsed,
+        "requests_per_second": total / elapsed,
+        "endpoints": endpoints,
+        "jobs": {
+            "submitted": jobs["submitted"],
+            "completed": jobs["completed"],
+            "turnaround": summarize(jobs["turnaround"]),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after signup")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--repeat-ratio", type=float, default=0.3, help="share of prompts repeated verbatim (result cache hits)")
+    parser.add_argument("--max-jobs-per-user", type=int, default=3, help="after this many submissions a user only polls and fetches")
+    parser.add_argument("--job-budget", type=float, default=15, help="training time budget per job, seconds")
+    parser.add_argument("--redis", choices=("fake", "url"), default="fake")
+    parser.add_argument("--celery", choices=("eager", "broker"), default="eager")
+    parser.add_argument("--job-workers", type=int, default=1, help="local worker threads with --celery eager")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    os.environ.setdefault("ML_DEFAULT_TIME_BUDGET", str(args.job_budget))
+    if args.redis == "fake":
+        install_fake_redis()
+    executor = install_local_worker(args.job_workers) if args.celery == "eager" else None
+
+    results = asyncio.run(run(args))
+    if executor:
+        executor.shutdown(wait=False, cancel_futures=True)
+    write_results(results, args.output)
+    raise SystemExit(check_baseline(results, args.baseline, args.tolerance, "endpoints"))
@@ -0,0 +1,123 @@
+"""
+Micro-benchmarks of the MLTrainer hot paths, stage by stage.
+
+Each stage runs --repeats times on the same synthetic data and is reported
+as p50/p95/p99 wall time. Stages:
+
+  analyze_prompt, route_prompts_1k, prepare_synthetic, ingest_csv, load_columnar,
+  feature_engineering, feature_engineering_cached, model_search, halving,
+  final_fit, evaluate, predict_row, predict_batch
+
+    python -m benchmarks.trainer_stages --rows 5000 --output stages.json
+    python -m benchmarks.trainer_stages --baseline stages.json   # exit 1 on p95 regressions
+
+model_search and halving start process pools, so they include pool start-up
+cost just as a job does. Keep --budget fixed between runs you compare.
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+
+os.environ.setdefault("FEATURE_DIR", tempfile.mkdtemp(prefix="bench-features-"))
+
+from .common import summarize, environment, write_results, check_baseline
+
+PROMPT = "classify customer churn from usage data"
+
+
+def timed(samples: dict, name: str, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    samples.setdefault(name, []).append(time.perf_counter() - start)
+    return result
+
+
+def write_csv(path: str, n_rows: int, rng: np.random.Generator):
+    numeric = rng.normal(size=(n_rows, 8))
+    plans = rng.choice(["basic", "plus", "pro"], size=n_rows)
+    churn = np.where(numeric[:, 0] + numeric[:, 1] > 0, "yes", "no")
+    with open(path, "w") as f:
+        f.write(",".join([f"x{i}" for i in range(8)] + ["plan", "churn"]) + "\n")
+        for row, plan, label in zip(numeric, plans, churn):
+            f.write(",".join(f"{v:.5f}" for v in row) + f",{plan},{label}\n")
+
+
+def run(args) -> dict:
+    from sklearn.model_selection import train_test_split
+    from app.ml_service import train
+    from app.ml_service.datasets import DatasetStore
+    from app.ml_service.intent import IntentRouter, load_catalog
+    from app.ml_service.engine import ModelSearch, build_estimator
+    from app.ml_service.serving import ModelBundle
+    from app.ml_service.tuning import Budget, SuccessiveHalvingSearch
+
+    train.SYNTHETIC_ROWS = args.rows
+    rng = np.random.default_rng(args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-stages-")
+    csv_path = os.path.join(workdir, "churn.csv")
+    write_csv(csv_path, args.rows, rng)
+    samples = {}
+
+    for repeat in range(args.repeats):
+        trainer = train.MLTrainer(PROMPT, max_workers=args.workers, time_budget=args.budget)
+        seed = trainer.random_state % 2**32
+        timed(samples, "analyze_prompt", trainer.analyze_prompt)
+        # A fresh router each time so every prompt misses the memo cache
+        prompts = [f"{PROMPT} for region {i}" for i in range(1000)]
+        timed(samples, "route_prompts_1k", IntentRouter(load_catalog()).route_many, prompts)
+        X, y, features, task_type = timed(samples, "prepare_synthetic", trainer.prepare_dataset, "classification")
+
+        # A fresh store each time so ingest really converts
+        store = DatasetStore(os.path.join(workdir, f"store-{repeat}"))
+        content_hash = hashlib.sha256(f"{repeat}".encode()).hexdigest()
+        dataset = timed(samples, "ingest_csv", store.ingest, csv_path, "csv", content_hash)
+        columnar = train.MLTrainer(PROMPT, dataset=dataset, target_column="churn")
+        table, _, _ = timed(samples, "load_columnar", columnar.load_dataset, "classification")
+        timed(samples, "feature_engineering", columnar.engineer_features, table)
+        timed(samples, "feature_engineering_cached", columnar.engineer_features, table)
+
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed, stratify=y)
+        budget = Budget(args.budget)
+        search = ModelSearch(task_type, max_workers=args.workers, random_state=seed, budget=budget)
+        ranking = timed(samples, "model_search", search.run, X_train, y_train, trainer.model_types)
+        best = ranking[0]
+
+        tuner = SuccessiveHalvingSearch(best["family"], task_type, Budget(args.budget), max_workers=args.workers, random_state=seed)
+        best = timed(samples, "halving", tuner.run, X_train, y_train, baseline=best)
+
+        model = build_estimator(best["family"], task_type, best["params"], seed)
+        timed(samples, "final_fit", model.fit, X_train, y_train)
+        timed(samples, "evaluate", trainer.evaluate, model, task_type, X_test, y_test, features)
+
+        bundle = ModelBundle(model, trainer.feature_transform, task_type)
+        rows = [dict(zip(features, row)) for row in X_test[:256]]
+        for _ in range(20):
+            timed(samples, "predict_row", bundle.predict, rows[:1])
+        timed(samples, "predict_batch", bundle.predict, rows)
+
+    return {
+        "config": vars(args),
+        "environment": environment(),
+        "stages": {name: summarize(values) for name, values in samples.items()},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--budget", type=float, default=30, help="time budget for model_search and halving, seconds")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: per ML_MAX_WORKERS_PER_JOB)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="earlier results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    results = run(args)
+    write_results(results, args.output)
+    raise SystemExit(check_baseline(results, args.baseline, args.tolerance, "stages"))
@@ -0,0 +1,81 @@
+"""initial schema
+
+The schema the API built with create_all() at startup before Alembic took
+over. A database it created has exactly these tables: mark it as migrated
+with `alembic stamp 0001`, then `alembic upgrade head` adds the rest.
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 12:48:25.724016
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('users',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('email', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('hashed_password', sa.String(), nullable=False),
+    sa.Column('avatar', sa.String(), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+
+    op.create_table('prompt_jobs',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('prompt', sa.Text(), nullable=False),
+    sa.Column('status', sa.String(), nullable=True),
+    sa.Column('progress', sa.Integer(), nullable=True),
+    sa.Column('logs', sa.JSON(), nullable=True),
+    sa.Column('error_message', sa.Text(), nullable=True),
+    sa.Column('result_summary', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('job_results',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('job_id', sa.UUID(), nullable=False),
+    sa.Column('model_type', sa.String(), nullable=False),
+    sa.Column('accuracy', sa.Float(), nullable=False),
+    sa.Column('loss', sa.Float(), nullable=False),
+    sa.Column('training_time', sa.Float(), nullable=False),
+    sa.Column('dataset_size', sa.Integer(), nullable=False),
+    sa.Column('features_used', sa.JSON(), nullable=True),
+    sa.Column('model_size', sa.String(), nullable=False),
+    sa.Column('download_url', sa.String(), nullable=True),
+    sa.Column('api_endpoint', sa.String(), nullable=True),
+    sa.Column('metrics', sa.JSON(), nullable=False),
+    sa.Column('feature_importance', sa.JSON(), nullable=True),
+    sa.Column('predictions_sample', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['job_id'], ['prompt_jobs.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_results')
+    op.drop_table('prompt_jobs')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
@@ -0,0 +1,149 @@
+"""datasets and job tracking
+
+Uploaded datasets, and what the job pipeline records on jobs (dataset,
+settings, fingerprint, lane, queue and worker timings) and on results
+(budgets, artifact key). model_size becomes bytes: the strings the baseline
+stored ("123MB") are parsed, and any that do not parse become 0.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 21:10:44.512830
+
+"""
+import re
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+prompt_jobs = sa.table(
+    'prompt_jobs',
+    sa.column('created_at', sa.DateTime()),
+    sa.column('updated_at', sa.DateTime()),
+)
+job_results = sa.table(
+    'job_results',
+    sa.column('id', sa.UUID()),
+    sa.column('model_size', sa.String()),
+    sa.column('model_size_bytes', sa.BigInteger()),
+)
+
+
+def _size_bytes(text) -> int:
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?B)\s*", text or "", re.IGNORECASE)
+    return int(float(match[1]) * SIZE_UNITS[match[2].upper()]) if match else 0
+
+
+def upgrade() -> None:
+    op.create_table('datasets',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('filename', sa.String(), nullable=True),
+    sa.Column('format', sa.String(), nullable=False),
+    sa.Column('size_bytes', sa.BigInteger(), nullable=False),
+    sa.Column('n_rows', sa.BigInteger(), nullable=False),
+    sa.Column('columns', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('datasets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_datasets_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_datasets_user_id'), ['user_id'], unique=False)
+
+    # Keyset pagination orders by created_at, which create_all() left nullable
+    op.execute(prompt_jobs.update().where(prompt_jobs.c.created_at.is_(None)).values(
+        created_at=sa.func.coalesce(prompt_jobs.c.updated_at, datetime.utcnow())
+    ))
+    with op.batch_alter_table('prompt_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('dataset_id', sa.UUID(), nullable=True))
+        batch_op.add_column(sa.Column('settings', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('fingerprint', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('attached_to_job_id', sa.UUID(), nullable=True))
+        batch_op.add_column(sa.Column('lane', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('queued_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('started_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('queue_wait_seconds', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('stage_timings', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+        batch_op.create_foreign_key('fk_prompt_jobs_dataset_id_datasets', 'datasets', ['dataset_id'], ['id'])
+        batch_op.create_foreign_key(
+            'fk_prompt_jobs_attached_to_job_id_prompt_jobs', 'prompt_jobs', ['attached_to_job_id'], ['id']
+        )
+        batch_op.create_index(batch_op.f('ix_prompt_jobs_attached_to_job_id'), ['attached_to_job_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_prompt_jobs_fingerprint'), ['fingerprint'], unique=False)
+        batch_op.create_index('ix_prompt_jobs_user_created_id', ['user_id', 'created_at', 'id'], unique=False)
+
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('time_budget', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('cpu_time', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('cpu_budget', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('model_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('model_size_bytes', sa.BigInteger(), nullable=True))
+    connection = op.get_bind()
+    for row in connection.execute(sa.select(job_results.c.id, job_results.c.model_size)).all():
+        connection.execute(job_results.update().where(job_results.c.id == row.id).values(
+            model_size_bytes=_size_bytes(row.model_size)
+        ))
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.drop_column('model_size')
+        batch_op.alter_column(
+            'model_size_bytes', new_column_name='model_size', existing_type=sa.BigInteger(), nullable=False
+        )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.alter_column('model_size', new_column_name='model_size_bytes', existing_type=sa.BigInteger())
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('model_size', sa.String(), nullable=True))
+    connection = op.get_bind()
+    for row in connection.execute(sa.select(job_results.c.id, job_results.c.model_size_bytes)).all():
+        connection.execute(job_results.update().where(job_results.c.id == row.id).values(
+            model_size=f"{row.model_size_bytes / 1024 ** 2:.1f}MB"
+        ))
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.alter_column('model_size', existing_type=sa.String(), nullable=False)
+        batch_op.drop_column('model_size_bytes')
+        batch_op.drop_column('model_key')
+        batch_op.drop_column('cpu_budget')
+        batch_op.drop_column('cpu_time')
+        batch_op.drop_column('time_budget')
+
+    with op.batch_alter_table('prompt_jobs', schema=None) as batch_op:
+        batch_op.drop_index('ix_prompt_jobs_user_created_id')
+        batch_op.drop_index(batch_op.f('ix_prompt_jobs_fingerprint'))
+        batch_op.drop_index(batch_op.f('ix_prompt_jobs_attached_to_job_id'))
+        batch_op.drop_constraint('fk_prompt_jobs_attached_to_job_id_prompt_jobs', type_='foreignkey')
+        batch_op.drop_constraint('fk_prompt_jobs_dataset_id_datasets', type_='foreignkey')
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('attempts')
+        batch_op.drop_column('stage_timings')
+        batch_op.drop_column('queue_wait_seconds')
+        batch_op.drop_column('started_at')
+        batch_op.drop_column('queued_at')
+        batch_op.drop_column('lane')
+        batch_op.drop_column('attached_to_job_id')
+        batch_op.drop_column('fingerprint')
+        batch_op.drop_column('settings')
+        batch_op.drop_column('dataset_id')
+
+    with op.batch_alter_table('datasets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_datasets_user_id'))
+        batch_op.drop_index(batch_op.f('ix_datasets_content_hash'))
+
+    op.drop_table('datasets')
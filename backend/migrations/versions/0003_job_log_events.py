@@ -0,0 +1,82 @@
+"""job log events
+
+Job logs move from the prompt_jobs.logs JSON list to one row per line. The
+lines already stored are copied over, timestamped with the job's last
+update since the list kept no times of its own.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 21:12:03.147992
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+prompt_jobs = sa.table(
+    'prompt_jobs',
+    sa.column('id', sa.UUID()),
+    sa.column('logs', sa.JSON()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('updated_at', sa.DateTime()),
+)
+job_log_events = sa.table(
+    'job_log_events',
+    sa.column('job_id', sa.UUID()),
+    sa.column('seq', sa.Integer()),
+    sa.column('ts', sa.DateTime()),
+    sa.column('level', sa.String()),
+    sa.column('message', sa.Text()),
+)
+
+
+def upgrade() -> None:
+    op.create_table('job_log_events',
+    sa.Column('job_id', sa.UUID(), nullable=False),
+    sa.Column('seq', sa.Integer(), autoincrement=False, nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.Column('level', sa.String(length=16), nullable=False),
+    sa.Column('message', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['prompt_jobs.id'], ),
+    sa.PrimaryKeyConstraint('job_id', 'seq')
+    )
+    connection = op.get_bind()
+    jobs = connection.execute(sa.select(prompt_jobs).where(prompt_jobs.c.logs.isnot(None))).all()
+    for job in jobs:
+        ts = job.updated_at or job.created_at or datetime.utcnow()
+        events = [
+            {"job_id": job.id, "seq": seq, "ts": ts, "level": "error" if "] Error: " in line else "info",
+             "message": str(line)}
+            for seq, line in enumerate(job.logs or [], start=1)
+        ]
+        if events:
+            connection.execute(job_log_events.insert(), events)
+
+    with op.batch_alter_table('prompt_jobs', schema=None) as batch_op:
+        batch_op.drop_column('logs')
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('prompt_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('logs', sa.JSON(), nullable=True))
+    connection = op.get_bind()
+    logs = {}
+    events = connection.execute(
+        sa.select(job_log_events.c.job_id, job_log_events.c.message)
+        .order_by(job_log_events.c.job_id, job_log_events.c.seq)
+    )
+    for event in events:
+        logs.setdefault(event.job_id, []).append(event.message)
+    for job_id, lines in logs.items():
+        connection.execute(prompt_jobs.update().where(prompt_jobs.c.id == job_id).values(logs=lines))
+
+    op.drop_table('job_log_events')
@@ -0,0 +1,33 @@
+"""job checkpoints
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 21:13:27.630415
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('job_checkpoints',
+    sa.Column('job_id', sa.UUID(), nullable=False),
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['prompt_jobs.id'], ),
+    sa.PrimaryKeyConstraint('job_id', 'key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_checkpoints')
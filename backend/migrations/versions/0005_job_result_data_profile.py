@@ -0,0 +1,28 @@
+"""job result data profile
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 14:05:12.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_profile', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.drop_column('data_profile')
@@ -0,0 +1,28 @@
+"""job result estimator key
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 16:42:37.905113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('estimator_key', sa.String(length=64), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('job_results', schema=None) as batch_op:
+        batch_op.drop_column('estimator_key')
@@ -0,0 +1,52 @@
+"""Compiled ensembles predict what the estimators they were compiled from do, missing values included."""
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification, make_regression
+from sklearn.ensemble import (
+    HistGradientBoostingClassifier, HistGradientBoostingRegressor,
+    RandomForestClassifier, RandomForestRegressor,
+)
+
+from app.ml_service.compiled import CompiledEnsembleClassifier, compile_model
+
+# (estimator, target): "binary" and "multiclass" classification, "regression",
+# and "counts" for the log link of Poisson boosting
+CASES = [
+    (RandomForestClassifier(n_estimators=20, random_state=0), "binary"),
+    (RandomForestClassifier(n_estimators=20, random_state=0), "multiclass"),
+    (RandomForestRegressor(n_estimators=20, random_state=0), "regression"),
+    (HistGradientBoostingClassifier(max_iter=30, random_state=0), "binary"),
+    (HistGradientBoostingClassifier(max_iter=30, random_state=0), "multiclass"),
+    (HistGradientBoostingRegressor(max_iter=30, random_state=0), "regression"),
+    (HistGradientBoostingRegressor(loss="poisson", max_iter=30, random_state=0), "counts"),
+]
+
+
+def dataset(target: str, n_rows: int = 1200, missing: float = 0.1):
+    if target in ("binary", "multiclass"):
+        X, y = make_classification(
+            n_rows, 8, n_informative=5, n_classes=2 if target == "binary" else 3, random_state=0
+        )
+    else:
+        X, y = make_regression(n_rows, 8, n_informative=5, noise=5, random_state=0)
+        if target == "counts":
+            y = np.random.default_rng(0).poisson(np.exp(y / y.std()))
+    X[np.random.default_rng(1).random(X.shape) < missing] = np.nan
+    return X, y
+
+
+@pytest.mark.parametrize("estimator, target", CASES, ids=[f"{type(e).__name__}-{target}" for e, target in CASES])
+def test_compiled_matches_estimator(estimator, target):
+    X, y = dataset(target)
+    estimator.fit(X[:1000], y[:1000])
+    compiled = compile_model(estimator)
+    assert compiled is not None
+
+    # A row missing every feature takes the missing-value branch at every split
+    X_test = np.vstack([X[1000:], np.full((1, X.shape[1]), np.nan)])
+    if hasattr(estimator, "predict_proba"):
+        assert isinstance(compiled, CompiledEnsembleClassifier)
+        np.testing.assert_allclose(compiled.predict_proba(X_test), estimator.predict_proba(X_test), atol=1e-9)
+        np.testing.assert_array_equal(compiled.predict(X_test), estimator.predict(X_test))
+    else:
+        np.testing.assert_allclose(compiled.predict(X_test), estimator.predict(X_test), rtol=1e-9, atol=1e-9)
@@ -0,0 +1,11 @@
+"""ML libraries stay out of API and worker startup (see benchmarks.import_time for the timing budgets)."""
+import pytest
+
+from benchmarks import import_time
+
+
+@pytest.mark.parametrize("name", sorted(import_time.TARGETS))
+def test_heavy_modules_stay_lazy(name, tmp_path):
+    target = import_time.TARGETS[name]
+    loaded = import_time.import_once(target["modules"], import_time.probe_env(str(tmp_path)))["modules"]
+    assert import_time.eager_imports(target, set(loaded)) == []